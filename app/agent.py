@@ -1,12 +1,22 @@
-from typing import Dict, Any
-from anthropic import Anthropic
-import json
+from typing import Dict, Any, List, Union
+import time
 from app.config import settings
+from app.metrics import llm_requests, llm_time_to_first_token, record_llm_usage, span
+from app.progressive import Chunk, chunk_prompt, chunk_weeks_data, generate_progressive
+from app.ratelimit import acquire_llm_slot
+from app.token_budget import (
+    chunk_output_tokens,
+    plan_generation,
+    program_output_tokens,
+    record_output,
+    week_output_tokens,
+)
 from app.models import (
     WorkoutRequest,
     TrainingProgram,
     RaceDistance,
     FitnessLevel,
+    loads_json,
 )
 
 
@@ -14,8 +24,77 @@ class TriathlonWorkoutAgent:
     """AI Agent for generating structured triathlon training programs."""
     
     def __init__(self):
+        # Imported here so the SDK is only loaded when this provider is used.
+        from anthropic import Anthropic
+
         self.client = Anthropic(api_key=settings.anthropic_api_key)
         self.model = "claude-3-5-sonnet-20241022"
+
+    def _message_params(self, *, system: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        return dict(
+            model=self.model,
+            max_tokens=max_tokens,
+            temperature=0.7,
+            system=system,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+        )
+
+    def _complete(
+        self, *, system: str, prompt: str, max_tokens: int, call: str, progress=None
+    ) -> str:
+        """Send one message request, recording latency, TTFT and token usage.
+
+        With a ``progress`` handle (app.generation.GenerationJob), streamed text
+        is reported to it and a cancelled job closes the stream mid-response.
+        """
+        kwargs = self._message_params(system=system, prompt=prompt, max_tokens=max_tokens)
+        if progress is not None:
+            progress.check()
+        acquire_llm_slot("anthropic")
+        if progress is not None:
+            progress.check()  # cancelled during the rate-limit wait
+        with span("provider_call", provider="anthropic", call=call) as current:
+            try:
+                if settings.llm_streaming:
+                    with self.client.messages.stream(**kwargs) as stream:
+                        first_token = True
+                        for text in stream.text_stream:
+                            if first_token:
+                                llm_time_to_first_token.observe(
+                                    current.elapsed, provider="anthropic", call=call
+                                )
+                                first_token = False
+                            if progress is not None:
+                                progress.check()
+                                progress.text(text)
+                        response = stream.get_final_message()
+                else:
+                    response = self.client.messages.create(**kwargs)
+            except Exception:
+                cancelled = progress is not None and progress.cancelled
+                llm_requests.inc(
+                    provider="anthropic", call=call, outcome="cancelled" if cancelled else "error"
+                )
+                raise
+            usage = getattr(response, "usage", None)
+            input_tokens = getattr(usage, "input_tokens", None)
+            output_tokens = getattr(usage, "output_tokens", None)
+            record_llm_usage("anthropic", call, input_tokens, output_tokens)
+            record_output(
+                "anthropic", response.content[0].text, output_tokens,
+                truncated=response.stop_reason == "max_tokens",
+            )
+            llm_requests.inc(
+                provider="anthropic", call=call, outcome=response.stop_reason or "unknown"
+            )
+            current.set(
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                stop_reason=response.stop_reason,
+            )
+        return response.content[0].text
     
     def _build_system_prompt(self) -> str:
         """Build the system prompt for the workout generation agent."""
@@ -114,7 +193,7 @@ Generate a complete training program with the following structure:
 ```
 
 **Guidelines**:
-1. Create 5-7 workouts per week based on available hours
+1. Create 5-6 workouts per week based on available hours, with at least one rest day
 2. Include all three sports (swim, bike, run) appropriately distributed
 3. Each workout must have specific intervals with intensity zones
 4. Include at least one brick workout per week (bike followed by run)
@@ -124,34 +203,42 @@ Generate a complete training program with the following structure:
         
         return prompt
     
-    def generate_program(self, request: WorkoutRequest) -> TrainingProgram:
-        """Generate a complete training program using Claude."""
+    def generate_program(self, request: WorkoutRequest, progress=None) -> TrainingProgram:
+        """Generate a complete training program using Claude.
+
+        Programs whose predicted output does not fit one response
+        (app.token_budget) are generated a few weeks per call (app.progressive).
+        """
+        plan = plan_generation(request, "anthropic")
+        if plan.mode == "progressive":
+            return generate_progressive(request, plan, self.generate_weeks, "anthropic", progress)
         
-        system_prompt = self._build_system_prompt()
-        user_prompt = self._build_user_prompt(request)
+        with span("prompt_build", provider="anthropic"):
+            system_prompt = self._build_system_prompt()
+            user_prompt = self._build_user_prompt(request)
         
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=8000,
-            temperature=0.7,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": user_prompt}
-            ]
+        content = self._complete(
+            system=system_prompt, prompt=user_prompt, max_tokens=plan.max_output_tokens,
+            call="program", progress=progress,
         )
-        
+        return self._parse_program(content)
+
+    def _parse_program(self, content: str) -> TrainingProgram:
+        """Extract, parse and validate the program JSON from a response."""
         # Extract the JSON from the response
-        content = response.content[0].text
-        
-        # Remove markdown code blocks if present
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
+        with span("json_extraction", provider="anthropic"):
+            # Remove markdown code blocks if present
+            if "```json" in content:
+                content = content.split("```json")[1].split("```")[0].strip()
+            elif "```" in content:
+                content = content.split("```")[1].split("```")[0].strip()
         
         # Parse JSON and validate with Pydantic
-        program_data = json.loads(content)
-        program = TrainingProgram(**program_data)
+        with span("json_parse", provider="anthropic"):
+            program_data = loads_json(content)
+        
+        with span("validation", provider="anthropic"):
+            program = TrainingProgram.model_validate(program_data)
         
         return program
     
@@ -159,7 +246,8 @@ Generate a complete training program with the following structure:
         self, 
         request: WorkoutRequest,
         week_number: int,
-        phase: str
+        phase: str,
+        progress=None,
     ) -> Dict[str, Any]:
         """Generate a single week of training (useful for ongoing programs)."""
         
@@ -172,18 +260,96 @@ Generate a complete training program with the following structure:
 Return a JSON object for this single week following the WeekPlan schema.
 """
         
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=4000,
-            temperature=0.7,
-            system=self._build_system_prompt(),
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
+        content = self._complete(
+            system=self._build_system_prompt(), prompt=prompt,
+            max_tokens=week_output_tokens(request, "anthropic"), call="week", progress=progress,
         )
         
-        content = response.content[0].text
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
+        with span("json_extraction", provider="anthropic", week=week_number):
+            if "```json" in content:
+                content = content.split("```json")[1].split("```")[0].strip()
         
-        return json.loads(content)
+        with span("json_parse", provider="anthropic", week=week_number):
+            return loads_json(content)
+
+    def generate_weeks(
+        self,
+        request: WorkoutRequest,
+        chunk: Chunk,
+        context: str,
+        progress=None,
+    ) -> List[Dict[str, Any]]:
+        """Generate the weeks of one chunk of a progressive program (app.progressive)."""
+        content = self._complete(
+            system=self._build_system_prompt(),
+            prompt=chunk_prompt(request, chunk, context, request.goal.value),
+            max_tokens=chunk_output_tokens(request, "anthropic", chunk.weeks),
+            call="chunk",
+            progress=progress,
+        )
+
+        with span("json_extraction", provider="anthropic", week=chunk.first_week):
+            if "```json" in content:
+                content = content.split("```json")[1].split("```")[0].strip()
+            elif "```" in content:
+                content = content.split("```")[1].split("```")[0].strip()
+
+        with span("json_parse", provider="anthropic", week=chunk.first_week):
+            return chunk_weeks_data(loads_json(content))
+
+    def generate_programs_batch(
+        self, requests: List[WorkoutRequest]
+    ) -> List[Union[TrainingProgram, Exception]]:
+        """Generate many programs through the Message Batches API.
+
+        Batches cost less than individual requests but may take hours, so this
+        is meant for offline runs. Returns a program or the error for each
+        request, in order.
+        """
+        batches = self.client.beta.messages.batches
+        system_prompt = self._build_system_prompt()
+        acquire_llm_slot("anthropic")
+        with span("provider_call", provider="anthropic", call="batch") as current:
+            batch = batches.create(requests=[
+                {
+                    "custom_id": f"request-{index}",
+                    "params": self._message_params(
+                        system=system_prompt,
+                        prompt=self._build_user_prompt(request),
+                        max_tokens=program_output_tokens(request, "anthropic"),
+                    ),
+                }
+                for index, request in enumerate(requests)
+            ])
+            deadline = time.monotonic() + settings.batch_provider_timeout_seconds
+            while batch.processing_status != "ended":
+                if time.monotonic() > deadline:
+                    batches.cancel(batch.id)
+                    llm_requests.inc(provider="anthropic", call="batch", outcome="timeout")
+                    raise TimeoutError(f"Message batch {batch.id} did not finish in time")
+                time.sleep(settings.batch_poll_seconds)
+                batch = batches.retrieve(batch.id)
+            current.set(batch_id=batch.id, requests=len(requests))
+
+        results: List[Union[TrainingProgram, Exception]] = [
+            RuntimeError("No result returned for this request")
+        ] * len(requests)
+        for item in batches.results(batch.id):
+            index = int(item.custom_id.rsplit("-", 1)[1])
+            llm_requests.inc(provider="anthropic", call="batch", outcome=item.result.type)
+            if item.result.type != "succeeded":
+                results[index] = RuntimeError(f"Batch request {item.result.type}")
+                continue
+            message = item.result.message
+            record_llm_usage(
+                "anthropic", "batch", message.usage.input_tokens, message.usage.output_tokens
+            )
+            record_output(
+                "anthropic", message.content[0].text, message.usage.output_tokens,
+                truncated=message.stop_reason == "max_tokens",
+            )
+            try:
+                results[index] = self._parse_program(message.content[0].text)
+            except Exception as e:
+                results[index] = e
+        return results
@@ -1,16 +1,26 @@
 """Agent implementation using Azure AI Studio (Azure OpenAI-compatible endpoint)."""
-from typing import Dict, Any
-from openai import AzureOpenAI
+from typing import Dict, Any, List, Optional, Tuple
 import json
-from azure.identity import DefaultAzureCredential
 from app.config import settings
+from app.metrics import llm_requests, llm_time_to_first_token, record_llm_usage, span
+from app.ratelimit import acquire_llm_slot
+from app.progressive import Chunk, chunk_prompt, chunk_weeks_data, generate_progressive
+from app.token_budget import chunk_output_tokens, plan_generation, record_output, week_output_tokens
 from app.models import (
     WorkoutRequest,
     TrainingProgram,
     RaceDistance,
     FitnessLevel,
+    loads_json,
 )
 
+RACE_DISTANCES = {
+    RaceDistance.SPRINT: "Sprint (750m swim, 20km bike, 5km run)",
+    RaceDistance.OLYMPIC: "Olympic (1.5km swim, 40km bike, 10km run)",
+    RaceDistance.HALF_IRONMAN: "Half Ironman (1.9km swim, 90km bike, 21.1km run)",
+    RaceDistance.FULL_IRONMAN: "Full Ironman (3.8km swim, 180km bike, 42.2km run)",
+}
+
 
 class TriathlonWorkoutAgentAzureAI:
     """AI Agent using Azure AI Studio (model determined by deployment name)."""
@@ -19,8 +29,13 @@ class TriathlonWorkoutAgentAzureAI:
         if not settings.azure_ai_endpoint:
             raise ValueError("AZURE_AI_ENDPOINT is required when LLM_PROVIDER=azure_ai")
 
+        # SDKs are imported here so they are only loaded when this provider is used.
+        from openai import AzureOpenAI
+
         auth_mode = (settings.azure_ai_auth or "api_key").lower().strip()
         if auth_mode in {"entra_id", "aad", "managed_identity", "mi"}:
+            from azure.identity import DefaultAzureCredential
+
             credential = DefaultAzureCredential(
                 managed_identity_client_id=settings.azure_ai_managed_identity_client_id
             )
@@ -58,6 +73,7 @@ class TriathlonWorkoutAgentAzureAI:
         temperature: float | None,
         max_output_tokens: int,
         json_object: bool = True,
+        stream: bool = False,
     ):
         """Create a chat completion with cross-model token-parameter compatibility.
 
@@ -70,6 +86,11 @@ class TriathlonWorkoutAgentAzureAI:
             "messages": messages,
         }
 
+        # Streaming, with a final usage chunk where the API version supports it.
+        if stream:
+            common_kwargs["stream"] = True
+            common_kwargs["stream_options"] = {"include_usage": True}
+
         # When supported, JSON mode makes the model return a single JSON object.
         if json_object:
             common_kwargs["response_format"] = {"type": "json_object"}
@@ -97,6 +118,15 @@ class TriathlonWorkoutAgentAzureAI:
         except Exception as exc:  # pragma: no cover
             message = str(exc)
 
+            # Older API versions reject stream_options; stream without usage then.
+            if "stream_options" in effective_kwargs and "stream_options" in message:
+                effective_kwargs = dict(effective_kwargs)
+                effective_kwargs.pop("stream_options", None)
+                try:
+                    return _call_with_max_completion_tokens(effective_kwargs)
+                except Exception as exc2:  # pragma: no cover
+                    message = str(exc2)
+
             # Retry without temperature if the model only accepts default temperature.
             if "Unsupported value" in message and "temperature" in message:
                 effective_kwargs = dict(effective_kwargs)
@@ -121,6 +151,81 @@ class TriathlonWorkoutAgentAzureAI:
             if "Unsupported parameter" in message and "max_tokens" in message:
                 return _call_with_max_completion_tokens(effective_kwargs)
             raise
+
+    def _complete(
+        self,
+        *,
+        messages: list[dict[str, str]],
+        max_output_tokens: int,
+        call: str,
+        progress=None,
+    ) -> Tuple[str, Optional[str]]:
+        """Run one chat completion and return (content, finish_reason).
+
+        Records latency, time-to-first-token (when streaming) and token usage.
+        With a ``progress`` handle (app.generation.GenerationJob), streamed text
+        is reported to it and a cancelled job closes the stream mid-response.
+        """
+        if progress is not None:
+            progress.check()
+        acquire_llm_slot("azure_ai")
+        if progress is not None:
+            progress.check()  # cancelled during the rate-limit wait
+        with span("provider_call", provider="azure_ai", call=call) as current:
+            try:
+                response = self._create_chat_completion(
+                    messages=messages,
+                    temperature=None,
+                    max_output_tokens=max_output_tokens,
+                    json_object=True,
+                    stream=settings.llm_streaming,
+                )
+                if settings.llm_streaming:
+                    parts: list[str] = []
+                    finish_reason = None
+                    usage = None
+                    try:
+                        for chunk in response:
+                            if getattr(chunk, "usage", None) is not None:
+                                usage = chunk.usage
+                            for choice in chunk.choices:
+                                text = getattr(choice.delta, "content", None) if choice.delta else None
+                                if text:
+                                    if not parts:
+                                        llm_time_to_first_token.observe(
+                                            current.elapsed, provider="azure_ai", call=call
+                                        )
+                                    parts.append(text)
+                                    if progress is not None:
+                                        progress.check()
+                                        progress.text(text)
+                                if choice.finish_reason:
+                                    finish_reason = choice.finish_reason
+                    finally:
+                        response.close()  # a cancelled stream stops generating here
+                    content = "".join(parts)
+                else:
+                    choice = response.choices[0]
+                    content = getattr(choice.message, "content", None) or ""
+                    finish_reason = getattr(choice, "finish_reason", None)
+                    usage = getattr(response, "usage", None)
+            except Exception:
+                cancelled = progress is not None and progress.cancelled
+                llm_requests.inc(
+                    provider="azure_ai", call=call, outcome="cancelled" if cancelled else "error"
+                )
+                raise
+            input_tokens = getattr(usage, "prompt_tokens", None)
+            output_tokens = getattr(usage, "completion_tokens", None)
+            record_llm_usage("azure_ai", call, input_tokens, output_tokens)
+            record_output("azure_ai", content, output_tokens, truncated=finish_reason == "length")
+            llm_requests.inc(provider="azure_ai", call=call, outcome=finish_reason or "unknown")
+            current.set(
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                finish_reason=finish_reason,
+            )
+        return content, finish_reason
     
     def _build_system_prompt(self) -> str:
         """Build the system prompt for the workout generation agent."""
@@ -160,16 +265,9 @@ You must respond with valid JSON matching the TrainingProgram schema."""
     def _build_user_prompt(self, request: WorkoutRequest) -> str:
         """Build the user prompt with specific workout requirements."""
         
-        race_distances = {
-            RaceDistance.SPRINT: "Sprint (750m swim, 20km bike, 5km run)",
-            RaceDistance.OLYMPIC: "Olympic (1.5km swim, 40km bike, 10km run)",
-            RaceDistance.HALF_IRONMAN: "Half Ironman (1.9km swim, 90km bike, 21.1km run)",
-            RaceDistance.FULL_IRONMAN: "Full Ironman (3.8km swim, 180km bike, 42.2km run)",
-        }
-        
         prompt = f"""Create a {request.duration_weeks}-week training program for the following athlete:
 
-**Goal**: {race_distances[request.goal]}
+**Goal**: {RACE_DISTANCES[request.goal]}
 **Fitness Level**: {request.fitness_level.value}
 **Available Training Time**: {request.available_hours_per_week} hours per week
 **Current Week**: Week {request.current_week}
@@ -219,7 +317,7 @@ Generate a complete training program in JSON format. Be CONCISE in descriptions.
 ```
 
 **Guidelines**:
-1. Create 5-6 workouts per week based on available hours
+1. Create 5-6 workouts per week based on available hours, with at least one rest day
 2. Include all three sports distributed appropriately
 3. Keep descriptions brief (5-10 words max)
 4. Include one brick workout per week
@@ -246,32 +344,31 @@ Generate a complete training program in JSON format. Be CONCISE in descriptions.
 
         return content
     
-    def generate_program(self, request: WorkoutRequest) -> TrainingProgram:
+    def generate_program(self, request: WorkoutRequest, progress=None) -> TrainingProgram:
         """Generate a complete training program using Azure AI."""
         
-        # For longer programs (>6 weeks), generate week-by-week to avoid token limits
-        if request.duration_weeks > 6:
-            return self._generate_program_progressive(request)
+        # Generate a few weeks per call when the predicted output does not fit one response
+        plan = plan_generation(request, "azure_ai")
+        if plan.mode == "progressive":
+            return generate_progressive(request, plan, self.generate_weeks, "azure_ai", progress)
         
-        system_prompt = self._build_system_prompt()
-        user_prompt = self._build_user_prompt(request)
+        with span("prompt_build", provider="azure_ai"):
+            system_prompt = self._build_system_prompt()
+            user_prompt = self._build_user_prompt(request)
         
-        response = self._create_chat_completion(
+        raw_content, finish_reason = self._complete(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            temperature=None,
-            max_output_tokens=16000,
-            json_object=True,
+            max_output_tokens=plan.max_output_tokens,
+            call="program",
+            progress=progress,
         )
 
-        choice = response.choices[0]
-        raw_content = getattr(choice.message, "content", None)
-        finish_reason = getattr(choice, "finish_reason", None)
-
         # Extract the JSON from the response
-        content = self._extract_json_object_text(raw_content or "")
+        with span("json_extraction", provider="azure_ai"):
+            content = self._extract_json_object_text(raw_content or "")
 
         if not content.strip():
             raise ValueError(
@@ -286,80 +383,72 @@ Generate a complete training program in JSON format. Be CONCISE in descriptions.
                 f"Model hit token limit (finish_reason='length'). "
                 f"Received {len(content)} chars but JSON may be incomplete. "
                 f"Try: 1) Reduce duration_weeks (currently {request.duration_weeks}), "
-                f"2) Increase max_output_tokens (currently 16000), "
+                f"2) Increase LLM_MAX_OUTPUT_TOKENS (this call had {plan.max_output_tokens}), "
                 f"or 3) Use a model with larger output capacity."
             )
         
         # Parse JSON and validate with Pydantic
         try:
-            program_data = json.loads(content)
+            with span("json_parse", provider="azure_ai"):
+                program_data = loads_json(content)
         except json.JSONDecodeError as exc:
             preview = content[:800].replace("\n", "\\n")
             raise ValueError(
                 "Model did not return valid JSON. "
                 f"First 800 chars: {preview!r}"
             ) from exc
-        program = TrainingProgram(**program_data)
+        with span("validation", provider="azure_ai"):
+            program = TrainingProgram.model_validate(program_data)
         
         return program
     
-    def _generate_program_progressive(self, request: WorkoutRequest) -> TrainingProgram:
-        """Generate a program week-by-week for longer training plans."""
-        from app.models import WeekPlan, RaceDistance, FitnessLevel
-        
-        # Determine periodization phases
-        total_weeks = request.duration_weeks
-        base_weeks = int(total_weeks * 0.6)
-        build_weeks = int(total_weeks * 0.25)
-        peak_weeks = max(1, int(total_weeks * 0.1))
-        taper_weeks = total_weeks - base_weeks - build_weeks - peak_weeks
-        
-        weeks = []
-        week_num = 1
-        
-        # Generate each week
-        for phase_name, phase_weeks in [
-            ("Base", base_weeks),
-            ("Build", build_weeks),
-            ("Peak", peak_weeks),
-            ("Taper", taper_weeks)
-        ]:
-            for i in range(phase_weeks):
-                week_data = self.generate_single_week(
-                    request=request,
-                    week_number=week_num,
-                    phase=phase_name
-                )
-                weeks.append(WeekPlan(**week_data))
-                week_num += 1
-        
-        # Build complete program
-        program = TrainingProgram(
-            goal=request.goal,
-            fitness_level=request.fitness_level,
-            duration_weeks=request.duration_weeks,
-            weeks=weeks,
-            notes=f"{request.duration_weeks}-week {request.goal.value} program with {base_weeks}w base, {build_weeks}w build, {peak_weeks}w peak, {taper_weeks}w taper phases"
+    def generate_weeks(
+        self,
+        request: WorkoutRequest,
+        chunk: Chunk,
+        context: str,
+        progress=None,
+    ) -> List[Dict[str, Any]]:
+        """Generate the weeks of one chunk of a progressive program (app.progressive)."""
+        raw_content, finish_reason = self._complete(
+            messages=[
+                {"role": "system", "content": self._build_system_prompt()},
+                {"role": "user", "content": chunk_prompt(request, chunk, context, RACE_DISTANCES[request.goal])},
+            ],
+            max_output_tokens=chunk_output_tokens(request, "azure_ai", chunk.weeks),
+            call="chunk",
+            progress=progress,
         )
-        
-        return program
+        if finish_reason == "length":
+            raise ValueError(
+                f"Model hit token limit (finish_reason='length') in weeks "
+                f"{chunk.first_week}-{chunk.last_week}. Lower GENERATION_CHUNK_WEEKS "
+                f"(currently {settings.generation_chunk_weeks}) or raise LLM_MAX_OUTPUT_TOKENS."
+            )
+
+        with span("json_extraction", provider="azure_ai", week=chunk.first_week):
+            content = self._extract_json_object_text(raw_content)
+
+        try:
+            with span("json_parse", provider="azure_ai", week=chunk.first_week):
+                return chunk_weeks_data(loads_json(content))
+        except json.JSONDecodeError as exc:
+            preview = content[:800].replace("\n", "\\n")
+            raise ValueError(
+                "Model did not return valid JSON. "
+                f"First 800 chars: {preview!r}"
+            ) from exc
     
     def generate_single_week(
         self, 
         request: WorkoutRequest,
         week_number: int,
-        phase: str
+        phase: str,
+        progress=None,
     ) -> Dict[str, Any]:
         """Generate a single week of training (useful for ongoing programs)."""
         
-        race_distances = {
-            RaceDistance.SPRINT: "Sprint (750m swim, 20km bike, 5km run)",
-            RaceDistance.OLYMPIC: "Olympic (1.5km swim, 40km bike, 10km run)",
-            RaceDistance.HALF_IRONMAN: "Half Ironman (1.9km swim, 90km bike, 21.1km run)",
-            RaceDistance.FULL_IRONMAN: "Full Ironman (3.8km swim, 180km bike, 42.2km run)",
-        }
-        
-        prompt = f"""Create Week {week_number} of a {request.duration_weeks}-week {race_distances[request.goal]} training program.
+        prompt = f"""Create Week {week_number} of a {request.duration_weeks}-week {RACE_DISTANCES[request.goal]} training program.
 
 **Phase**: {phase}
 **Fitness Level**: {request.fitness_level.value}
@@ -397,20 +486,22 @@ Return a JSON object with this structure (be CONCISE in descriptions):
 Create 5-6 workouts. Include swim, bike, run. Keep descriptions under 10 words. Return ONLY valid JSON.
 """
         
-        response = self._create_chat_completion(
+        raw_content, _ = self._complete(
             messages=[
                 {"role": "system", "content": self._build_system_prompt()},
                 {"role": "user", "content": prompt},
             ],
-            temperature=None,
-            max_output_tokens=3000,
-            json_object=True,
+            max_output_tokens=week_output_tokens(request, "azure_ai"),
+            call="week",
+            progress=progress,
         )
         
-        content = self._extract_json_object_text(response.choices[0].message.content)
+        with span("json_extraction", provider="azure_ai", week=week_number):
+            content = self._extract_json_object_text(raw_content)
 
         try:
-            return json.loads(content)
+            with span("json_parse", provider="azure_ai", week=week_number):
+                return loads_json(content)
         except json.JSONDecodeError as exc:
             preview = content[:800].replace("\n", "\\n")
             raise ValueError(
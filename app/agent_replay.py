@@ -0,0 +1,273 @@
+"""Agent that replays recorded responses instead of calling an LLM.
+
+Selected with LLM_PROVIDER=replay, for load tests and offline development.
+Recordings are JSON files in REPLAY_DIR holding either a whole
+TrainingProgram or a single WeekPlan; requests without a matching recording
+are answered with a synthetic program. Responses are streamed in chunks with
+a lognormal time-to-first-token and token rate, so the server sees the same
+shape of latency as with a real provider.
+
+Export saved programs as recordings with:
+    python -m app.agent_replay export --out recordings/ [--limit 50]
+"""
+import json
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from app.config import settings
+from app.metrics import llm_requests, llm_time_to_first_token, record_llm_usage, span
+from app.models import TrainingProgram, WorkoutRequest, loads_json, parse_program
+from app.progressive import Chunk, chunk_prompt, generate_progressive
+from app.ratelimit import acquire_llm_slot
+from app.token_budget import plan_generation, record_output
+from app.synthetic import synthetic_program_data, synthetic_week_data
+
+CHARS_PER_TOKEN = 4
+SYSTEM_PROMPT_TOKENS = 400  # the providers' coaching system prompt
+
+
+class TriathlonWorkoutAgentReplay:
+    """Replays recorded TrainingProgram / WeekPlan responses with simulated latency."""
+
+    def __init__(self, replay_dir: Optional[str] = None):
+        self.programs: Dict[int, List[str]] = {}
+        self.weeks: List[dict] = []
+        self._random = random.Random(settings.replay_seed)
+        self._lock = threading.Lock()
+        self._next = 0
+        directory = replay_dir or settings.replay_dir
+        if directory:
+            self._load(Path(directory))
+
+    def _load(self, directory: Path) -> None:
+        if not directory.is_dir():
+            raise ValueError(f"REPLAY_DIR {str(directory)!r} is not a directory")
+        for path in sorted(directory.glob("*.json")):
+            text = path.read_text(encoding="utf-8")
+            data = json.loads(text)
+            if "weeks" in data:
+                self.programs.setdefault(int(data["duration_weeks"]), []).append(text)
+            elif "workouts" in data:
+                self.weeks.append(data)
+
+    def _pick(self, items: list):
+        # Round-robin, so a load test cycles through all recordings.
+        with self._lock:
+            item = items[self._next % len(items)]
+            self._next += 1
+        return item
+
+    def _delay(self, median_seconds: float) -> float:
+        sigma = settings.replay_latency_sigma
+        factor = self._random.lognormvariate(0, sigma) if sigma > 0 else 1.0
+        return median_seconds * factor / max(settings.replay_speedup, 1e-9)
+
+    def _stream(self, text: str) -> Iterator[str]:
+        """Yield ``text`` in token-sized chunks at a simulated provider pace."""
+        time.sleep(self._delay(settings.replay_ttft_ms / 1000))
+        chunk_chars = max(1, settings.replay_chunk_tokens) * CHARS_PER_TOKEN
+        rate = settings.replay_output_tokens_per_second
+        # One draw per response: a slow response is slow throughout.
+        chunk_delay = (
+            self._delay(settings.replay_chunk_tokens / rate) if rate > 0 else 0.0
+        )
+        for start in range(0, len(text), chunk_chars):
+            if start:
+                time.sleep(chunk_delay)
+            yield text[start:start + chunk_chars]
+
+    def _complete(self, text: str, prompt_tokens: int, call: str, progress=None) -> str:
+        """Stream a canned response, recording the same metrics as real providers."""
+        if progress is not None:
+            progress.check()
+        acquire_llm_slot("replay")
+        if progress is not None:
+            progress.check()
+        with span("provider_call", provider="replay", call=call) as current:
+            try:
+                if settings.llm_streaming:
+                    parts = []
+                    for chunk in self._stream(text):
+                        if not parts:
+                            llm_time_to_first_token.observe(
+                                current.elapsed, provider="replay", call=call
+                            )
+                        parts.append(chunk)
+                        if progress is not None:
+                            progress.check()
+                            progress.text(chunk)
+                    text = "".join(parts)
+                else:
+                    for _ in self._stream(text):
+                        if progress is not None:
+                            progress.check()
+            except Exception:
+                cancelled = progress is not None and progress.cancelled
+                llm_requests.inc(
+                    provider="replay", call=call, outcome="cancelled" if cancelled else "error"
+                )
+                raise
+            output_tokens = len(text) // CHARS_PER_TOKEN
+            record_llm_usage("replay", call, prompt_tokens, output_tokens)
+            record_output("replay", text, output_tokens)
+            llm_requests.inc(provider="replay", call=call, outcome="stop")
+            current.set(input_tokens=prompt_tokens, output_tokens=output_tokens)
+        return text
+
+    def _program_text(self, request: WorkoutRequest) -> str:
+        recorded = self.programs.get(request.duration_weeks)
+        if recorded:
+            return self._pick(recorded)
+        if self.weeks:
+            weeks = []
+            for week_number in range(1, request.duration_weeks + 1):
+                week = dict(self._pick(self.weeks), week_number=week_number)
+                weeks.append(week)
+            data = {
+                "goal": request.goal.value,
+                "fitness_level": request.fitness_level.value,
+                "duration_weeks": request.duration_weeks,
+                "weeks": weeks,
+                "notes": f"Replayed {request.duration_weeks}-week program",
+            }
+        else:
+            data = synthetic_program_data(
+                request.duration_weeks,
+                goal=request.goal.value,
+                fitness_level=request.fitness_level.value,
+                hours_per_week=request.available_hours_per_week,
+            )
+        return json.dumps(data, separators=(",", ":"))
+
+    def generate_program(self, request: WorkoutRequest, progress=None) -> TrainingProgram:
+        """Replay a complete training program for the request.
+
+        Programs planned as progressive (app.token_budget) are replayed a few
+        weeks per call, as the providers generate them.
+        """
+        plan = plan_generation(request, "replay")
+        if plan.mode == "progressive":
+            return generate_progressive(request, plan, self.generate_weeks, "replay", progress)
+
+        with span("prompt_build", provider="replay"):
+            text = self._program_text(request)
+        content = self._complete(text, prompt_tokens=900, call="program", progress=progress)
+
+        with span("json_parse", provider="replay"):
+            program_data = loads_json(content)
+
+        with span("validation", provider="replay"):
+            return TrainingProgram.model_validate(program_data)
+
+    def generate_programs_batch(
+        self, requests: List[WorkoutRequest]
+    ) -> List[Union[TrainingProgram, Exception]]:
+        """Replay a provider batch: one simulated wait, then every program."""
+        acquire_llm_slot("replay")
+        with span("provider_call", provider="replay", call="batch"):
+            time.sleep(self._delay(settings.replay_ttft_ms / 1000))
+        results: List[Union[TrainingProgram, Exception]] = []
+        for request in requests:
+            text = self._program_text(request)
+            record_llm_usage("replay", "batch", 900, len(text) // CHARS_PER_TOKEN)
+            llm_requests.inc(provider="replay", call="batch", outcome="succeeded")
+            try:
+                results.append(parse_program(text))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def generate_single_week(
+        self,
+        request: WorkoutRequest,
+        week_number: int,
+        phase: str,
+        progress=None,
+    ) -> Dict[str, Any]:
+        """Replay a single week of training."""
+        if self.weeks:
+            data = dict(self._pick(self.weeks), week_number=week_number)
+        else:
+            data = synthetic_week_data(
+                week_number,
+                request.duration_weeks,
+                phase=phase,
+                hours_per_week=request.available_hours_per_week,
+            )
+        content = self._complete(
+            json.dumps(data, separators=(",", ":")), prompt_tokens=700, call="week",
+            progress=progress,
+        )
+        with span("json_parse", provider="replay", week=week_number):
+            return loads_json(content)
+
+    def generate_weeks(
+        self,
+        request: WorkoutRequest,
+        chunk: Chunk,
+        context: str,
+        progress=None,
+    ) -> List[Dict[str, Any]]:
+        """Replay the weeks of one chunk of a progressive program (app.progressive).
+
+        Input tokens are counted from the prompt a provider would be sent.
+        """
+        weeks = []
+        for week_number in range(chunk.first_week, chunk.last_week + 1):
+            if self.weeks:
+                weeks.append(dict(self._pick(self.weeks), week_number=week_number))
+            else:
+                weeks.append(synthetic_week_data(
+                    week_number,
+                    request.duration_weeks,
+                    phase=chunk.phase,
+                    hours_per_week=request.available_hours_per_week,
+                ))
+        prompt = chunk_prompt(request, chunk, context, request.goal.value)
+        content = self._complete(
+            json.dumps({"weeks": weeks}, separators=(",", ":")),
+            prompt_tokens=SYSTEM_PROMPT_TOKENS + len(prompt) // CHARS_PER_TOKEN,
+            call="chunk",
+            progress=progress,
+        )
+        with span("json_parse", provider="replay", week=chunk.first_week):
+            return loads_json(content)["weeks"]
+
+
+def export_recordings(out_dir: str, limit: int = 100) -> int:
+    """Write saved programs (and their weeks) from the database as recordings."""
+    from app.database import SessionLocal, ensure_db
+    from app.repository import ProgramRepository
+
+    ensure_db()
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    db = SessionLocal()
+    try:
+        count = 0
+        for row in ProgramRepository.list_programs(db, skip=0, limit=limit):
+            program = ProgramRepository.get_program(db, row.id)
+            (out / f"program-{row.id}.json").write_text(program.program_text, encoding="utf-8")
+            for week in parse_program(program.program_text).weeks:
+                (out / f"week-{row.id}-{week.week_number}.json").write_text(
+                    week.model_dump_json(), encoding="utf-8"
+                )
+            count += 1
+        return count
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay provider recordings")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="export saved programs as recordings")
+    export.add_argument("--out", required=True)
+    export.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+    print(f"Exported {export_recordings(args.out, args.limit)} programs to {args.out}")
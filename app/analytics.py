@@ -0,0 +1,464 @@
+"""Columnar export of planned and completed training, and compliance queries.
+
+Two tables, flattened for analysis across many athletes:
+  planned    one row per planned interval (program_json weeks); a workout
+             without intervals has a single row with empty interval fields,
+             and interval_index == 0 marks exactly one row per workout
+  completed  one row per WorkoutHistory entry, with the program week it
+             falls in (counted from the program's created_at)
+
+`export_analytics` writes both as Parquet or Arrow IPC datasets, hive-
+partitioned by month or by program, reading the database in batches.
+`compliance` aggregates planned vs completed minutes per program, week and
+sport with NumPy, from the exported files (`read_table`) or straight from the
+database (`load_columns`).
+
+    pip install pyarrow
+    python -m app.analytics export --out analytics/ --partition-by month
+    python -m app.analytics compliance --from analytics/ --by sport,week_number
+"""
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.database import SavedProgram, WorkoutHistory
+from app.models import Sport, loads_json
+
+try:
+    import numpy as np
+except ImportError:  # in requirements.txt; only compliance queries need it
+    np = None
+
+# (column, type) of each table; types map to Arrow and NumPy below.
+PLANNED_COLUMNS = (
+    ("program_id", "int64"),
+    ("goal", "string"),
+    ("fitness_level", "string"),
+    ("month", "string"),
+    ("week_number", "int32"),
+    ("week_start", "date"),
+    ("focus", "string"),
+    ("workout_index", "int32"),
+    ("sport", "string"),
+    ("title", "string"),
+    ("workout_minutes", "int32"),
+    ("workout_km", "float64"),
+    ("interval_index", "int32"),
+    ("interval_minutes", "int32"),
+    ("interval_km", "float64"),
+    ("intensity", "string"),
+)
+COMPLETED_COLUMNS = (
+    ("id", "int64"),
+    ("program_id", "int64"),
+    ("month", "string"),
+    ("completed_at", "timestamp"),
+    ("week_number", "int32"),
+    ("sport", "string"),
+    ("title", "string"),
+    ("duration_minutes", "int32"),
+    ("distance_km", "float64"),
+    ("rating", "int32"),
+)
+TABLES = {"planned": PLANNED_COLUMNS, "completed": COMPLETED_COLUMNS}
+PARTITION_COLUMNS = {"month": "month", "program": "program_id"}
+FORMATS = {"parquet": ("parquet", "parquet"), "arrow": ("ipc", "arrow")}
+
+
+def _require(module, package: str):
+    if module is None:
+        raise RuntimeError(f"Analytics needs the {package} package: pip install {package}")
+    return module
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset  # noqa: F401
+    except ImportError:
+        pyarrow = None
+    return _require(pyarrow, "pyarrow")
+
+
+def _sport(value: str) -> str:
+    try:
+        return Sport(value).value
+    except ValueError:
+        return value.lower()
+
+
+def _empty(columns) -> Dict[str, list]:
+    return {name: [] for name, _ in columns}
+
+
+def planned_rows(program: SavedProgram) -> List[tuple]:
+    """The flattened intervals of a saved program, as PLANNED_COLUMNS tuples."""
+    data = loads_json(program.program_text)
+    start = (program.created_at or datetime.utcnow()).date()
+    rows = []
+    for week in data["weeks"]:
+        week_number = week["week_number"]
+        week_start = start + timedelta(weeks=week_number - 1)
+        week_values = (
+            program.id, program.goal, program.fitness_level, week_start.strftime("%Y-%m"),
+            week_number, week_start, week["focus"],
+        )
+        for workout_index, workout in enumerate(week["workouts"]):
+            workout_values = week_values + (
+                workout_index, workout["sport"], workout["title"],
+                workout["total_duration_minutes"], workout.get("total_distance_km"),
+            )
+            rows.extend(
+                workout_values + (
+                    interval_index, interval.get("duration_minutes"),
+                    interval.get("distance_km"), interval.get("intensity"),
+                )
+                for interval_index, interval in enumerate(workout["main_set"] or [{}])
+            )
+    return rows
+
+
+def completed_rows(rows: Iterable) -> List[tuple]:
+    """COMPLETED_COLUMNS tuples for (WorkoutHistory columns..., program created_at) rows."""
+    out = []
+    for id_, program_id, completed_at, sport, title, minutes, km, rating, started in rows:
+        week_number = None
+        if started is not None and completed_at >= started:
+            week_number = (completed_at - started).days // 7 + 1
+        out.append((
+            id_, program_id, completed_at.strftime("%Y-%m"), completed_at, week_number,
+            _sport(sport), title, minutes, km, rating,
+        ))
+    return out
+
+
+def _columns(rows: List[tuple], spec) -> Dict[str, Sequence]:
+    if not rows:
+        return _empty(spec)
+    return dict(zip((name for name, _ in spec), zip(*rows)))
+
+
+def _program_batches(
+    db: Session, batch_size: int, program_ids: Optional[Sequence[int]] = None
+) -> Iterator[Dict[str, list]]:
+    last_id = 0
+    while True:
+        stmt = (
+            select(SavedProgram)
+            .where(SavedProgram.id > last_id)
+            .order_by(SavedProgram.id)
+            .limit(batch_size)
+        )
+        if program_ids is not None:
+            stmt = stmt.where(SavedProgram.id.in_(program_ids))
+        programs = list(db.scalars(stmt))
+        if not programs:
+            return
+        rows = []
+        for program in programs:
+            rows.extend(planned_rows(program))
+        last_id = programs[-1].id
+        # Programs are large; keep the session from holding every batch.
+        db.expunge_all()
+        yield _columns(rows, PLANNED_COLUMNS)
+
+
+def _completed_batches(
+    db: Session, batch_size: int, program_ids: Optional[Sequence[int]] = None
+) -> Iterator[Dict[str, list]]:
+    last_id = 0
+    while True:
+        stmt = (
+            select(
+                WorkoutHistory.id,
+                WorkoutHistory.program_id,
+                WorkoutHistory.completed_at,
+                WorkoutHistory.sport,
+                WorkoutHistory.title,
+                WorkoutHistory.duration_minutes,
+                WorkoutHistory.distance_km,
+                WorkoutHistory.rating,
+                SavedProgram.created_at,
+            )
+            .outerjoin(SavedProgram, SavedProgram.id == WorkoutHistory.program_id)
+            .where(WorkoutHistory.id > last_id)
+            .order_by(WorkoutHistory.id)
+            .limit(batch_size)
+        )
+        if program_ids is not None:
+            stmt = stmt.where(WorkoutHistory.program_id.in_(program_ids))
+        rows = db.execute(stmt).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield _columns(completed_rows(rows), COMPLETED_COLUMNS)
+
+
+def _arrow_table(columns: Dict[str, Sequence], spec):
+    pa = _pyarrow()
+    types = {
+        "int32": pa.int32(), "int64": pa.int64(), "float64": pa.float64(),
+        "string": pa.string(), "date": pa.date32(), "timestamp": pa.timestamp("us"),
+    }
+    schema = pa.schema([(name, types[kind]) for name, kind in spec])
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+def export_analytics(
+    db: Session,
+    out_dir: str,
+    fmt: str = "parquet",
+    partition_by: str = "month",
+    batch_size: int = 200,
+    program_ids: Optional[Sequence[int]] = None,
+    overwrite: bool = False,
+) -> Dict[str, int]:
+    """Write the planned and completed tables under ``out_dir``; returns row counts."""
+    pa = _pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown analytics format {fmt!r}; use one of {sorted(FORMATS)}")
+    if partition_by not in PARTITION_COLUMNS:
+        raise ValueError(
+            f"Unknown partitioning {partition_by!r}; use one of {sorted(PARTITION_COLUMNS)}"
+        )
+    dataset_format, extension = FORMATS[fmt]
+    file_options = None
+    if fmt == "parquet":
+        file_options = pa.dataset.ParquetFileFormat().make_write_options(compression="zstd")
+
+    batches = {
+        "planned": _program_batches(db, batch_size, program_ids),
+        "completed": _completed_batches(db, batch_size * 50, program_ids),
+    }
+    counts = {}
+    for table_name, columns_iter in batches.items():
+        base_dir = Path(out_dir) / table_name
+        if base_dir.exists() and any(base_dir.iterdir()):
+            if not overwrite:
+                raise ValueError(f"{base_dir} is not empty; pass overwrite=True to replace it")
+            shutil.rmtree(base_dir)
+        counts[table_name] = 0
+        for part, columns in enumerate(columns_iter):
+            table = _arrow_table(columns, TABLES[table_name])
+            pa.dataset.write_dataset(
+                table,
+                base_dir,
+                format=dataset_format,
+                file_options=file_options,
+                partitioning=[PARTITION_COLUMNS[partition_by]],
+                partitioning_flavor="hive",
+                basename_template=f"part-{part:05d}-{{i}}.{extension}",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            counts[table_name] += table.num_rows
+    return counts
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _numpy_columns(columns: Dict[str, Sequence], spec) -> Dict[str, "np.ndarray"]:
+    """Lists as NumPy arrays; missing ints become -1, floats NaN and strings ""."""
+    _require(np, "numpy")
+    arrays = {}
+    for name, kind in spec:
+        values = columns[name]
+        if kind in ("int32", "int64"):
+            arrays[name] = np.nan_to_num(np.array(values, dtype=float), nan=-1).astype(kind)
+        elif kind == "float64":
+            arrays[name] = np.array(values, dtype=float)  # None -> nan
+        elif kind == "string":
+            arrays[name] = np.array(["" if v is None else v for v in values], dtype=object)
+        elif kind == "date":
+            # Far faster than letting NumPy convert date objects one by one.
+            ordinals = np.array([v.toordinal() for v in values], dtype=np.int64)
+            arrays[name] = (ordinals - _EPOCH.toordinal()).astype("datetime64[D]")
+        else:
+            micros = [(v - _EPOCH) // _MICROSECOND for v in values]
+            arrays[name] = np.array(micros, dtype=np.int64).astype("datetime64[us]")
+    return arrays
+
+
+def _arrow_numpy_columns(table, spec) -> Dict[str, "np.ndarray"]:
+    """Same conversion as _numpy_columns, for a pyarrow Table."""
+    _require(np, "numpy")
+    pa = _pyarrow()
+    fills = {"int32": -1, "int64": -1, "float64": float("nan"), "string": ""}
+    arrays = {}
+    for name, kind in spec:
+        column = table.column(name)
+        if kind in fills:
+            # Hive partition columns come back as int32 / dictionary strings.
+            column = column.cast(pa.string() if kind == "string" else getattr(pa, kind)())
+            column = column.fill_null(fills[kind])
+        arrays[name] = column.to_numpy()
+    return arrays
+
+
+def load_columns(
+    db: Session, program_ids: Optional[Sequence[int]] = None, batch_size: int = 200
+) -> Tuple[Dict[str, "np.ndarray"], Dict[str, "np.ndarray"]]:
+    """Planned and completed tables straight from the database, as NumPy columns."""
+    tables = []
+    for spec, batches in (
+        (PLANNED_COLUMNS, _program_batches(db, batch_size, program_ids)),
+        (COMPLETED_COLUMNS, _completed_batches(db, batch_size * 50, program_ids)),
+    ):
+        columns = _empty(spec)
+        for batch in batches:
+            for name, values in batch.items():
+                columns[name].extend(values)
+        tables.append(_numpy_columns(columns, spec))
+    return tables[0], tables[1]
+
+
+def read_table(
+    out_dir: str, table: str, program_ids: Optional[Sequence[int]] = None
+) -> Dict[str, "np.ndarray"]:
+    """Read an exported table (either format and partitioning) as NumPy columns."""
+    pa = _pyarrow()
+    spec = TABLES[table]
+    files = sorted(p for p in (Path(out_dir) / table).rglob("part-*") if p.is_file())
+    if not files:
+        return _numpy_columns(_empty(spec), spec)
+    dataset = pa.dataset.dataset(
+        files,
+        format="parquet" if files[0].suffix == ".parquet" else "ipc",
+        partitioning="hive",
+        partition_base_dir=str(Path(out_dir) / table),
+    )
+    condition = None
+    if program_ids is not None:
+        condition = pa.dataset.field("program_id").isin(list(program_ids))
+    return _arrow_numpy_columns(dataset.to_table(filter=condition), spec)
+
+
+GROUP_COLUMNS = ("program_id", "week_number", "sport", "month")
+COMPLIANCE_COLUMNS = (
+    "planned_workouts", "completed_workouts", "planned_minutes",
+    "completed_minutes", "planned_km", "completed_km", "minutes_ratio",
+)
+
+
+def compliance(
+    planned: Dict[str, "np.ndarray"],
+    completed: Dict[str, "np.ndarray"],
+    by: Sequence[str] = ("program_id", "week_number", "sport"),
+) -> Dict[str, "np.ndarray"]:
+    """Planned vs completed workouts, minutes and km, grouped by ``by``.
+
+    Columns of ``by`` plus planned/completed _workouts, _minutes and _km and
+    minutes_ratio (completed / planned minutes, NaN where nothing was
+    planned). Completed workouts outside any program week are ignored.
+    """
+    _require(np, "numpy")
+    unknown = set(by) - set(GROUP_COLUMNS)
+    if unknown or not by:
+        raise ValueError(f"Group by a non-empty subset of {GROUP_COLUMNS}, got {list(by)}")
+
+    planned_mask = planned["interval_index"] == 0  # one row per workout
+    completed_mask = (completed["program_id"] >= 0) & (completed["week_number"] >= 1)
+    planned_count = int(planned_mask.sum())
+
+    # Encode each key column on the union of both sides, then combine the
+    # codes into one group id per row.
+    key_values = []
+    codes = []
+    for name in by:
+        values = np.concatenate([planned[name][planned_mask], completed[name][completed_mask]])
+        uniques, inverse = np.unique(values, return_inverse=True)
+        key_values.append(uniques)
+        codes.append(inverse.reshape(-1))
+    if not len(codes[0]):
+        empty = {name: key_values[i][:0] for i, name in enumerate(by)}
+        for column in COMPLIANCE_COLUMNS:
+            empty[column] = np.zeros(0)
+        return empty
+    combined = np.ravel_multi_index(codes, [len(uniques) for uniques in key_values])
+    groups, first, group_of = np.unique(combined, return_index=True, return_inverse=True)
+    group_of = group_of.reshape(-1)
+    planned_group = group_of[:planned_count]
+    completed_group = group_of[planned_count:]
+    size = len(groups)
+
+    def total(group, weights=None):
+        if weights is not None:
+            weights = np.nan_to_num(weights.astype(float))
+        return np.bincount(group, weights=weights, minlength=size)
+
+    result = {name: key_values[i][codes[i][first]] for i, name in enumerate(by)}
+    result["planned_workouts"] = total(planned_group).astype(np.int64)
+    result["completed_workouts"] = total(completed_group).astype(np.int64)
+    result["planned_minutes"] = total(planned_group, planned["workout_minutes"][planned_mask])
+    result["completed_minutes"] = total(
+        completed_group, completed["duration_minutes"][completed_mask]
+    )
+    result["planned_km"] = total(planned_group, planned["workout_km"][planned_mask])
+    result["completed_km"] = total(completed_group, completed["distance_km"][completed_mask])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["minutes_ratio"] = np.where(
+            result["planned_minutes"] > 0,
+            result["completed_minutes"] / result["planned_minutes"],
+            np.nan,
+        )
+    return result
+
+
+def _print_compliance(result: Dict[str, "np.ndarray"], by: Sequence[str]) -> None:
+    headers = list(by) + ["plan n", "done n", "plan min", "done min", "ratio"]
+    print("".join(f"{h:>14}" for h in headers))
+    for i in range(len(result["planned_workouts"])):
+        cells = [str(result[name][i]) for name in by] + [
+            str(result["planned_workouts"][i]),
+            str(result["completed_workouts"][i]),
+            f"{result['planned_minutes'][i]:.0f}",
+            f"{result['completed_minutes'][i]:.0f}",
+            f"{result['minutes_ratio'][i]:.0%}" if result["planned_minutes"][i] else "-",
+        ]
+        print("".join(f"{cell:>14}" for cell in cells))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.database import SessionLocal, ensure_db
+
+    parser = argparse.ArgumentParser(description="Planned vs completed training analytics")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write planned/completed tables")
+    export.add_argument("--out", required=True)
+    export.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    export.add_argument("--partition-by", choices=sorted(PARTITION_COLUMNS), default="month")
+    export.add_argument("--batch-size", type=int, default=200)
+    export.add_argument("--overwrite", action="store_true")
+    query = commands.add_parser("compliance", help="planned vs completed per group")
+    query.add_argument("--from", dest="source", help="exported directory (default: database)")
+    query.add_argument("--program-id", type=int, action="append")
+    query.add_argument("--by", default="program_id,week_number,sport")
+    args = parser.parse_args()
+
+    ensure_db()
+    db = SessionLocal()
+    try:
+        if args.command == "export":
+            counts = export_analytics(
+                db, args.out, args.format, args.partition_by, args.batch_size,
+                overwrite=args.overwrite,
+            )
+            print(f"Wrote {counts['planned']} planned and {counts['completed']} "
+                  f"completed rows to {args.out}")
+        else:
+            by = args.by.split(",")
+            if args.source:
+                planned = read_table(args.source, "planned", args.program_id)
+                completed = read_table(args.source, "completed", args.program_id)
+            else:
+                planned, completed = load_columns(db, args.program_id)
+            _print_compliance(compliance(planned, completed, by), by)
+    finally:
+        db.close()
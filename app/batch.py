@@ -0,0 +1,324 @@
+"""Batch generation of many programs (POST /api/workouts/batch).
+
+Identical requests in a batch are generated once. Unique requests run on a
+pool of BATCH_MAX_CONCURRENCY threads shared by every batch in the process,
+with each provider request going through the app.ratelimit token bucket, or
+as a single provider batch when provider_batch is set and the agent supports
+it. With SIMILARITY_REUSE, requests close to a saved program are adapted
+from it first and skip the provider. Each program passes the plan-validation
+rules, and programs are saved BATCH_SAVE_CHUNK_SIZE at a time, one
+transaction per chunk.
+
+A batch runs in the worker that accepted it. Its state is also published
+to the database (app.job_store), so GET /api/workouts/batch/{id} answers
+with per-item status on any worker; a batch whose worker stopped before it
+finished is reported as "failed".
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import SessionLocal
+from app.job_store import load_state, publish
+from app.metrics import batch_items, span
+from app.models import BatchGenerateRequest, TrainingProgram, WorkoutRequest
+from app.plan_validation import PlanValidationError, check_program
+from app.repository import ProgramRepository
+from app.similarity import find_reusable
+
+logger = logging.getLogger("app.batch")
+
+# Final item statuses; items start "pending" and are "running" while generated.
+STATUSES = ("created", "duplicate", "rejected", "failed")
+
+# app.job_store kind of batches
+KIND = "batch"
+# Reported for a batch whose worker stopped before the batch finished
+LOST = {"status": "failed", "error": "The worker running this batch stopped"}
+
+
+@dataclass
+class BatchItem:
+    index: int
+    status: str = "pending"
+    program_id: Optional[int] = None
+    duplicate_of: Optional[int] = None  # index of the identical request generated instead
+    reused_from: Optional[int] = None  # id of the saved program adapted instead
+    error: Optional[str] = None
+    violations: List[dict] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return {key: value for key, value in asdict(self).items() if value not in (None, [])}
+
+
+@dataclass
+class BatchJob:
+    id: str
+    requests: List[WorkoutRequest]
+    items: List[BatchItem]
+    provider_batch: bool = False
+    mode: str = "pool"  # or "provider_batch"
+    status: str = "running"
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    # index of a generated request -> indexes of its duplicates
+    duplicates: Dict[int, List[int]] = field(default_factory=dict)
+
+    def counts(self) -> Dict[str, int]:
+        counts = {status: 0 for status in ("pending", "running") + STATUSES}
+        for item in self.items:
+            counts[item.status] += 1
+        return counts
+
+    def as_dict(self, include_items: bool = True) -> Dict[str, Any]:
+        body = {
+            "batch_id": self.id,
+            "status": self.status,
+            "mode": self.mode,
+            "total": len(self.items),
+            "unique": len(self.items) - sum(len(d) for d in self.duplicates.values()),
+            "counts": self.counts(),
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if include_items:
+            body["items"] = [item.as_dict() for item in list(self.items)]
+        return body
+
+
+def request_key(request: WorkoutRequest) -> str:
+    """Identity of a request for de-duplication (focus areas in any order/case)."""
+    data = request.model_dump(mode="json")
+    if data["focus_areas"]:
+        data["focus_areas"] = sorted({area.strip().lower() for area in data["focus_areas"]})
+    return json.dumps(data, sort_keys=True)
+
+
+_jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=max(1, settings.batch_max_concurrency),
+                    thread_name_prefix="batch-generate",
+                )
+    return _pool
+
+
+def create_job(batch: BatchGenerateRequest) -> BatchJob:
+    """Register a job for ``batch``, with duplicates already resolved."""
+    job = BatchJob(
+        id=uuid.uuid4().hex,
+        requests=batch.requests,
+        items=[BatchItem(index) for index in range(len(batch.requests))],
+        provider_batch=batch.provider_batch,
+    )
+    first_of: Dict[str, int] = {}
+    for index, request in enumerate(batch.requests):
+        original = first_of.setdefault(request_key(request), index)
+        if original != index:
+            job.items[index].duplicate_of = original
+            job.duplicates.setdefault(original, []).append(index)
+
+    with _jobs_lock:
+        _jobs[job.id] = job
+        finished = [key for key, old in _jobs.items() if old.status == "done"]
+        for key in finished[:max(0, len(finished) - settings.batch_keep_jobs)]:
+            del _jobs[key]
+    _publish(job)
+    return job
+
+
+def get_job(job_id: str) -> Optional[BatchJob]:
+    """A batch running in, or recently finished by, this worker."""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+async def load_job(db: AsyncSession, job_id: str) -> Optional[Dict[str, Any]]:
+    """State of a batch of any worker: this worker's, else the stored one."""
+    job = get_job(job_id)
+    if job is not None:
+        return job.as_dict()
+    return await load_state(db, job_id, KIND, LOST)
+
+
+def _publish(job: BatchJob) -> None:
+    # as_dict is evaluated when written: once per poll however many items settle
+    publish(KIND, job.id, job.as_dict, finished=job.status == "done", keep=settings.batch_keep_jobs)
+
+
+def _settle(job: BatchJob, index: int, status: str, **fields) -> None:
+    """Set an item's final status; its duplicates share the outcome."""
+    item = job.items[index]
+    item.status = status
+    for name, value in fields.items():
+        setattr(item, name, value)
+    batch_items.inc(status=status)
+    for duplicate in job.duplicates.get(index, []):
+        other = job.items[duplicate]
+        other.status = "duplicate" if status == "created" else status
+        other.program_id, other.error = item.program_id, item.error
+        batch_items.inc(status=other.status)
+    _publish(job)
+
+
+def _save_chunk(db, job: BatchJob, chunk: List[Tuple[int, TrainingProgram, list]]) -> None:
+    try:
+        with span("db_save", provider=settings.llm_provider.lower(), items=len(chunk)):
+            saved = ProgramRepository.save_programs(
+                db,
+                [
+                    (program, job.requests[index].model_dump(), job.items[index].reused_from)
+                    for index, program, _ in chunk
+                ],
+            )
+    except Exception as e:
+        db.rollback()
+        logger.exception("Saving a batch chunk of %d programs failed", len(chunk))
+        for index, _, _ in chunk:
+            _settle(job, index, "failed", error=f"Error saving program: {e}")
+        return
+    for (index, _, violations), row in zip(chunk, saved):
+        _settle(job, index, "created", program_id=row.id, violations=violations)
+
+
+def _checked(job: BatchJob, index: int, produce: Callable[[], TrainingProgram]):
+    """Run ``produce`` and the plan rules; (program, violations) or None if settled."""
+    try:
+        program, violations = check_program(produce())
+    except PlanValidationError as e:
+        _settle(job, index, "rejected", error=str(e),
+                violations=[violation.as_dict() for violation in e.violations])
+        return None
+    except Exception as e:
+        _settle(job, index, "failed", error=f"Error generating program: {e}")
+        return None
+    return program, [violation.as_dict() for violation in violations]
+
+
+def _generate(job: BatchJob, index: int, agent):
+    job.items[index].status = "running"
+    _publish(job)
+    return _checked(job, index, lambda: agent.generate_program(job.requests[index]))
+
+
+def _reuse_results(job: BatchJob, unique: List[int], remaining: List[int]):
+    """Yield (index, checked result) for requests adapted from saved programs.
+
+    Requests without a close enough match are appended to ``remaining``.
+    """
+    for index in unique:
+        try:
+            found = find_reusable(job.requests[index])
+        except Exception:
+            logger.exception("Similar program lookup failed for batch item %d", index)
+            found = None
+        if found is None:
+            remaining.append(index)
+            continue
+        program, match = found
+        job.items[index].reused_from = match.program_id
+        yield index, _checked(job, index, lambda: program)
+
+
+def _provider_results(job: BatchJob, unique: List[int], agent):
+    """Yield (index, checked result) from one provider batch."""
+    for index in unique:
+        job.items[index].status = "running"
+    _publish(job)
+    try:
+        results = agent.generate_programs_batch([job.requests[index] for index in unique])
+    except Exception as e:
+        logger.exception("Provider batch of %d requests failed", len(unique))
+        results = [e] * len(unique)
+
+    def produce(result):
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    for index, result in zip(unique, results):
+        yield index, _checked(job, index, lambda: produce(result))
+
+
+def _pool_results(job: BatchJob, unique: List[int], agent):
+    """Yield (index, checked result) as pool workers finish."""
+    pool = _get_pool()
+    futures = {pool.submit(_generate, job, index, agent): index for index in unique}
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+
+def run_job(job: BatchJob, agent) -> None:
+    """Generate, check and save every unique request of ``job`` (blocking)."""
+    unique = [item.index for item in job.items if item.duplicate_of is None]
+    use_provider_batch = job.provider_batch and hasattr(agent, "generate_programs_batch")
+    job.mode = "provider_batch" if use_provider_batch else "pool"
+    generate = (_provider_results if use_provider_batch else _pool_results)
+
+    def results():
+        remaining = unique
+        if settings.similarity_reuse:
+            remaining = []
+            yield from _reuse_results(job, unique, remaining)
+        if remaining:
+            yield from generate(job, remaining, agent)
+
+    chunk: List[Tuple[int, TrainingProgram, list]] = []
+    db = SessionLocal()
+    try:
+        for index, checked in results():
+            if checked is None:
+                continue
+            chunk.append((index, *checked))
+            if len(chunk) >= max(1, settings.batch_save_chunk_size):
+                _save_chunk(db, job, chunk)
+                chunk = []
+        if chunk:
+            _save_chunk(db, job, chunk)
+    except Exception as e:
+        logger.exception("Batch %s failed", job.id)
+        for item in job.items:
+            if item.status in ("pending", "running") and item.duplicate_of is None:
+                _settle(job, item.index, "failed", error=f"Batch failed: {e}")
+    finally:
+        db.close()
+        job.status = "done"
+        job.finished_at = datetime.utcnow()
+        _publish(job)
+
+
+def start_job(job: BatchJob, agent) -> None:
+    """Run ``job`` on a background thread."""
+    threading.Thread(
+        target=run_job, args=(job, agent), name=f"batch-{job.id[:8]}", daemon=True
+    ).start()
+
+
+def _reset_after_fork():
+    global _jobs_lock, _pool, _pool_lock
+    _jobs.clear()
+    _jobs_lock = threading.Lock()
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,279 @@
+"""Read cache for serialized program responses.
+
+Entries are the final response bytes (already encoded for the client's
+Accept-Encoding), keyed by program id, view (the full program or its week
+summary) and encoding. The in-process LRU is bounded by total size in
+bytes. An optional Redis backend lets several workers share warm entries;
+memory:// is a per-process stand-in for it, for tests and development only.
+
+Invalidation only reaches this process's LRU and the shared backend, so
+another worker may still hold an entry for a program that was updated or
+deleted. Readers therefore pass the program's current content hash (one
+indexed lookup) and an entry cached for a different hash is dropped.
+"""
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Protocol
+
+from app.config import settings
+
+ENCODINGS = ("identity", "gzip", "br")
+VIEWS = ("program", "summary")
+
+
+@dataclass
+class CachedResponse:
+    """A cached response body and the metadata needed to rebuild headers."""
+    content_hash: str
+    encoding: Optional[str]
+    body: bytes
+
+    def to_bytes(self) -> bytes:
+        header = f"{self.content_hash}|{self.encoding or ''}|".encode("ascii")
+        return header + self.body
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CachedResponse":
+        content_hash, encoding, body = data.split(b"|", 2)
+        return cls(content_hash.decode("ascii"), encoding.decode("ascii") or None, body)
+
+
+class CacheBackend(Protocol):
+    """Minimal byte-oriented key/value interface of a shared cache server."""
+
+    def get(self, key: str) -> Optional[bytes]: ...
+
+    def set(self, key: str, value: bytes, ttl_seconds: int) -> None: ...
+
+    def delete(self, *keys: str) -> None: ...
+
+
+class LRUByteCache:
+    """Thread-safe LRU cache bounded by the total size of its values."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return  # would evict everything else and still not fit
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                value = self._entries.pop(key, None)
+                if value is not None:
+                    self._size -= len(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class MemoryCacheBackend:
+    """In-process stand-in for a shared cache server (development and tests)."""
+
+    def __init__(self):
+        self._data: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: int) -> None:
+        with self._lock:
+            self._data[key] = value
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+class RedisCacheBackend:
+    """Shared cache on a Redis-compatible server (requires the `redis` package)."""
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.25)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: int) -> None:
+        self._client.set(key, value, ex=ttl_seconds or None)
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self._client.delete(*keys)
+
+
+def backend_from_url(url: Optional[str]) -> Optional[CacheBackend]:
+    """Build the shared backend for ``program_cache_url`` (None = local only)."""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryCacheBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCacheBackend(url)
+    raise ValueError(f"Unsupported program cache URL: {url!r}")
+
+
+class ProgramResponseCache:
+    """Two-level cache of program responses: local LRU, then shared backend."""
+
+    def __init__(
+        self,
+        max_bytes: int,
+        shared: Optional[CacheBackend] = None,
+        ttl_seconds: int = 0,
+        key_prefix: str = "tri:program:",
+    ):
+        self.local = LRUByteCache(max_bytes)
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self.key_prefix = key_prefix
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.shared_errors = 0
+        self.stale = 0  # entries found for an outdated version of the program
+
+    def _key(self, program_id: int, encoding: Optional[str], view: str = "program") -> str:
+        suffix = "" if view == "program" else f"/{view}"
+        return f"{self.key_prefix}{program_id}{suffix}:{encoding or 'identity'}"
+
+    def get(
+        self,
+        program_id: int,
+        encoding: Optional[str],
+        view: str = "program",
+        content_hash: Optional[str] = None,
+    ) -> Optional[CachedResponse]:
+        """Look up the response for a program as served to ``encoding`` clients.
+
+        With ``content_hash`` (the ETag the response would have now), an entry
+        cached for another version of the program is dropped and missed.
+        """
+        key = self._key(program_id, encoding, view)
+        data = self.local.get(key)
+        if data is None and self.shared is not None:
+            try:
+                data = self.shared.get(key)
+            except Exception:
+                # A cache outage must never fail reads; fall through to the DB.
+                self.shared_errors += 1
+                data = None
+            if data is None:
+                self.shared_misses += 1
+            else:
+                self.shared_hits += 1
+                self.local.set(key, data)
+        if data is None:
+            return None
+        cached = CachedResponse.from_bytes(data)
+        if content_hash is not None and cached.content_hash != content_hash:
+            self.stale += 1
+            self.local.delete(key)
+            return None
+        return cached
+
+    def put(
+        self, program_id: int, encoding: Optional[str], response: CachedResponse, view: str = "program"
+    ) -> None:
+        key = self._key(program_id, encoding, view)
+        data = response.to_bytes()
+        self.local.set(key, data)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, data, self.ttl_seconds)
+            except Exception:
+                self.shared_errors += 1
+
+    def invalidate(self, program_id: int) -> None:
+        """Drop every cached view and encoding of a program (after delete or update)."""
+        keys = [self._key(program_id, encoding, view) for view in VIEWS for encoding in ENCODINGS]
+        self.local.delete(*keys)
+        if self.shared is not None:
+            try:
+                self.shared.delete(*keys)
+            except Exception:
+                self.shared_errors += 1
+
+    def stats(self) -> Dict[str, int]:
+        stats = {**self.local.stats(), "stale": self.stale}
+        if self.shared is not None:
+            stats.update(
+                shared_hits=self.shared_hits,
+                shared_misses=self.shared_misses,
+                shared_errors=self.shared_errors,
+            )
+        return stats
+
+
+_program_cache: Optional[ProgramResponseCache] = None
+
+
+def get_program_cache() -> Optional[ProgramResponseCache]:
+    """Return the process-wide program cache, or None when disabled."""
+    global _program_cache
+    if settings.program_cache_max_bytes <= 0:
+        return None
+    if _program_cache is None:
+        _program_cache = ProgramResponseCache(
+            max_bytes=settings.program_cache_max_bytes,
+            shared=backend_from_url(settings.program_cache_url),
+            ttl_seconds=settings.program_cache_ttl_seconds,
+        )
+    return _program_cache
+
+
+def _reset_after_fork():
+    # The cache is per-process: a forked worker starts empty (and reconnects to
+    # the shared backend, if any) instead of inheriting the parent's locks.
+    global _program_cache
+    _program_cache = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -4,7 +4,7 @@ from typing import Optional
 
 
 class Settings(BaseSettings):
-    # LLM Provider: "anthropic" or "azure_ai"
+    # LLM Provider: "anthropic", "azure_ai" or "replay" (recorded responses, no API calls)
     llm_provider: str = Field(
         default="anthropic",
         validation_alias=AliasChoices("LLM_PROVIDER", "llm_provider"),
@@ -76,7 +76,139 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str = "sqlite:///./workouts.db"
-    
+    # Async driver URL; derived from database_url when unset
+    # (sqlite -> sqlite+aiosqlite, postgresql -> postgresql+asyncpg).
+    async_database_url: Optional[str] = None
+
+    # Connection pool (server databases such as PostgreSQL; ignored for SQLite)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800  # seconds; stay below server/proxy idle timeouts
+
+    # SQLite connection profile (ignored for other backends).
+    # Applied as PRAGMAs on every new connection.
+    sqlite_journal_mode: str = "wal"
+    sqlite_synchronous: str = "normal"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64000  # negative = KiB, i.e. ~64 MB page cache
+
+    # Single-writer queue that batches small commits (SQLite only)
+    sqlite_write_queue: bool = True
+    sqlite_write_batch_size: int = 64
+    sqlite_write_batch_wait_ms: int = 2
+
+    # Storage format of new programs: "json", or "compact" (msgpack + zstd with
+    # interned strings; needs the msgpack and zstandard packages, else json).
+    # Existing rows are converted with migrate_program_storage.py.
+    program_storage_format: str = "json"
+    program_zstd_level: int = 3
+
+    # Provider rate limit: a token bucket shared by all provider requests in
+    # this process (per worker, so divide the quota between workers); 0 = off
+    llm_requests_per_minute: float = 0
+    llm_rate_limit_burst: int = 1
+
+    # Output token budgets (app/token_budget.py): max_output_tokens of each call
+    # is sized from a per-provider model of response length fitted to usage
+    llm_max_output_tokens: int = 0  # cap per call; 0 = the provider's (8192 / 16000)
+    token_budget_margin: float = 0.25  # minimum headroom over the predicted output
+    token_budget_decay: float = 0.98  # weight an observation keeps per newer one
+
+    # Batch generation (POST /api/workouts/batch)
+    batch_max_items: int = 500
+    batch_max_concurrency: int = 4  # provider calls in flight, across all batches
+    batch_save_chunk_size: int = 20  # programs saved per transaction
+    batch_poll_seconds: float = 30  # provider batch APIs (provider_batch=true)
+    batch_provider_timeout_seconds: float = 24 * 3600
+    batch_keep_jobs: int = 50  # finished batches kept for status queries
+
+    # Generation jobs with progress and cancellation (app/generation.py)
+    generation_max_concurrency: int = 4  # jobs calling the provider at once; the rest queue
+    generation_abandon_seconds: float = 15  # cancel a job nobody has watched for this long
+    generation_keep_jobs: int = 200  # finished jobs kept for status queries
+
+    # Programs too long for one response are generated a chunk of weeks per
+    # call, each with a summary of the previous chunk (app/progressive.py)
+    generation_chunk_weeks: int = 4  # weeks per call, fewer if the output cap requires
+    generation_chunk_parallel: int = 1  # chunks of one phase requested at once
+
+    # Rule checks on generated programs before they are saved (app/plan_validation.py):
+    # "off", "warn" (log and count), "reject" (HTTP 422) or "repair" (fix in place)
+    plan_validation: str = "warn"
+    plan_max_volume_increase: float = 0.15  # over the highest previous week
+    plan_max_workouts_per_week: int = 6  # i.e. at least one rest day; the prompts ask for 5-6
+    plan_volume_tolerance: float = 0.05  # weekly_volume_hours vs sum of workouts
+
+    # Reuse of saved programs (app/similarity.py): a request scoring at least
+    # similarity_threshold (0-1) against a saved program of the same goal and
+    # fitness level gets that program adapted to it instead of an LLM call
+    similarity_reuse: bool = False
+    similarity_threshold: float = 0.9
+
+    # Pre-generated programs for the most common requests (app/library.py);
+    # the library_* limits are defaults for `python -m app.library warm`
+    program_library: bool = True  # answer identical requests from the library
+    library_top_n: int = 50
+    library_window_days: float = 30  # request log window used to rank requests
+    library_min_requests: int = 2
+    library_max_age_hours: float = 7 * 24  # regenerate entries older than this
+
+    # Requests with current_week > 1 are derived from a saved full-length
+    # program with the same parameters when there is one (app/variants.py)
+    derive_current_week: bool = True
+
+    # Replanning of upcoming weeks from logged workouts (app/replanning.py)
+    replan_enabled: bool = True
+    replan_debounce_seconds: float = 60  # a burst of logs for a program -> one replan
+    replan_lookback_weeks: int = 2  # finished weeks compared with the plan
+    replan_min_change: float = 0.05  # smaller volume changes are left alone
+    replan_max_decrease: float = 0.3  # increases are capped by plan_max_volume_increase
+    replan_llm_change: float = 0.25  # regenerate the next week with the LLM above this
+    replan_llm_concurrency: int = 2  # LLM regenerations at once, per worker
+
+    # Calendar (ICS) and device (TCX) exports (app/exports.py)
+    export_cache_max_bytes: int = 32 * 1024 * 1024  # rendered exports; 0 disables
+    export_max_workers: int = 0  # bulk export processes; 0 = CPU count
+    export_bulk_max_programs: int = 200
+
+    # Program responses: HTTP caching and compression
+    program_cache_control: str = "private, no-cache"  # always revalidate via ETag
+    compression_min_bytes: int = 1024
+    gzip_level: int = 6
+    brotli_quality: int = 5
+
+    # In-process cache of program response bytes (0 disables it)
+    program_cache_max_bytes: int = 64 * 1024 * 1024
+    # Optional shared cache: "redis://host:6379/0", or "memory://" as a local stand-in
+    program_cache_url: Optional[str] = None
+    program_cache_ttl_seconds: int = 24 * 3600
+
+    # Serve the browser rendering benchmark at /benchmarks/render (synthetic
+    # plans, no authentication); for development only
+    benchmark_pages: bool = False
+
+    # Stream provider responses (needed to measure time-to-first-token)
+    llm_streaming: bool = True
+
+    # Replay provider (LLM_PROVIDER=replay): serves recorded programs/weeks from
+    # replay_dir, or synthetic ones, with simulated provider latency.
+    replay_dir: Optional[str] = None
+    replay_ttft_ms: float = 800  # median time to first token
+    replay_output_tokens_per_second: float = 80  # median streaming rate
+    replay_latency_sigma: float = 0.35  # lognormal spread of both, 0 = fixed
+    replay_chunk_tokens: int = 16  # tokens per streamed chunk
+    replay_speedup: float = 1.0  # divide all simulated delays by this
+    replay_seed: Optional[int] = None
+
+    # Metrics and tracing: /metrics is always served; spans are exported to
+    # OpenTelemetry (OTLP, configured via the standard OTEL_* variables) when
+    # enabled and the opentelemetry packages are installed.
+    otel_enabled: bool = False
+    otel_service_name: str = "triathlon-program-generator"
+
     class Config:
         env_file = ".env"
 
@@ -1,13 +1,140 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import create_engine, event, cast, inspect, select, update, Column, Integer, String, Float, DateTime, Text, LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import URL, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.types import UserDefinedType
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Any, Optional
+import hashlib
+import os
+import threading
 from app.config import settings
+from app.storage import FORMAT_COMPACT, decode_compact_json
+from app.write_queue import WriteQueue
 
 Base = declarative_base()
-engine = create_engine(settings.database_url, connect_args={"check_same_thread": False})
+
+DATABASE_URL = make_url(settings.database_url)
+BACKEND = DATABASE_URL.get_backend_name()
+IS_SQLITE = BACKEND == "sqlite"
+IS_POSTGRES = BACKEND == "postgresql"
+
+# Async DBAPI drivers used when deriving async_database_url.
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+}
+
+
+def _engine_kwargs(url: URL) -> dict[str, Any]:
+    """Pick connect/pool arguments appropriate for the database backend."""
+    if url.get_backend_name() == "sqlite":
+        kwargs: dict[str, Any] = {"connect_args": {"check_same_thread": False}}
+        if url.database in (None, "", ":memory:"):
+            # One shared connection, otherwise every session sees an empty DB.
+            kwargs["poolclass"] = StaticPool
+        return kwargs
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+
+
+def async_database_url() -> URL:
+    """URL for the async engine, derived from database_url unless configured."""
+    if settings.async_database_url:
+        return make_url(settings.async_database_url)
+    driver = ASYNC_DRIVERS.get(BACKEND)
+    if driver is None:
+        raise ValueError(f"No async driver known for database backend {BACKEND!r}")
+    return DATABASE_URL.set(drivername=f"{BACKEND}+{driver}")
+
+
+def _sqlite_pragmas() -> list[str]:
+    """PRAGMA statements for the configured SQLite profile."""
+    return [
+        f"PRAGMA journal_mode={settings.sqlite_journal_mode}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}",
+        f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}",
+        f"PRAGMA cache_size={int(settings.sqlite_cache_size)}",
+    ]
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the SQLite profile to every new DBAPI connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in _sqlite_pragmas():
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL))
+if IS_SQLITE:
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The async engine is created on first use so the async driver (aiosqlite,
+# asyncpg, ...) is only required by deployments that use it.
+_async_engine = None
+_async_sessionmaker = None
+
+
+def get_async_engine():
+    """Return the shared AsyncEngine, creating it on first use."""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        url = async_database_url()
+        _async_engine = create_async_engine(url, **_engine_kwargs(url))
+        if url.get_backend_name() == "sqlite":
+            event.listen(_async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return _async_engine
+
+
+def get_async_sessionmaker():
+    """Return the AsyncSession factory bound to the async engine."""
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _async_sessionmaker = async_sessionmaker(
+            get_async_engine(), autoflush=False, expire_on_commit=False
+        )
+    return _async_sessionmaker
+
+
+class JSONBText(UserDefinedType):
+    """PostgreSQL JSONB column exchanged with Python as JSON text.
+
+    Values are cast to/from text in SQL, so the driver never parses the
+    document and callers keep working with the serialized string.
+    """
+    cache_ok = True
+
+    def get_col_spec(self, **kw):
+        return "JSONB"
+
+    def bind_expression(self, bindvalue):
+        return cast(bindvalue, JSONB)
+
+    def column_expression(self, colexpr):
+        return cast(colexpr, Text)
+
+
+# Program documents: JSONB on PostgreSQL, plain TEXT everywhere else.
+ProgramJSON = Text().with_variant(JSONBText(), "postgresql")
+
 
 class SavedProgram(Base):
     """Database model for saved training programs."""
@@ -19,8 +146,55 @@ class SavedProgram(Base):
     fitness_level = Column(String, nullable=False)
     duration_weeks = Column(Integer, nullable=False)
     available_hours_per_week = Column(Integer, nullable=False)
-    program_json = Column(Text, nullable=False)  # Store full program as JSON
+    program_json = Column(ProgramJSON, nullable=False)  # Store full program as JSON
     notes = Column(Text)
+    content_hash = Column(String(64))  # sha256 of program_json, used as the ETag
+    week_offsets = Column(Text)  # JSON [[start, end], ...] of each week in program_json
+    week_summary = Column(Text)  # JSON per-week focus/volume/distance, no workouts
+    # NULL/"json": the document is in program_json. "msgpack+zstd": it is in
+    # program_blob (see app.storage) and program_json holds a placeholder.
+    program_format = Column(String(16))
+    program_blob = Column(LargeBinary)
+    request_json = Column(Text)  # the WorkoutRequest the program was made for
+    source_program_id = Column(Integer)  # set when adapted from a similar program
+    replanned_week = Column(Integer)  # program week of the last replan (app/replanning.py)
+
+    @property
+    def program_text(self) -> str:
+        """The program JSON document, decoded from program_blob if compact."""
+        if self.program_format != FORMAT_COMPACT:
+            return self.program_json
+        text = self.__dict__.get("_program_text")
+        if text is None:
+            text = self._program_text = decode_compact_json(self.program_blob)
+        return text
+
+
+class LibraryProgram(Base):
+    """Pre-generated program for a commonly requested parameter set (app/library.py)."""
+    __tablename__ = "program_library"
+
+    id = Column(Integer, primary_key=True)
+    request_key = Column(Text, nullable=False, unique=True, index=True)  # app.batch.request_key
+    request_json = Column(Text, nullable=False)
+    program_json = Column(Text, nullable=False)
+    request_count = Column(Integer)  # requests in the log window when last warmed
+    generated_at = Column(DateTime, default=datetime.utcnow)
+    program_id = Column(Integer)  # first saved copy; later copies reference it as their source
+
+
+class JobState(Base):
+    """State of a background job, shared by all workers (app/job_store.py)."""
+    __tablename__ = "job_states"
+
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False, index=True)  # "generation" or "batch"
+    status = Column(String, nullable=False)
+    state_json = Column(Text, nullable=False)  # the job's as_dict()
+    cancel_reason = Column(String)  # set by any worker; the owner stops the job
+    updated_at = Column(DateTime, default=datetime.utcnow)  # owner heartbeat
+    watched_at = Column(DateTime)  # last poll of an event stream on another worker
+    finished_at = Column(DateTime)
 
 
 class WorkoutHistory(Base):
@@ -38,15 +212,165 @@ class WorkoutHistory(Base):
     rating = Column(Integer)  # 1-5 difficulty/satisfaction rating
 
 
+# Writes go through a single background writer on SQLite; objects must stay
+# readable after the writer's session commits and closes.
+WriterSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+_write_queue: Optional[WriteQueue] = None
+
+
+def get_write_queue() -> Optional[WriteQueue]:
+    """Return the shared write queue, or None when writes commit directly."""
+    global _write_queue
+    if not (IS_SQLITE and settings.sqlite_write_queue):
+        return None
+    if _write_queue is None:
+        _write_queue = WriteQueue(
+            WriterSessionLocal,
+            max_batch=settings.sqlite_write_batch_size,
+            max_wait_ms=settings.sqlite_write_batch_wait_ms,
+        )
+    return _write_queue
+
+
+def content_hash_for(program_json: str) -> str:
+    """Content hash of a stored program document."""
+    return hashlib.sha256(program_json.encode("utf-8")).hexdigest()
+
+
+def _add_missing_columns(bind) -> None:
+    """Add nullable columns that exist on the models but not yet in the tables.
+
+    create_all() only creates missing tables; this keeps databases created by
+    older versions usable without a migration tool.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=bind.dialect)
+                conn.exec_driver_sql(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'
+                )
+
+
+def _backfill_content_hashes(bind, batch_size: int = 500) -> None:
+    """Compute content_hash for rows saved before the column existed."""
+    with bind.begin() as conn:
+        while True:
+            rows = conn.execute(
+                select(SavedProgram.id, SavedProgram.program_json)
+                .where(SavedProgram.content_hash.is_(None))
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            for program_id, program_json in rows:
+                conn.execute(
+                    update(SavedProgram)
+                    .where(SavedProgram.id == program_id)
+                    .values(content_hash=content_hash_for(program_json))
+                )
+
+
+# Arbitrary application-wide key for pg_advisory_lock.
+_SCHEMA_LOCK_KEY = 0x7472690001
+
+
+@contextmanager
+def _schema_lock():
+    """Serialize schema creation/migration across processes.
+
+    Several gunicorn workers (or a preloading master and a startup script)
+    may call init_db() at the same time; only one of them should create or
+    alter tables. PostgreSQL uses an advisory lock, SQLite a lock file next to
+    the database.
+    """
+    if IS_POSTGRES:
+        with engine.connect() as conn:
+            conn.exec_driver_sql(f"SELECT pg_advisory_lock({_SCHEMA_LOCK_KEY})")
+            try:
+                yield
+            finally:
+                conn.exec_driver_sql(f"SELECT pg_advisory_unlock({_SCHEMA_LOCK_KEY})")
+        return
+    if IS_SQLITE and DATABASE_URL.database not in (None, "", ":memory:"):
+        try:
+            import fcntl
+        except ImportError:  # Windows: single-process dev server only
+            yield
+            return
+        with open(f"{DATABASE_URL.database}.init-lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+    yield
+
+
 def init_db():
-    """Initialize the database tables."""
-    Base.metadata.create_all(bind=engine)
+    """Initialize the database tables (safe to call from several processes)."""
+    with _schema_lock():
+        Base.metadata.create_all(bind=engine)
+        _add_missing_columns(engine)
+        _backfill_content_hashes(engine)
+
+
+_db_ready = False
+_db_ready_lock = threading.Lock()
+
+
+def ensure_db() -> None:
+    """Run init_db() once per process, on first use rather than at import."""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_ready_lock:
+        if not _db_ready:
+            init_db()
+            _db_ready = True
+
+
+def _reset_after_fork():
+    """Drop connections and threads inherited from the parent process.
+
+    Pooled connections must not be shared across a fork (e.g. gunicorn
+    --preload); the child opens its own on first use.
+    """
+    global _write_queue, _async_engine, _async_sessionmaker, _db_ready_lock
+    engine.dispose(close=False)
+    _db_ready_lock = threading.Lock()
+    _write_queue = None
+    _async_engine = None
+    _async_sessionmaker = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def get_db():
     """Dependency for getting database sessions."""
+    ensure_db()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for getting async database sessions."""
+    if not _db_ready:
+        from starlette.concurrency import run_in_threadpool
+
+        await run_in_threadpool(ensure_db)
+    async with get_async_sessionmaker()() as db:
+        yield db
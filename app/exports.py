@@ -0,0 +1,371 @@
+"""Calendar (ICS) and device workout (TCX) exports of saved programs.
+
+Exports are rendered week by week from the stored document: the week index
+(app.storage) locates every week in the program JSON, so each week is parsed
+only when it is written and a streamed response starts before the last week
+is converted. Finished exports are kept in an LRU of EXPORT_CACHE_MAX_BYTES
+keyed by content hash, format and start date, so a replanned program (new
+hash) never serves a stale file. Bulk exports of many programs render on a
+pool of EXPORT_MAX_WORKERS processes.
+
+Workouts have no weekday in the program; the workouts of a week are spread
+over its first six days, leaving the seventh as the rest day. ICS events are
+all-day events, so athletes pick the time themselves.
+"""
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from app.cache import LRUByteCache
+from app.config import settings
+from app.models import loads_json
+
+# format -> (media type, file extension)
+FORMATS: Dict[str, Tuple[str, str]] = {
+    "ics": ("text/calendar", "ics"),  # Starlette adds the charset
+    "tcx": ("application/vnd.garmin.tcx+xml", "tcx"),
+}
+
+_TCX_SPORTS = {"run": "Running", "bike": "Biking", "swim": "Other"}
+_TCX_MAX_STEPS = 20  # StepId_t is 1-20
+_TCX_NAME_LENGTH = 15  # RestrictedToken_t
+
+
+def workout_day(index: int, count: int) -> int:
+    """Day offset (0-5) within its week of the ``index``-th of ``count`` workouts."""
+    return index * 6 // max(1, count)
+
+
+def iter_weeks(program_text: str, offsets: Optional[List[List[int]]]) -> Iterator[dict]:
+    """Parse the weeks of a stored program one at a time.
+
+    ``offsets`` only index the text as it was stored; without them (JSONB
+    re-serializes documents on PostgreSQL) the document is parsed whole.
+    """
+    if offsets is None:
+        yield from loads_json(program_text)["weeks"]
+        return
+    for start, end in offsets:
+        yield loads_json(program_text[start:end])
+
+
+def _main_set_lines(workout: dict) -> List[str]:
+    lines = []
+    for interval in workout.get("main_set") or []:
+        amount = []
+        if interval.get("duration_minutes"):
+            amount.append(f"{interval['duration_minutes']} min")
+        if interval.get("distance_km"):
+            amount.append(f"{interval['distance_km']:g} km")
+        prefix = " / ".join(amount)
+        lines.append(
+            f"- {prefix + ' ' if prefix else ''}{interval['intensity']}: {interval['description']}"
+        )
+    return lines
+
+
+# --- ICS (RFC 5545) -----------------------------------------------------------
+
+def _ics_text(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _ics_line(name: str, value: str) -> str:
+    """A content line folded at 75 octets."""
+    line = f"{name}:{value}"
+    if line.isascii():
+        if len(line) <= 75:
+            return line + "\r\n"
+        parts = [line[:75]] + [line[i:i + 74] for i in range(75, len(line), 74)]
+        return "\r\n ".join(parts) + "\r\n"
+    parts, current, size = [], [], 0
+    for char in line:
+        octets = len(char.encode("utf-8"))
+        if size + octets > (75 if not parts else 74):
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(char)
+        size += octets
+    parts.append("".join(current))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ics_header(program_id: int, name: str) -> str:
+    return (
+        "BEGIN:VCALENDAR\r\nVERSION:2.0\r\n"
+        "PRODID:-//Triathlon Program Generator//EN\r\nCALSCALE:GREGORIAN\r\n"
+        + _ics_line("X-WR-CALNAME", _ics_text(name))
+    )
+
+
+def _ics_week(program_id: int, week: dict, start: date, stamp: str) -> str:
+    week_start = start + timedelta(weeks=week["week_number"] - 1)
+    workouts = week["workouts"]
+    out = []
+    for index, workout in enumerate(workouts):
+        day = week_start + timedelta(days=workout_day(index, len(workouts)))
+        distance = workout.get("total_distance_km")
+        description = [
+            f"Week {week['week_number']}: {week['focus']}",
+            f"{workout['total_duration_minutes']} min"
+            + (f", {distance:g} km" if distance else ""),
+            f"Warm-up: {workout['warmup']}",
+            "Main set:",
+            *_main_set_lines(workout),
+            f"Cool-down: {workout['cooldown']}",
+        ]
+        if workout.get("notes"):
+            description.append(workout["notes"])
+        uid = f"program-{program_id}-w{week['week_number']}-{index + 1}@triathlon-program-generator"
+        out.append(
+            "BEGIN:VEVENT\r\n"
+            + _ics_line("UID", uid)
+            + f"DTSTAMP:{stamp}\r\n"
+            + f"DTSTART;VALUE=DATE:{day:%Y%m%d}\r\n"
+            + f"DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}\r\n"
+            + _ics_line("SUMMARY", _ics_text(f"{workout['sport'].capitalize()}: {workout['title']}"))
+            + _ics_line("DESCRIPTION", _ics_text("\n".join(description)))
+            + _ics_line("CATEGORIES", workout["sport"].upper())
+            + "TRANSP:TRANSPARENT\r\nEND:VEVENT\r\n"
+        )
+    return "".join(out)
+
+
+# --- TCX workouts (Garmin Training Center v2) ---------------------------------
+
+def _tcx_duration(minutes: Optional[float], km: Optional[float]) -> str:
+    if minutes:
+        return f'<Duration xsi:type="Time_t"><Seconds>{int(minutes * 60)}</Seconds></Duration>'
+    if km:
+        return f'<Duration xsi:type="Distance_t"><Meters>{int(km * 1000)}</Meters></Duration>'
+    return '<Duration xsi:type="UserInitiated_t"/>'
+
+
+def _tcx_step(step_id: int, name: str, duration: str, intensity: str = "Active") -> str:
+    return (
+        f'<Step xsi:type="Step_t"><StepId>{step_id}</StepId>'
+        f"<Name>{escape(name[:_TCX_NAME_LENGTH])}</Name>{duration}"
+        f'<Intensity>{intensity}</Intensity><Target xsi:type="None_t"/></Step>'
+    )
+
+
+_TCX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n<Workouts>\n'
+)
+_TCX_FOOTER = "</Workouts>\n</TrainingCenterDatabase>\n"
+
+
+def _tcx_week(program_id: int, week: dict, start: date, stamp: str) -> str:
+    week_start = start + timedelta(weeks=week["week_number"] - 1)
+    workouts = week["workouts"]
+    out = []
+    for index, workout in enumerate(workouts):
+        day_offset = workout_day(index, len(workouts))
+        intervals = (workout.get("main_set") or [])[:_TCX_MAX_STEPS - 2]
+        interval_minutes = sum(interval.get("duration_minutes") or 0 for interval in intervals)
+        # Warm-up and cool-down share whatever the main set leaves of the workout.
+        edge_minutes = max(0, workout["total_duration_minutes"] - interval_minutes) / 2
+        steps = [_tcx_step(1, "Warm-up", _tcx_duration(edge_minutes, None))]
+        for interval in intervals:
+            steps.append(_tcx_step(
+                len(steps) + 1,
+                interval["intensity"],
+                _tcx_duration(interval.get("duration_minutes"), interval.get("distance_km")),
+            ))
+        steps.append(_tcx_step(
+            len(steps) + 1, "Cool-down", _tcx_duration(edge_minutes, None), "Resting"
+        ))
+        name = f"W{week['week_number']}D{day_offset + 1} {workout['title']}"
+        notes = "\n".join([workout["warmup"], *_main_set_lines(workout), workout["cooldown"]])
+        out.append(
+            f'<Workout Sport="{_TCX_SPORTS.get(workout["sport"], "Other")}">'
+            f"<Name>{escape(name[:_TCX_NAME_LENGTH])}</Name>{''.join(steps)}"
+            f"<ScheduledOn>{week_start + timedelta(days=day_offset):%Y-%m-%d}</ScheduledOn>"
+            f"<Notes>{escape(notes)}</Notes></Workout>\n"
+        )
+    return "".join(out)
+
+
+def iter_export(
+    program_id: int,
+    program_text: str,
+    offsets: Optional[List[List[int]]],
+    fmt: str,
+    start: date,
+    created_at: datetime,
+) -> Iterator[str]:
+    """Yield an export of a stored program piece by piece, one week at a time."""
+    stamp = f"{created_at:%Y%m%dT%H%M%SZ}"  # fixed, so renders are byte-identical
+    if fmt == "ics":
+        yield _ics_header(program_id, f"Triathlon program #{program_id}")
+        render_week, footer = _ics_week, "END:VCALENDAR\r\n"
+    elif fmt == "tcx":
+        yield _TCX_HEADER
+        render_week, footer = _tcx_week, _TCX_FOOTER
+    else:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {sorted(FORMATS)}")
+    for week in iter_weeks(program_text, offsets):
+        yield render_week(program_id, week, start, stamp)
+    yield footer
+
+
+def render_export(
+    program_id: int,
+    program_text: str,
+    offsets: Optional[List[List[int]]],
+    fmt: str,
+    start: date,
+    created_at: datetime,
+) -> bytes:
+    """The whole export as bytes (the unit of work of the bulk process pool)."""
+    pieces = iter_export(program_id, program_text, offsets, fmt, start, created_at)
+    return "".join(pieces).encode("utf-8")
+
+
+def export_filename(program_id: int, fmt: str) -> str:
+    return f"triathlon-program-{program_id}.{FORMATS[fmt][1]}"
+
+
+def export_key(content_hash: str, fmt: str, start: date) -> str:
+    return f"{content_hash}/{fmt}/{start.isoformat()}"
+
+
+_cache: Optional[LRUByteCache] = None
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_export_cache() -> Optional[LRUByteCache]:
+    """This process's cache of rendered exports, or None when disabled."""
+    global _cache
+    if settings.export_cache_max_bytes <= 0:
+        return None
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = LRUByteCache(settings.export_cache_max_bytes)
+    return _cache
+
+
+def get_export_pool() -> ProcessPoolExecutor:
+    """Process pool for bulk exports, created on first use."""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                # spawn: forking a threaded server process is unsafe
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.export_max_workers or None,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def cached_stream(key: str, pieces: Iterator[str]) -> Iterator[bytes]:
+    """Pass ``pieces`` through as bytes and cache the whole export at the end."""
+    cache = get_export_cache()
+    chunks = []
+    for piece in pieces:
+        chunk = piece.encode("utf-8")
+        chunks.append(chunk)
+        yield chunk
+    if cache is not None:
+        cache.set(key, b"".join(chunks))
+
+
+def zip_exports(files: List[Tuple[str, bytes]]) -> bytes:
+    """A zip archive of (filename, content) pairs."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files:
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def bulk_export(sources: List[tuple], fmt: str, start: Optional[date] = None) -> bytes:
+    """Zip of exports of many programs (blocking).
+
+    ``sources`` are (program_id, content_hash, program_text, offsets,
+    created_at) tuples. Cached exports are reused; with more than one to
+    render, they render on the process pool.
+    """
+    cache = get_export_cache()
+    results: Dict[int, bytes] = {}
+    pending = []
+    for program_id, content_hash, program_text, offsets, created_at in sources:
+        first_day = start or created_at.date()
+        key = export_key(content_hash, fmt, first_day)
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            results[program_id] = cached
+        else:
+            pending.append((key, (program_id, program_text, offsets, fmt, first_day, created_at)))
+    if len(pending) == 1:
+        rendered = [render_export(*pending[0][1])]
+    else:
+        rendered = get_export_pool().map(render_export, *zip(*(args for _, args in pending)))
+    for (key, args), content in zip(pending, rendered):
+        results[args[0]] = content
+        if cache is not None:
+            cache.set(key, content)
+    return zip_exports([
+        (export_filename(source[0], fmt), results[source[0]]) for source in sources
+    ])
+
+
+def _reset_after_fork():
+    global _cache, _pool, _lock
+    _cache = None
+    _pool = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from sqlalchemy import select
+
+    from app.database import SavedProgram, SessionLocal, ensure_db
+    from app.repository import ProgramRepository
+
+    parser = argparse.ArgumentParser(description="Export saved programs as ICS or TCX")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ics")
+    parser.add_argument("--out", required=True, help="zip file to write")
+    parser.add_argument("--program-id", type=int, action="append", help="default: all")
+    parser.add_argument("--start", type=date.fromisoformat, help="first day (default: created)")
+    args = parser.parse_args()
+
+    ensure_db()
+    db = SessionLocal()
+    try:
+        ids = args.program_id or list(db.scalars(select(SavedProgram.id).order_by(SavedProgram.id)))
+        sources = []
+        for program_id in ids:
+            index = ProgramRepository.get_week_index(db, program_id)
+            if index is None:
+                raise SystemExit(f"Program {program_id} not found")
+            program = ProgramRepository.get_program(db, program_id)
+            sources.append((
+                program_id, index[0], program.program_text, index[1],
+                program.created_at or datetime.utcnow(),
+            ))
+    finally:
+        db.close()
+    with open(args.out, "wb") as f:
+        f.write(bulk_export(sources, args.format, args.start))
+    print(json.dumps({"programs": len(sources), "out": args.out}))
@@ -0,0 +1,454 @@
+"""Generation of a single program, as a request or as a cancellable job.
+
+``generate_and_save`` is the pipeline behind POST /api/workouts/generate:
+library entry, derived mid-cycle variant, similar saved program, and only
+then the LLM; the result is checked against the training rules and saved.
+
+That endpoint holds the connection until the program is saved and shows no
+progress, so users give up and resubmit and the provider does the work
+twice. POST /api/workouts/generations runs the same pipeline as a job and
+returns at once; GET .../events streams the job's state as server-sent
+events (queued, running with weeks done, then created, rejected, failed or
+cancelled). An identical request (app.batch.request_key) made while a job
+for it is in flight joins that job instead of starting another.
+
+Provider calls of jobs run on a pool of GENERATION_MAX_CONCURRENCY threads,
+so abandoned or excess jobs cannot hold more worker slots than that; the
+rest wait queued. A job is cancelled explicitly (POST .../cancel), or when
+its last event stream closed and no client reconnected within
+GENERATION_ABANDON_SECONDS. The agents receive the job as ``progress`` and
+call ``progress.check()`` before each provider call and between streamed
+chunks, so a streaming response is closed mid-way and the remaining weeks of
+a progressive generation are never requested.
+
+A job runs in the worker that accepted it, and only joins identical
+requests made to that worker. Its state is also published to the database
+(app.job_store), so the status, events and cancel routes work on any worker:
+another worker reads the stored state, streams it as it changes and records
+a cancel request, which the job's worker picks up within a second.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.batch import request_key
+from app.config import settings
+from app.database import SavedProgram, get_async_sessionmaker
+from app.job_store import POLL_SECONDS, load_state, publish, request_cancel, touch_watched
+from app.library import find_in_library, link_library_copy
+from app.metrics import generation_jobs, span
+from app.models import TrainingProgram, WorkoutRequest
+from app.plan_validation import PlanValidationError, check_program
+from app.repository import AsyncProgramRepository
+from app.similarity import find_reusable, get_similarity_index
+from app.variants import find_variant
+
+logger = logging.getLogger("app.generation")
+
+# Final job statuses; jobs start "queued" and are "running" once a pool
+# thread picks up their provider call.
+TERMINAL = ("created", "rejected", "failed", "cancelled")
+
+# Comment line sent on idle event streams, so proxies keep them open.
+KEEPALIVE_SECONDS = 15
+
+_WEEK_KEY = '"week_number"'
+
+# app.job_store kind of generation jobs
+KIND = "generation"
+# Reported for a job whose worker stopped before the job finished
+LOST = {"status": "failed", "error": "The worker running this generation stopped"}
+# How often (at most) an event stream following another worker's job marks it watched
+WATCH_SECONDS = 5
+
+
+async def generate_and_save(
+    db: AsyncSession,
+    request: WorkoutRequest,
+    generate: Callable[[WorkoutRequest], Awaitable[TrainingProgram]],
+) -> Tuple[SavedProgram, Dict[str, Any]]:
+    """Produce, check and save the program for ``request``.
+
+    ``generate`` is the LLM call, used when no stored program fits. Returns
+    the saved row and the extra response fields (violations, from_library,
+    derived_from, reused_from). Raises PlanValidationError on rejection.
+    """
+    provider = settings.llm_provider.lower()
+    with span("generation", provider=provider, duration_weeks=request.duration_weeks):
+        # Pre-generated for this exact request (PROGRAM_LIBRARY), derived from
+        # the full-length program (DERIVE_CURRENT_WEEK), or adapted from a
+        # similar saved program (SIMILARITY_REUSE)?
+        program = reused = variant = library = None
+        if settings.program_library:
+            with span("library_lookup", provider=provider):
+                library = await find_in_library(db, request)
+            if library:
+                program, library_source_id = library
+        from_library = program is not None
+        if program is None and settings.derive_current_week and request.current_week > 1:
+            with span("variant_lookup", provider=provider):
+                variant = await find_variant(db, request)
+            if variant:
+                program, variant_source_id = variant
+        if program is None and settings.similarity_reuse:
+            reused = await run_in_threadpool(find_reusable, request)
+        if reused:
+            program, match = reused
+        elif program is None:
+            program = await generate(request)
+
+        # Check the training rules (and repair or reject, per PLAN_VALIDATION)
+        with span("plan_validation", provider=provider):
+            program, violations = check_program(program)
+
+        # Copies point at the program they were made from, so the similarity
+        # index skips them; a variant keeps its own (shorter) duration.
+        request_data = request.model_dump()
+        if reused:
+            source_program_id = match.program_id
+        elif variant:
+            source_program_id = variant_source_id
+            request_data["duration_weeks"] = program.duration_weeks
+        elif from_library:
+            source_program_id = library_source_id
+        else:
+            source_program_id = None
+        with span("db_save", provider=provider):
+            saved_program = await AsyncProgramRepository.save_program(
+                db=db,
+                program=program,
+                request_data=request_data,
+                source_program_id=source_program_id,
+            )
+            if from_library and library_source_id is None:
+                # The entry's first copy, unless a concurrent request saved one first
+                first_copy_id = await link_library_copy(db, request, saved_program.id)
+                if first_copy_id is not None:
+                    await AsyncProgramRepository.set_source_program(db, saved_program.id, first_copy_id)
+                    get_similarity_index().discard(saved_program.id)
+
+    fields: Dict[str, Any] = {}
+    if violations:
+        fields["violations"] = [violation.as_dict() for violation in violations]
+    if from_library:
+        fields["from_library"] = True
+    if variant:
+        fields["derived_from"] = {"program_id": variant_source_id, "start_week": request.current_week}
+    if reused:
+        fields["reused_from"] = {"program_id": match.program_id, "similarity": round(match.score, 3)}
+    return saved_program, fields
+
+
+class GenerationCancelled(Exception):
+    """Raised in a job's provider call once the job has been cancelled."""
+
+
+@dataclass
+class GenerationJob:
+    id: str
+    request: WorkoutRequest
+    key: str
+    status: str = "queued"
+    weeks_done: int = 0
+    program_id: Optional[int] = None
+    error: Optional[str] = None
+    result: Dict[str, Any] = field(default_factory=dict)  # extra generate response fields
+    cancel_reason: Optional[str] = None  # "cancelled" or "abandoned"
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _weeks_streamed: int = 0
+    _tail: str = ""
+    _listeners: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = field(default_factory=list, repr=False)
+    _task: Optional[asyncio.Task] = field(default=None, repr=False)
+    _watched_at: Optional[datetime] = field(default=None, repr=False)  # by another worker
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def as_dict(self) -> Dict[str, Any]:
+        body = {
+            "generation_id": self.id,
+            "status": self.status,
+            "weeks_done": self.weeks_done,
+            "total_weeks": self.request.duration_weeks,
+            "cancel_requested": self.cancelled,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if self.program_id is not None:
+            body["program_id"] = self.program_id
+        if self.cancel_reason:
+            body["cancel_reason"] = self.cancel_reason
+        if self.error:
+            body["error"] = self.error
+        return {**body, **self.result}
+
+    # Called by the agents (from pool threads)
+
+    def check(self) -> None:
+        """Raise GenerationCancelled if the job was cancelled."""
+        if self._cancel.is_set():
+            raise GenerationCancelled(f"Generation {self.id} was {self.cancel_reason or 'cancelled'}")
+
+    def text(self, chunk: str) -> None:
+        """Count weeks in streamed output; a week is done once the next one starts."""
+        with self._lock:
+            text = self._tail + chunk
+            self._weeks_streamed += text.count(_WEEK_KEY)
+            self._tail = text[-(len(_WEEK_KEY) - 1):]
+            done = self._weeks_streamed - 1
+        if done > self.weeks_done:
+            self.week_done(done)
+
+    def week_done(self, week_number: int) -> None:
+        """Record that weeks up to ``week_number`` were generated."""
+        week_number = min(week_number, self.request.duration_weeks)
+        if week_number > self.weeks_done:
+            self._update(weeks_done=week_number)
+
+    # State changes and listeners
+
+    def _update(self, **fields) -> None:
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            state = self.as_dict()
+            listeners = list(self._listeners)
+        for loop, queue in listeners:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, state)
+            except RuntimeError:
+                pass  # loop closed
+        publish(
+            KIND, self.id, state, finished=state["status"] in TERMINAL,
+            keep=settings.generation_keep_jobs, on_poll=self._polled,
+        )
+
+    def _polled(self, cancel_reason: Optional[str], watched_at: Optional[datetime]) -> None:
+        """Apply what other workers stored for this job (app.job_store thread)."""
+        self._watched_at = watched_at
+        if cancel_reason and not self.cancelled:
+            self.cancel(cancel_reason)
+
+    def _finish(self, status: str, **fields) -> None:
+        self._update(status=status, finished_at=datetime.utcnow(), **fields)
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Ask the job to stop; False if it had already finished."""
+        if self.finished:
+            return False
+        if not self._cancel.is_set():
+            self.cancel_reason = reason
+            self._cancel.set()
+            self._update()
+        return True
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue of state snapshots for an event stream, starting with the current one."""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._listeners.append((asyncio.get_running_loop(), queue))
+            queue.put_nowait(self.as_dict())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._listeners = [entry for entry in self._listeners if entry[1] is not queue]
+            watched = bool(self._listeners)
+        if not watched and not self.finished:
+            asyncio.get_running_loop().call_later(
+                settings.generation_abandon_seconds, self._abandon_if_unwatched
+            )
+
+    def _abandon_if_unwatched(self) -> None:
+        with self._lock:
+            watched = bool(self._listeners)
+        abandon_after = timedelta(seconds=settings.generation_abandon_seconds)
+        if not watched and self._watched_at and datetime.utcnow() - self._watched_at < abandon_after:
+            # Followed by an event stream on another worker
+            asyncio.get_running_loop().call_later(
+                settings.generation_abandon_seconds, self._abandon_if_unwatched
+            )
+            return
+        if not watched and self.cancel("abandoned"):
+            logger.info("Generation %s abandoned by its client; cancelling", self.id)
+
+
+_jobs: "OrderedDict[str, GenerationJob]" = OrderedDict()
+_in_flight: Dict[str, GenerationJob] = {}  # request key -> unfinished job
+_jobs_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=max(1, settings.generation_max_concurrency),
+                    thread_name_prefix="generate",
+                )
+    return _pool
+
+
+async def _run(job: GenerationJob, agent_factory: Callable[[], Any]) -> None:
+    loop = asyncio.get_running_loop()
+
+    def call_agent(request: WorkoutRequest) -> TrainingProgram:
+        job.check()  # cancelled while queued: no provider call at all
+        job._update(status="running")
+        return agent_factory().generate_program(request, progress=job)
+
+    async def generate(request: WorkoutRequest) -> TrainingProgram:
+        program = await loop.run_in_executor(_get_pool(), call_agent, request)
+        job.check()  # cancelled during the last call: do not save
+        return program
+
+    try:
+        async with get_async_sessionmaker()() as db:
+            saved, fields = await generate_and_save(db, job.request, generate)
+        job._finish(
+            "created", program_id=saved.id, result=fields, weeks_done=job.request.duration_weeks
+        )
+    except GenerationCancelled:
+        job._finish("cancelled")
+    except PlanValidationError as e:
+        job._finish("rejected", error=str(e), result={
+            "violations": [violation.as_dict() for violation in e.violations]
+        })
+    except Exception as e:
+        logger.exception("Generation %s failed", job.id)
+        job._finish("failed", error=f"Error generating program: {e}")
+    finally:
+        with _jobs_lock:
+            if _in_flight.get(job.key) is job:
+                del _in_flight[job.key]
+        outcome = job.cancel_reason if job.status == "cancelled" else job.status
+        generation_jobs.inc(outcome=outcome)
+
+
+def submit_generation(
+    request: WorkoutRequest, agent_factory: Callable[[], Any]
+) -> Tuple[GenerationJob, bool]:
+    """Start a job for ``request`` (call on the event loop); (job, False) if joined."""
+    key = request_key(request)
+    with _jobs_lock:
+        existing = _in_flight.get(key)
+        if existing is not None and not existing.finished and not existing.cancelled:
+            generation_jobs.inc(outcome="joined")
+            return existing, False
+        job = GenerationJob(id=uuid.uuid4().hex, request=request, key=key)
+        _jobs[job.id] = job
+        _in_flight[key] = job
+        finished = [job_id for job_id, old in _jobs.items() if old.finished]
+        for job_id in finished[:max(0, len(finished) - settings.generation_keep_jobs)]:
+            del _jobs[job_id]
+    job._update()  # published as queued
+    job._task = asyncio.get_running_loop().create_task(_run(job, agent_factory))
+    return job, True
+
+
+def get_generation(job_id: str) -> Optional[GenerationJob]:
+    """A job running in, or recently finished by, this worker."""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+async def load_generation(db: AsyncSession, job_id: str) -> Optional[Dict[str, Any]]:
+    """State of a job of any worker: this worker's, else the stored one."""
+    job = get_generation(job_id)
+    if job is not None:
+        return job.as_dict()
+    return await load_state(db, job_id, KIND, LOST)
+
+
+async def cancel_job(db: AsyncSession, job_id: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Cancel a job of any worker: (its state, or None if unknown; False if it had finished)."""
+    job = get_generation(job_id)
+    if job is not None:
+        cancelled = job.cancel()
+        return job.as_dict(), cancelled
+    if await request_cancel(db, job_id, KIND) is None:
+        return None, False
+    state = await load_state(db, job_id, KIND, LOST)
+    return state, state is not None and state["status"] not in TERMINAL
+
+
+def _event(name: str, state: Dict[str, Any]) -> bytes:
+    return f"event: {name}\ndata: {json.dumps(state, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+async def event_stream(job: GenerationJob) -> AsyncIterator[bytes]:
+    """Server-sent events for ``job``: "progress" per change, then one "done"."""
+    queue = job.subscribe()
+    try:
+        while True:
+            try:
+                state = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if state["status"] in TERMINAL:
+                yield _event("done", state)
+                return
+            yield _event("progress", state)
+    finally:
+        job.unsubscribe(queue)
+
+
+async def remote_event_stream(job_id: str) -> AsyncIterator[bytes]:
+    """Server-sent events for a job of another worker, polled from its stored state."""
+    last: Optional[Dict[str, Any]] = None
+    idle = watched = 0.0
+    while True:
+        async with get_async_sessionmaker()() as db:
+            state = await load_state(db, job_id, KIND, LOST)
+            if state is not None and state["status"] not in TERMINAL and watched <= 0:
+                await touch_watched(db, job_id)  # so its worker does not abandon it
+                watched = min(WATCH_SECONDS, settings.generation_abandon_seconds / 3)
+        if state is None:
+            return  # pruned
+        if state["status"] in TERMINAL:
+            yield _event("done", state)
+            return
+        if state != last:
+            yield _event("progress", state)
+            last, idle = state, 0.0
+        elif idle >= KEEPALIVE_SECONDS:
+            yield b": keep-alive\n\n"
+            idle = 0.0
+        await asyncio.sleep(POLL_SECONDS)
+        idle += POLL_SECONDS
+        watched -= POLL_SECONDS
+
+
+def _reset_after_fork():
+    global _jobs_lock, _pool, _pool_lock
+    _jobs.clear()
+    _in_flight.clear()
+    _jobs_lock = threading.Lock()
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,202 @@
+"""State of background jobs, shared by all workers.
+
+Generation jobs (app.generation) and batches (app.batch) run in the worker
+that accepted them: their provider calls, the cancel flag the agents check
+and the listeners of their event streams live in that process. Behind a load
+balancer a job's status, event and cancel requests reach any worker, so every
+state change is also written to the job_states table:
+
+- ``publish`` queues a job's latest state. One thread per worker writes the
+  queued states, only the newest of each job, in one transaction.
+- The same thread reads the cancel requests other workers recorded for this
+  worker's unfinished jobs every POLL_SECONDS, and refreshes their
+  updated_at every HEARTBEAT_SECONDS. An unfinished job whose heartbeat is
+  older than LOST_AFTER_SECONDS belonged to a worker that stopped and is
+  reported with the caller's ``lost`` fields.
+- Other workers read states with ``load_state``, record cancellation with
+  ``request_cancel`` and keep a job watched with ``touch_watched``.
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import JobState, SessionLocal
+from app.models import loads_json
+
+logger = logging.getLogger("app.job_store")
+
+POLL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 10.0
+LOST_AFTER_SECONDS = 3 * HEARTBEAT_SECONDS
+
+# on_poll(cancel_reason, watched_at) of an unfinished job, called from the writer thread
+PollCallback = Callable[[Optional[str], Optional[datetime]], None]
+# A job's as_dict() (with a "status"), or a callable returning it when written
+State = Union[Dict[str, Any], Callable[[], Dict[str, Any]]]
+
+
+class _Writer:
+    """This worker's thread writing job states and polling their cancel requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        # job id -> (kind, state, finished, keep)
+        self._pending: Dict[str, Tuple[str, State, bool, int]] = {}
+        self._live: Dict[str, Optional[PollCallback]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._last_heartbeat = datetime.min
+
+    def publish(
+        self, kind: str, job_id: str, state: State,
+        finished: bool, keep: int, on_poll: Optional[PollCallback],
+    ) -> None:
+        with self._lock:
+            self._pending[job_id] = (kind, state, finished, keep)
+            new = not finished and job_id not in self._live
+            if finished:
+                self._live.pop(job_id, None)
+            elif new:
+                self._live[job_id] = on_poll
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="job-store", daemon=True)
+                self._thread.start()
+        if new or finished:
+            self._wake.set()  # new and finished jobs are written at once, progress per poll
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                live = dict(self._live)
+            if not pending and not live:
+                continue
+            try:
+                self._sync(pending, live)
+            except Exception:
+                logger.exception("Writing job states failed")
+                with self._lock:
+                    for job_id, entry in pending.items():
+                        self._pending.setdefault(job_id, entry)  # retry unless superseded
+
+    def _sync(self, pending, live) -> None:
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            prune: Dict[str, int] = {}
+            for job_id, (kind, state, finished, keep) in pending.items():
+                if callable(state):
+                    state = state()
+                row = db.get(JobState, job_id) or JobState(id=job_id, kind=kind)
+                row.status = state["status"]
+                row.state_json = json.dumps(state, separators=(",", ":"))
+                row.updated_at = now
+                if finished:
+                    row.finished_at = now
+                    prune[kind] = keep
+                db.add(row)
+            if live and now - self._last_heartbeat >= timedelta(seconds=HEARTBEAT_SECONDS):
+                db.execute(update(JobState).where(JobState.id.in_(list(live))).values(updated_at=now))
+                self._last_heartbeat = now
+            db.flush()
+            for kind, keep in prune.items():
+                _prune(db, kind, keep)
+            polled = db.execute(
+                select(JobState.id, JobState.cancel_reason, JobState.watched_at)
+                .where(JobState.id.in_([job_id for job_id, on_poll in live.items() if on_poll]))
+            ).all() if any(live.values()) else []
+            db.commit()
+        finally:
+            db.close()
+        for job_id, cancel_reason, watched_at in polled:
+            live[job_id](cancel_reason, watched_at)
+
+
+def _prune(db, kind: str, keep: int) -> None:
+    """Delete all but the ``keep`` most recently finished jobs of ``kind``."""
+    cutoff = db.scalar(
+        select(JobState.finished_at)
+        .where(JobState.kind == kind, JobState.finished_at.is_not(None))
+        .order_by(JobState.finished_at.desc())
+        .offset(max(0, keep))
+        .limit(1)
+    )
+    if cutoff is not None:
+        db.execute(delete(JobState).where(
+            JobState.kind == kind, JobState.finished_at.is_not(None), JobState.finished_at <= cutoff
+        ))
+
+
+_writer = _Writer()
+
+
+def publish(
+    kind: str,
+    job_id: str,
+    state: State,
+    finished: bool = False,
+    keep: int = 0,
+    on_poll: Optional[PollCallback] = None,
+) -> None:
+    """Queue ``state`` of a job running in this worker for other workers to read.
+
+    A callable ``state`` is evaluated when written, so a job that changes
+    often is serialized once per poll. A finished job is no longer polled,
+    and only the ``keep`` most recently finished jobs of its kind are kept.
+    """
+    _writer.publish(kind, job_id, state, finished, keep, on_poll)
+
+
+async def load_state(
+    db: AsyncSession, job_id: str, kind: str, lost: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """The last published state of a job; ``lost`` is applied if its worker stopped."""
+    row = (await db.execute(
+        select(JobState.state_json, JobState.cancel_reason, JobState.updated_at, JobState.finished_at)
+        .where(JobState.id == job_id, JobState.kind == kind)
+    )).first()
+    if row is None:
+        return None
+    state = loads_json(row.state_json)
+    if row.finished_at is None:
+        if row.cancel_reason:
+            state["cancel_requested"] = True
+        if row.updated_at < datetime.utcnow() - timedelta(seconds=LOST_AFTER_SECONDS):
+            state.update(lost)
+    return state
+
+
+async def request_cancel(db: AsyncSession, job_id: str, kind: str, reason: str = "cancelled") -> Optional[str]:
+    """Ask the worker running a job to stop it; its status, or None if unknown."""
+    await db.execute(
+        update(JobState)
+        .where(
+            JobState.id == job_id, JobState.kind == kind,
+            JobState.finished_at.is_(None), JobState.cancel_reason.is_(None),
+        )
+        .values(cancel_reason=reason)
+    )
+    await db.commit()
+    return await db.scalar(select(JobState.status).where(JobState.id == job_id, JobState.kind == kind))
+
+
+async def touch_watched(db: AsyncSession, job_id: str) -> None:
+    """Record that an event stream on this worker follows a job of another worker."""
+    await db.execute(update(JobState).where(JobState.id == job_id).values(watched_at=datetime.utcnow()))
+    await db.commit()
+
+
+def _reset_after_fork():
+    global _writer
+    _writer = _Writer()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
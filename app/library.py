@@ -0,0 +1,214 @@
+"""Pre-generated programs for the most common requests.
+
+The request space is small and discrete (goal, fitness level, 3-30 hours,
+4-52 weeks, focus areas) and most traffic asks for a few dozen combinations.
+``warm_library`` counts the requests logged in training_programs.request_json
+over the last LIBRARY_WINDOW_DAYS, generates programs for the LIBRARY_TOP_N
+most frequent ones (seen at least LIBRARY_MIN_REQUESTS times) whose entry is
+missing or older than LIBRARY_MAX_AGE_HOURS, and stores them in
+program_library. With PROGRAM_LIBRARY on, /api/workouts/generate answers an
+identical request (see app.batch.request_key) from the library: the program
+is saved as the caller's own copy without an LLM call. The first copy of an
+entry is recorded as its program_id and later copies are saved with it as
+their source_program_id, so app.similarity indexes one program per entry.
+
+Warming is an offline job; run it from cron or a scheduled task, or keep it
+running with --every:
+
+    python -m app.library warm --top 50
+    python -m app.library warm --every 24
+"""
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.batch import request_key
+from app.config import settings
+from app.database import LibraryProgram, SavedProgram
+from app.metrics import library_lookups
+from app.models import TrainingProgram, WorkoutRequest, parse_program
+from app.plan_validation import check_program
+
+logger = logging.getLogger("app.library")
+
+
+def top_requests(
+    db: Session, top_n: int, window_days: float, min_requests: int = 1
+) -> List[Tuple[str, WorkoutRequest, int]]:
+    """The ``top_n`` most frequent requests of the window: (key, request, count)."""
+    since = datetime.utcnow() - timedelta(days=window_days)
+    keys: Dict[str, str] = {}  # raw request JSON -> key, so each variant is parsed once
+    requests: Dict[str, WorkoutRequest] = {}
+    counts: Counter = Counter()
+    rows = db.execute(
+        select(SavedProgram.request_json).where(
+            SavedProgram.created_at >= since, SavedProgram.request_json.is_not(None)
+        )
+    ).yield_per(1000)
+    for (raw,) in rows:
+        key = keys.get(raw)
+        if key is None:
+            try:
+                request = WorkoutRequest.model_validate_json(raw)
+            except ValueError:
+                continue  # logged by an older request model
+            key = keys[raw] = request_key(request)
+            requests.setdefault(key, request)
+        counts[key] += 1
+    return [
+        (key, requests[key], count)
+        for key, count in counts.most_common(top_n)
+        if count >= min_requests
+    ]
+
+
+def _generate(agent, request: WorkoutRequest) -> TrainingProgram:
+    # PLAN_VALIDATION applies as for served programs; "reject" skips the entry.
+    program, _ = check_program(agent.generate_program(request))
+    return program
+
+
+def warm_library(
+    db: Session,
+    agent,
+    top_n: Optional[int] = None,
+    window_days: Optional[float] = None,
+    min_requests: Optional[int] = None,
+    max_age_hours: Optional[float] = None,
+    prune: bool = False,
+) -> Dict[str, int]:
+    """Generate missing or stale library entries for the top requests (blocking).
+
+    Provider calls run BATCH_MAX_CONCURRENCY at a time and go through the
+    provider rate limit. With ``prune``, entries no longer among the top
+    requests are deleted. Returns counts per outcome.
+    """
+    top = top_requests(
+        db,
+        settings.library_top_n if top_n is None else top_n,
+        settings.library_window_days if window_days is None else window_days,
+        settings.library_min_requests if min_requests is None else min_requests,
+    )
+    fresh_after = datetime.utcnow() - timedelta(
+        hours=settings.library_max_age_hours if max_age_hours is None else max_age_hours
+    )
+    entries = {entry.request_key: entry for entry in db.scalars(select(LibraryProgram))}
+    stale = []
+    for key, request, count in top:
+        entry = entries.get(key)
+        if entry is not None and entry.generated_at >= fresh_after:
+            entry.request_count = count
+        else:
+            stale.append((key, request, count))
+    db.commit()
+
+    counts = {"top": len(top), "fresh": len(top) - len(stale), "generated": 0, "failed": 0, "pruned": 0}
+    with ThreadPoolExecutor(max_workers=max(1, settings.batch_max_concurrency)) as pool:
+        futures = {pool.submit(_generate, agent, request): (key, request, count) for key, request, count in stale}
+        for future in as_completed(futures):
+            key, request, count = futures[future]
+            try:
+                program = future.result()
+            except Exception:
+                logger.exception("Generating library program failed for %s", key)
+                counts["failed"] += 1
+                continue
+            entry = entries.get(key) or LibraryProgram(request_key=key)
+            entry.request_json = request.model_dump_json()
+            entry.program_json = program.model_dump_json()
+            entry.request_count = count
+            entry.generated_at = datetime.utcnow()
+            entry.program_id = None  # copies of the old program are not copies of this one
+            db.add(entry)
+            db.commit()
+            counts["generated"] += 1
+
+    if prune:
+        keep = [key for key, _, _ in top]
+        counts["pruned"] = db.execute(
+            delete(LibraryProgram).where(LibraryProgram.request_key.not_in(keep))
+        ).rowcount
+        db.commit()
+    return counts
+
+
+async def find_in_library(
+    db: AsyncSession, request: WorkoutRequest
+) -> Optional[Tuple[TrainingProgram, Optional[int]]]:
+    """The library program for ``request``: (program, first saved copy's id or None)."""
+    row = (await db.execute(
+        select(LibraryProgram.program_json, LibraryProgram.program_id)
+        .where(LibraryProgram.request_key == request_key(request))
+    )).first()
+    library_lookups.inc(outcome="miss" if row is None else "hit")
+    return None if row is None else (parse_program(row.program_json), row.program_id)
+
+
+async def link_library_copy(db: AsyncSession, request: WorkoutRequest, program_id: int) -> Optional[int]:
+    """Record saved program ``program_id`` as the first copy of ``request``'s entry.
+
+    Returns None if it is now the first copy, else the id of the copy that
+    was recorded first (by a concurrent request), its source.
+    """
+    key = request_key(request)
+    result = await db.execute(
+        update(LibraryProgram)
+        .where(LibraryProgram.request_key == key, LibraryProgram.program_id.is_(None))
+        .values(program_id=program_id)
+    )
+    await db.commit()
+    if result.rowcount:
+        return None
+    return await db.scalar(select(LibraryProgram.program_id).where(LibraryProgram.request_key == key))
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from app.database import SessionLocal, ensure_db
+    from app.main import get_agent
+
+    parser = argparse.ArgumentParser(description="Pre-generated program library")
+    commands = parser.add_subparsers(dest="command", required=True)
+    warm = commands.add_parser("warm", help="generate programs for the most common requests")
+    warm.add_argument("--top", type=int, default=settings.library_top_n)
+    warm.add_argument("--window-days", type=float, default=settings.library_window_days)
+    warm.add_argument("--min-requests", type=int, default=settings.library_min_requests)
+    warm.add_argument("--max-age-hours", type=float, default=settings.library_max_age_hours)
+    warm.add_argument("--prune", action="store_true", help="delete entries outside the top")
+    warm.add_argument("--every", type=float, help="repeat every N hours")
+    commands.add_parser("list", help="show library entries")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ensure_db()
+    if args.command == "list":
+        db = SessionLocal()
+        try:
+            for entry in db.scalars(select(LibraryProgram).order_by(LibraryProgram.request_count.desc())):
+                print(f"{entry.request_count or 0:6d}  {entry.generated_at:%Y-%m-%d %H:%M}  {entry.request_json}")
+        finally:
+            db.close()
+        raise SystemExit(0)
+
+    agent = get_agent()
+    while True:
+        db = SessionLocal()
+        try:
+            result = warm_library(
+                db, agent, args.top, args.window_days, args.min_requests,
+                args.max_age_hours, args.prune,
+            )
+        finally:
+            db.close()
+        print(", ".join(f"{name}: {count}" for name, count in result.items()), flush=True)
+        if not args.every:
+            break
+        time.sleep(args.every * 3600)
@@ -1,29 +1,77 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from datetime import date, datetime
 from typing import List, Optional
-import json
+import asyncio
+import os
+import threading
 import uvicorn
 
-from app.database import init_db, get_db
-from app.models import WorkoutRequest, TrainingProgram, RaceDistance, Sport
+from app.database import IS_POSTGRES, content_hash_for, ensure_db, get_async_db
+from app.models import BatchGenerateRequest, BulkExportRequest, WorkoutRequest, TrainingProgram, RaceDistance, Sport
 from app.config import settings
-from app.repository import ProgramRepository, WorkoutHistoryRepository
+from app.warmup import readiness, run_warmup, warmup_hook
+from app.repository import AsyncProgramRepository, AsyncWorkoutHistoryRepository
+from app.cache import CachedResponse, get_program_cache
+from app.metrics import MetricsMiddleware, registry
+from app.plan_validation import PlanValidationError
+from app.batch import create_job, load_job, start_job
+from app.generation import (
+    cancel_job, event_stream, generate_and_save, get_generation, load_generation,
+    remote_event_stream, submit_generation,
+)
+from app.replanning import run_replan, schedule_replan
+from app.exports import (
+    FORMATS as EXPORT_FORMATS,
+    bulk_export,
+    cached_stream,
+    export_filename,
+    export_key,
+    get_export_cache,
+    iter_export,
+)
+from app.responses import (
+    DefaultJSONResponse,
+    encode_for_request,
+    encoded_json_response,
+    etag_matches,
+    json_bytes_response,
+    make_etag,
+    negotiate_encoding,
+    not_modified,
+    program_response_body,
+    splice_json,
+)
+from app.storage import FORMAT_COMPACT, summarize_week
+from app.token_budget import token_budget_state
+from app.synthetic import synthetic_program_data
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start warm-up in the background so the server accepts requests at once."""
+    warmup = asyncio.get_running_loop().run_in_executor(None, run_warmup)
+    yield
+    await asyncio.wait([warmup], timeout=5)
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Triathlon Program Generator",
     description="AI-powered triathlon training program generator",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=DefaultJSONResponse,
+    lifespan=lifespan,
 )
+app.add_middleware(MetricsMiddleware)
 
-# Initialize database
-init_db()
-
-# Setup templates
+# Setup templates and static files
 templates = Jinja2Templates(directory="app/templates")
+app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 # Initialize agent based on provider
 def get_agent():
@@ -31,11 +79,59 @@ def get_agent():
     if settings.llm_provider.lower() == "azure_ai":
         from app.agent_azure_ai import TriathlonWorkoutAgentAzureAI
         return TriathlonWorkoutAgentAzureAI()
+    elif settings.llm_provider.lower() == "replay":
+        from app.agent_replay import TriathlonWorkoutAgentReplay
+        return TriathlonWorkoutAgentReplay()
     else:  # Default to anthropic
         from app.agent import TriathlonWorkoutAgent
         return TriathlonWorkoutAgent()
 
-agent = get_agent()
+
+# The agent (and its HTTP client) is created lazily in each worker process, so
+# a preloading gunicorn master never shares SDK connections with its workers.
+_agent = None
+_agent_lock = threading.Lock()
+
+
+def get_agent_instance():
+    """Return this process's agent, creating it on first use."""
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                _agent = get_agent()
+    return _agent
+
+
+def _reset_agent_after_fork():
+    global _agent, _agent_lock
+    _agent = None
+    _agent_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_agent_after_fork)
+
+
+# Deferred start-up work; runs after the server is listening (see app.warmup).
+warmup_hook("database")(ensure_db)
+warmup_hook("agent")(get_agent_instance)
+
+
+# Health
+
+@app.get("/health")
+async def health():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: runs any pending warm-up hooks, 503 until all succeed."""
+    if not readiness()["ready"]:
+        await run_in_threadpool(run_warmup)
+    report = readiness()
+    return DefaultJSONResponse(report, status_code=200 if report["ready"] else 503)
 
 
 # API Endpoints
@@ -43,38 +139,121 @@ agent = get_agent()
 @app.post("/api/workouts/generate", response_model=dict)
 async def generate_workout(
     request: WorkoutRequest,
-    db: Session = Depends(get_db)
+    http_request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Generate a new training program using the AI agent."""
     try:
-        # Generate program using AI
-        program = agent.generate_program(request)
-        
-        # Save to database
-        saved_program = ProgramRepository.save_program(
-            db=db,
-            program=program,
-            request_data=request.model_dump()
+        # Generate program using AI (blocking SDK call, keep it off the event loop)
+        saved_program, fields = await generate_and_save(
+            db, request, lambda r: run_in_threadpool(get_agent_instance().generate_program, r)
         )
         
-        return {
+        # The program was just serialized for storage; reuse that JSON as-is.
+        body = {
             "id": saved_program.id,
-            "program": program.model_dump(),
-            "message": "Training program generated successfully"
+            "message": "Training program generated successfully",
+            **fields,
         }
+        return encoded_json_response(
+            http_request, splice_json(body, "program", saved_program.program_text)
+        )
+    except PlanValidationError as e:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "message": str(e),
+                "violations": [violation.as_dict() for violation in e.violations],
+            },
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating program: {str(e)}")
 
 
+@app.post("/api/workouts/generations", status_code=202)
+async def start_generation(request: WorkoutRequest, db: AsyncSession = Depends(get_async_db)):
+    """Start generating a program in the background; follow events_url for progress."""
+    # The session dependency only makes sure the database is ready; the job opens its own.
+    job, started = submit_generation(request, get_agent_instance)
+    base = f"/api/workouts/generations/{job.id}"
+    return {
+        **job.as_dict(),
+        "joined": not started,
+        "status_url": base,
+        "events_url": f"{base}/events",
+        "cancel_url": f"{base}/cancel",
+    }
+
+
+@app.get("/api/workouts/generations/{generation_id}")
+async def get_generation_status(generation_id: str, db: AsyncSession = Depends(get_async_db)):
+    """State of a generation: status, weeks done, and the program id once created."""
+    state = await load_generation(db, generation_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Generation not found")
+    return state
+
+
+@app.get("/api/workouts/generations/{generation_id}/events")
+async def generation_events(generation_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Server-sent events: "progress" on every change, then "done" with the outcome."""
+    job = get_generation(generation_id)
+    if job is None and await load_generation(db, generation_id) is None:
+        raise HTTPException(status_code=404, detail="Generation not found")
+    return StreamingResponse(
+        event_stream(job) if job is not None else remote_event_stream(generation_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/workouts/generations/{generation_id}/cancel")
+async def cancel_generation(generation_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Stop a generation; its outstanding provider calls are aborted."""
+    state, cancelled = await cancel_job(db, generation_id)
+    if state is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Cannot cancel generation {generation_id}: no such generation is running "
+                   f"or was kept (the last {settings.generation_keep_jobs} are)",
+        )
+    if not cancelled:
+        raise HTTPException(status_code=409, detail=f"Generation already {state['status']}")
+    return state
+
+
+@app.post("/api/workouts/batch", status_code=202)
+async def generate_batch(batch: BatchGenerateRequest):
+    """Start generating many programs; poll the returned status_url for results."""
+    if len(batch.requests) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch can hold at most {settings.batch_max_items} requests",
+        )
+    agent = await run_in_threadpool(get_agent_instance)
+    job = create_job(batch)
+    start_job(job, agent)
+    return {**job.as_dict(include_items=False), "status_url": f"/api/workouts/batch/{job.id}"}
+
+
+@app.get("/api/workouts/batch/{batch_id}")
+async def get_batch(batch_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Progress and per-item status (program id, or error) of a batch."""
+    state = await load_job(db, batch_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return state
+
+
 @app.get("/api/workouts", response_model=List[dict])
 async def list_workouts(
     skip: int = 0,
     limit: int = 100,
     goal: Optional[RaceDistance] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List all saved workout programs."""
-    programs = ProgramRepository.list_programs(
+    programs = await AsyncProgramRepository.list_programs(
         db=db,
         skip=skip,
         limit=limit,
@@ -96,27 +275,204 @@ async def list_workouts(
 
 
 @app.get("/api/workouts/{program_id}", response_model=dict)
-async def get_workout(program_id: int, db: Session = Depends(get_db)):
+async def get_workout(
+    program_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
     """Get a specific workout program by ID."""
-    program = ProgramRepository.get_program(db=db, program_id=program_id)
+    if_none_match = request.headers.get("if-none-match")
+    
+    # The hash alone answers revalidations, and checks cached bytes against
+    # the current row (another worker may have updated or deleted it).
+    content_hash = await AsyncProgramRepository.get_content_hash(db=db, program_id=program_id)
+    if content_hash is None:
+        raise HTTPException(status_code=404, detail="Program not found")
+    if etag_matches(if_none_match, content_hash):
+        return not_modified(request, content_hash)
+    
+    # Hot programs are served from the response cache without loading the document.
+    cache = get_program_cache()
+    accepted = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    cached = cache.get(program_id, accepted, content_hash=content_hash) if cache else None
+    if cached is not None:
+        return json_bytes_response(cached.body, cached.encoding, cached.content_hash)
+    
+    program = await AsyncProgramRepository.get_program(db=db, program_id=program_id)
     
     if not program:
         raise HTTPException(status_code=404, detail="Program not found")
     
-    return {
-        "id": program.id,
-        "created_at": program.created_at.isoformat(),
-        "goal": program.goal,
-        "fitness_level": program.fitness_level,
-        "duration_weeks": program.duration_weeks,
-        "program": json.loads(program.program_json)
+    # Splice the stored JSON into the envelope instead of parsing it and
+    # having FastAPI re-encode the whole nested structure.
+    encoding, body = encode_for_request(request, program_response_body(program))
+    if cache is not None:
+        cache.put(program_id, accepted, CachedResponse(program.content_hash, encoding, body))
+    return json_bytes_response(body, encoding, program.content_hash)
+
+
+@app.get("/api/workouts/{program_id}/summary", response_model=dict)
+async def get_workout_summary(
+    program_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Per-week overview (focus, volume, distance) without workout bodies.
+
+    Also carries the program header (goal, level, notes, ...), so a client can
+    lay out the whole program from this payload and fetch workouts per week.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    
+    # program.html requests this on every visit: revalidate from the hash,
+    # and serve hot summaries from the cache if cached for this version.
+    content_hash = await AsyncProgramRepository.get_content_hash(db=db, program_id=program_id)
+    if content_hash is None:
+        raise HTTPException(status_code=404, detail="Program not found")
+    summary_hash = content_hash_for(f"{content_hash}/summary")
+    if etag_matches(if_none_match, summary_hash):
+        return not_modified(request, summary_hash)
+    
+    cache = get_program_cache()
+    accepted = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    cached = cache.get(program_id, accepted, view="summary", content_hash=summary_hash) if cache else None
+    if cached is not None:
+        return json_bytes_response(cached.body, cached.encoding, cached.content_hash)
+    
+    index = await AsyncProgramRepository.get_week_index(db=db, program_id=program_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Program not found")
+    _, offsets, week_summary = index
+    
+    header = await AsyncProgramRepository.get_header(db=db, program_id=program_id)
+    body = splice_json(
+        {"id": program_id, **(header or {}), "total_weeks": len(offsets)}, "weeks", week_summary
+    )
+    encoding, body = encode_for_request(request, body)
+    if cache is not None:
+        cache.put(program_id, accepted, CachedResponse(summary_hash, encoding, body), view="summary")
+    return json_bytes_response(body, encoding, summary_hash)
+
+
+@app.get("/api/workouts/{program_id}/weeks", response_model=dict)
+async def get_workout_weeks(
+    program_id: int,
+    request: Request,
+    week_from: int = Query(default=1, alias="from", ge=1),
+    week_to: Optional[int] = Query(default=None, alias="to", ge=1),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a range of weeks (1-based, inclusive) from a program."""
+    index = await AsyncProgramRepository.get_week_index(db=db, program_id=program_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Program not found")
+    content_hash, offsets, _ = index
+    
+    total_weeks = len(offsets)
+    week_to = min(week_to or total_weeks, total_weeks)
+    if week_from > week_to:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid week range {week_from}-{week_to} (program has {total_weeks} weeks)"
+        )
+    
+    range_hash = content_hash_for(f"{content_hash}/weeks/{week_from}-{week_to}")
+    if etag_matches(request.headers.get("if-none-match"), range_hash):
+        return not_modified(request, range_hash)
+    
+    weeks_json = await AsyncProgramRepository.get_weeks_json(
+        db=db, program_id=program_id, offsets=offsets, first=week_from, last=week_to
+    )
+    body = splice_json(
+        {"id": program_id, "from": week_from, "to": week_to, "total_weeks": total_weeks},
+        "weeks",
+        weeks_json,
+    )
+    return encoded_json_response(request, body, content_hash=range_hash)
+
+
+async def _export_source(db: AsyncSession, program_id: int) -> tuple:
+    """(program_id, content_hash, program_text, week offsets, created_at) for exports.
+
+    Offsets are None for JSONB documents (PostgreSQL), whose text no longer
+    matches the stored offsets; compact documents decode to the original text.
+    """
+    index = await AsyncProgramRepository.get_week_index(db=db, program_id=program_id)
+    program = await AsyncProgramRepository.get_program(db=db, program_id=program_id)
+    if index is None or program is None:
+        raise HTTPException(status_code=404, detail=f"Program {program_id} not found")
+    created_at = program.created_at or datetime.utcnow()
+    offsets = None if IS_POSTGRES and program.program_format != FORMAT_COMPACT else index[1]
+    return program_id, index[0], program.program_text, offsets, created_at
+
+
+@app.get("/api/workouts/{program_id}/export/{fmt}")
+async def export_workout(
+    program_id: int,
+    fmt: str,
+    request: Request,
+    start: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stream a program as a calendar (ics) or device workouts (tcx), week by week."""
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=404, detail=f"Unknown export format {fmt!r}")
+    content_hash = await AsyncProgramRepository.get_content_hash(db=db, program_id=program_id)
+    if content_hash is None:
+        raise HTTPException(status_code=404, detail="Program not found")
+    if start is None:
+        created_at = await AsyncProgramRepository.get_created_at(db=db, program_id=program_id)
+        start = (created_at or datetime.utcnow()).date()
+
+    # Exports are derived from the stored program: revalidate and cache by its hash.
+    key = export_key(content_hash, fmt, start)
+    export_hash = content_hash_for(key)
+    if etag_matches(request.headers.get("if-none-match"), export_hash):
+        return not_modified(request, export_hash)
+    media_type = EXPORT_FORMATS[fmt][0]
+    headers = {
+        "Content-Disposition": f'attachment; filename="{export_filename(program_id, fmt)}"',
+        "Cache-Control": settings.program_cache_control,
+        "ETag": make_etag(export_hash),
     }
+    cache = get_export_cache()
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return Response(cached, media_type=media_type, headers=headers)
+
+    _, _, program_text, offsets, created_at = await _export_source(db, program_id)
+    # A sync iterator: Starlette renders each week in the threadpool as it streams.
+    pieces = iter_export(program_id, program_text, offsets, fmt, start, created_at)
+    return StreamingResponse(cached_stream(key, pieces), media_type=media_type, headers=headers)
+
+
+@app.post("/api/workouts/export")
+async def export_workouts(export: BulkExportRequest, db: AsyncSession = Depends(get_async_db)):
+    """Zip of many programs' exports, rendered on a process pool."""
+    if export.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"Unknown export format {export.format!r}")
+    if len(export.program_ids) > settings.export_bulk_max_programs:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.export_bulk_max_programs} programs per export",
+        )
+    sources = [
+        await _export_source(db, program_id) for program_id in dict.fromkeys(export.program_ids)
+    ]
+    body = await run_in_threadpool(bulk_export, sources, export.format, export.start)
+    return Response(
+        body,
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="triathlon-programs-{export.format}.zip"'
+        },
+    )
 
 
 @app.delete("/api/workouts/{program_id}")
-async def delete_workout(program_id: int, db: Session = Depends(get_db)):
+async def delete_workout(program_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a workout program."""
-    success = ProgramRepository.delete_program(db=db, program_id=program_id)
+    success = await AsyncProgramRepository.delete_program(db=db, program_id=program_id)
     
     if not success:
         raise HTTPException(status_code=404, detail="Program not found")
@@ -124,6 +480,15 @@ async def delete_workout(program_id: int, db: Session = Depends(get_db)):
     return {"message": "Program deleted successfully"}
 
 
+@app.post("/api/workouts/{program_id}/replan")
+async def replan_workout(program_id: int):
+    """Replan the upcoming weeks from logged workouts now (normally debounced after logging)."""
+    result = await run_in_threadpool(run_replan, program_id, get_agent_instance)
+    if result["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Program not found")
+    return result
+
+
 @app.post("/api/history/log")
 async def log_workout(
     program_id: Optional[int] = None,
@@ -133,10 +498,10 @@ async def log_workout(
     distance_km: Optional[float] = None,
     notes: Optional[str] = None,
     rating: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Log a completed workout."""
-    workout = WorkoutHistoryRepository.log_workout(
+    workout = await AsyncWorkoutHistoryRepository.log_workout(
         db=db,
         program_id=program_id,
         sport=sport.value,
@@ -146,6 +511,8 @@ async def log_workout(
         notes=notes,
         rating=rating
     )
+    if program_id is not None and settings.replan_enabled:
+        schedule_replan(program_id, get_agent_instance)
     
     return {
         "id": workout.id,
@@ -159,10 +526,10 @@ async def get_workout_history(
     sport: Optional[Sport] = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get workout history."""
-    workouts = WorkoutHistoryRepository.get_workout_history(
+    workouts = await AsyncWorkoutHistoryRepository.get_workout_history(
         db=db,
         program_id=program_id,
         sport=sport.value if sport else None,
@@ -186,15 +553,46 @@ async def get_workout_history(
 
 
 @app.get("/api/stats")
-async def get_stats(sport: Optional[Sport] = None, db: Session = Depends(get_db)):
+async def get_stats(sport: Optional[Sport] = None, db: AsyncSession = Depends(get_async_db)):
     """Get workout statistics."""
-    stats = WorkoutHistoryRepository.get_workout_stats(
+    stats = await AsyncWorkoutHistoryRepository.get_workout_stats(
         db=db,
         sport=sport.value if sport else None
     )
     return stats
 
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Hit/miss and size metrics of the program response cache."""
+    cache = get_program_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@app.get("/api/token-budget")
+async def get_token_budget():
+    """This worker's fitted output-token model per provider (app/token_budget.py)."""
+    return token_budget_state()
+
+
+def _cache_gauges():
+    cache = get_program_cache()
+    return {(name,): value for name, value in cache.stats().items()} if cache else {}
+
+
+registry.gauge_callback(
+    "tri_program_cache", "Program response cache counters and size.", ("stat",), _cache_gauges
+)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for this worker process."""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # Web Interface
 
 @app.get("/", response_class=HTMLResponse)
@@ -212,8 +610,26 @@ async def view_program(request: Request, program_id: int):
     )
 
 
+@app.get("/benchmarks/render", response_class=HTMLResponse, include_in_schema=False)
+async def render_benchmark(request: Request):
+    """Browser benchmark of program.html rendering for 12/24/52-week synthetic plans."""
+    if not settings.benchmark_pages:
+        raise HTTPException(status_code=404, detail="Not Found")
+    programs = []
+    for weeks in (12, 24, 52):
+        program = TrainingProgram(**synthetic_program_data(weeks))
+        programs.append({
+            "weeks": weeks,
+            "program": program.model_dump(mode="json"),
+            "summary": [summarize_week(week) for week in program.weeks],
+        })
+    return templates.TemplateResponse(
+        "render_benchmark.html",
+        {"request": request, "programs": programs}
+    )
+
+
 if __name__ == "__main__":
-    import os
     port = int(os.getenv("PORT", 8000))
     print(f"Starting Triathlon Program Generator on port {port}...")
     print(f"Navigate to http://localhost:{port} to access the web interface")
@@ -0,0 +1,358 @@
+"""In-process metrics and timing spans with Prometheus text exposition.
+
+Metrics are per process: with several gunicorn workers each worker exposes
+its own values on /metrics, and the scraper aggregates them. Spans are also
+logged as structured records, and exported to OpenTelemetry when
+OTEL_ENABLED is set and the opentelemetry packages are installed.
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger("app.metrics")
+
+LabelValues = Tuple[str, ...]
+
+# Seconds; covers both sub-millisecond stages and multi-minute LLM calls.
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 120, 300, 600,
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonically increasing value per label set."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set."""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), t[0])) for k, (c, t) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics plus gauge callbacks evaluated at scrape time."""
+
+    def __init__(self):
+        self._metrics: List[object] = []
+        self._gauges: List[Tuple[str, str, Callable[[], Dict[LabelValues, float]], Tuple[str, ...]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge_callback(
+        self, name: str, help: str, labelnames: Sequence[str],
+        collect: Callable[[], Dict[LabelValues, float]],
+    ) -> None:
+        """Register a gauge whose values are computed by ``collect`` on scrape."""
+        self._gauges.append((name, help, collect, tuple(labelnames)))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for name, help, collect, labelnames in self._gauges:
+            try:
+                values = collect()
+            except Exception:
+                logger.exception("Metrics collector %s failed", name)
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in sorted(values.items()):
+                lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "tri_generation_stage_seconds",
+    "Duration of generation pipeline stages (prompt_build, provider_call, "
+    "json_extraction, json_parse, validation, plan_validation, db_save, week, chunk, "
+    "generation, rate_limit_wait, similarity_lookup, adaptation, library_lookup, variant_lookup, replan).",
+    ("stage", "provider"),
+)
+llm_time_to_first_token = registry.histogram(
+    "tri_llm_time_to_first_token_seconds",
+    "Time from sending a provider request to the first streamed token.",
+    ("provider", "call"),
+)
+llm_tokens = registry.counter(
+    "tri_llm_tokens_total",
+    "Tokens reported by the provider in response.usage.",
+    ("provider", "call", "kind"),
+)
+llm_requests = registry.counter(
+    "tri_llm_requests_total",
+    "Provider calls by outcome (finish reason or error).",
+    ("provider", "call", "outcome"),
+)
+plan_violations = registry.counter(
+    "tri_plan_violations_total",
+    "Training-rule violations found in generated programs, by rule.",
+    ("rule", "mode"),
+)
+batch_items = registry.counter(
+    "tri_batch_items_total",
+    "Batch generation items by final status.",
+    ("status",),
+)
+program_reuse = registry.counter(
+    "tri_program_reuse_total",
+    "Similar saved program lookups (SIMILARITY_REUSE) by outcome: hit or miss.",
+    ("outcome",),
+)
+library_lookups = registry.counter(
+    "tri_library_lookups_total",
+    "Pre-generated program library lookups (PROGRAM_LIBRARY) by outcome: hit or miss.",
+    ("outcome",),
+)
+replans = registry.counter(
+    "tri_replans_total",
+    "Replans of upcoming weeks from logged workouts, by outcome.",
+    ("outcome",),
+)
+generation_jobs = registry.counter(
+    "tri_generation_jobs_total",
+    "Generation jobs by outcome (created, rejected, failed, cancelled, abandoned, joined).",
+    ("outcome",),
+)
+http_request_seconds = registry.histogram(
+    "tri_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+
+
+def record_llm_usage(provider: str, call: str, input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+    """Count token usage reported by a provider response."""
+    if input_tokens:
+        llm_tokens.inc(input_tokens, provider=provider, call=call, kind="input")
+    if output_tokens:
+        llm_tokens.inc(output_tokens, provider=provider, call=call, kind="output")
+
+
+# --- spans -----------------------------------------------------------------
+
+_tracer = None
+_tracer_checked = False
+
+
+def _get_tracer():
+    """OpenTelemetry tracer when enabled and installed, else None."""
+    global _tracer, _tracer_checked
+    if _tracer_checked:
+        return _tracer
+    _tracer_checked = True
+    if not settings.otel_enabled:
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("OTEL_ENABLED is set but opentelemetry-api is not installed")
+        return None
+    try:
+        # Configure an OTLP exporter if the SDK is available and nothing else
+        # (e.g. opentelemetry-instrument) has set a provider already.
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+
+        if not isinstance(trace.get_tracer_provider(), TracerProvider):
+            provider = TracerProvider(
+                resource=Resource.create({"service.name": settings.otel_service_name})
+            )
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(provider)
+    except ImportError:
+        pass
+    _tracer = trace.get_tracer("triathlon-program-generator")
+    return _tracer
+
+
+class Span:
+    """Handle yielded by :func:`span` for adding attributes while it runs."""
+
+    def __init__(self, stage: str, attributes: Dict[str, object]):
+        self.stage = stage
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self._otel = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def set(self, **attributes: object) -> None:
+        self.attributes.update(attributes)
+        if self._otel is not None:
+            for key, value in attributes.items():
+                if value is not None:
+                    self._otel.set_attribute(key, value)
+
+
+@contextmanager
+def span(stage: str, provider: str = "", **attributes: object) -> Iterator[Span]:
+    """Time a pipeline stage.
+
+    ``stage`` and ``provider`` become histogram labels; other attributes (week
+    number, token counts, ...) are only logged and attached to the OTel span,
+    to keep metric cardinality low.
+    """
+    current = Span(stage, {"provider": provider, **attributes})
+    tracer = _get_tracer()
+    otel_cm = tracer.start_as_current_span(stage) if tracer is not None else None
+    if otel_cm is not None:
+        current._otel = otel_cm.__enter__()
+        current.set(**current.attributes)
+    error: Optional[BaseException] = None
+    try:
+        yield current
+    except BaseException as exc:
+        error = exc
+        raise
+    finally:
+        elapsed = current.elapsed
+        stage_seconds.observe(elapsed, stage=stage, provider=provider)
+        logger.info(
+            "span %s %.3fs",
+            stage,
+            elapsed,
+            extra={
+                "span": stage,
+                "duration_s": round(elapsed, 6),
+                "error": repr(error) if error else None,
+                "span_attributes": current.attributes,
+            },
+        )
+        if otel_cm is not None:
+            if error is not None:
+                current._otel.record_exception(error)
+            otel_cm.__exit__(type(error) if error else None, error, error.__traceback__ if error else None)
+
+
+# --- HTTP ------------------------------------------------------------------
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status["code"]),
+            )
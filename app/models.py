@@ -1,22 +1,55 @@
+from datetime import date
 from enum import Enum
-from typing import List, Optional
-from pydantic import BaseModel, Field, field_validator
+from typing import Any, List, Optional, Union
+import json
+from pydantic import BaseModel, Field
 
+try:
+    import orjson
+except ImportError:  # optional; json is used instead
+    orjson = None
 
-class Sport(str, Enum):
+
+class _LowercaseEnum(str, Enum):
+    """Enum that also accepts values in any letter case ("Olympic", "SWIM").
+
+    Looked up by Enum itself only when the exact value is not a member, so the
+    common case costs nothing; this replaces per-object field validators.
+    """
+
+    @classmethod
+    def _missing_(cls, value: Any):
+        if isinstance(value, str):
+            value = cls._aliases().get(value.lower(), value.lower())
+            for member in cls:
+                if member.value == value:
+                    return member
+        return None
+
+    @classmethod
+    def _aliases(cls) -> dict:
+        return {}
+
+
+class Sport(_LowercaseEnum):
     SWIM = "swim"
     BIKE = "bike"
     RUN = "run"
 
+    @classmethod
+    def _aliases(cls) -> dict:
+        # Brick workouts are bike-to-run transitions
+        return {"brick": "bike"}
 
-class RaceDistance(str, Enum):
+
+class RaceDistance(_LowercaseEnum):
     SPRINT = "sprint"  # 750m swim, 20km bike, 5km run
     OLYMPIC = "olympic"  # 1.5km swim, 40km bike, 10km run
     HALF_IRONMAN = "half_ironman"  # 1.9km swim, 90km bike, 21.1km run
     FULL_IRONMAN = "full_ironman"  # 3.8km swim, 180km bike, 42.2km run
 
 
-class FitnessLevel(str, Enum):
+class FitnessLevel(_LowercaseEnum):
     BEGINNER = "beginner"
     INTERMEDIATE = "intermediate"
     ADVANCED = "advanced"
@@ -38,17 +71,6 @@ class Workout(BaseModel):
     main_set: List[WorkoutInterval]
     cooldown: str
     notes: Optional[str] = None
-    
-    @field_validator('sport', mode='before')
-    @classmethod
-    def lowercase_sport(cls, v):
-        if isinstance(v, str):
-            v = v.lower()
-            # Map 'brick' to 'bike' (brick workouts are bike-to-run transitions)
-            if v == 'brick':
-                return 'bike'
-            return v
-        return v
 
 
 class WeekPlan(BaseModel):
@@ -65,13 +87,6 @@ class TrainingProgram(BaseModel):
     duration_weeks: int
     weeks: List[WeekPlan]
     notes: str
-    
-    @field_validator('goal', 'fitness_level', mode='before')
-    @classmethod
-    def lowercase_enums(cls, v):
-        if isinstance(v, str):
-            return v.lower()
-        return v
 
 
 class WorkoutRequest(BaseModel):
@@ -81,3 +96,31 @@ class WorkoutRequest(BaseModel):
     current_week: int = Field(default=1, ge=1)
     duration_weeks: int = Field(default=12, ge=4, le=52)
     focus_areas: Optional[List[str]] = None  # e.g., ["swimming technique", "bike endurance"]
+
+
+class BatchGenerateRequest(BaseModel):
+    requests: List[WorkoutRequest] = Field(min_length=1)
+    # Use the provider's batch API where supported: cheaper, but may take hours
+    provider_batch: bool = False
+
+
+class BulkExportRequest(BaseModel):
+    program_ids: List[int] = Field(min_length=1)
+    format: str = "ics"  # a key of app.exports.FORMATS
+    start: Optional[date] = None  # first day of week 1 (default: the day each program was saved)
+
+
+def loads_json(data: Union[str, bytes]) -> Any:
+    """Parse JSON with orjson when installed (raises json.JSONDecodeError either way)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_program(data: Union[str, bytes]) -> TrainingProgram:
+    """Parse and validate a TrainingProgram from raw JSON.
+
+    With the pinned pydantic-core, parsing with orjson and validating the dict
+    is faster than model_validate_json (see benchmarks/bench_validation.py).
+    """
+    return TrainingProgram.model_validate(loads_json(data))
@@ -0,0 +1,161 @@
+"""Deterministic program transformations: volume scaling and re-periodization.
+
+Used to adapt an existing program to a similar request (app.similarity), to
+derive mid-cycle variants (app.variants) and to repair rule violations
+(app.plan_validation) without another LLM call.
+"""
+import re
+from typing import List, Optional, Tuple
+
+from app.models import TrainingProgram, WeekPlan, WorkoutRequest
+
+# Focus keywords that mark a week as part of the taper / race block.
+_TAPER_WORDS = ("taper", "race")
+
+# Phases of a cycle, in order; shares follow the system prompt (base 60-70%,
+# build 20-30%, peak 5-10%, taper 1-2 weeks).
+PHASES = ("Base", "Build", "Peak", "Taper")
+
+# A leading phase name in a week's focus, e.g. "Base Building - ", "Peak phase: ".
+_PHASE_PREFIX = re.compile(
+    r"^\s*(base|build|peak|taper)\w*(\s+(phase|building|block))?\s*[-:\u2013\u2014]*\s*",
+    re.IGNORECASE,
+)
+
+
+def scale_week(week: WeekPlan, factor: float) -> None:
+    """Scale a week's durations and distances in place by ``factor``."""
+    for workout in week.workouts:
+        workout.total_duration_minutes = max(1, int(workout.total_duration_minutes * factor))
+        if workout.total_distance_km is not None:
+            workout.total_distance_km = round(workout.total_distance_km * factor, 1)
+        for interval in workout.main_set:
+            if interval.duration_minutes is not None:
+                interval.duration_minutes = max(1, int(interval.duration_minutes * factor))
+            if interval.distance_km is not None:
+                interval.distance_km = round(interval.distance_km * factor, 2)
+    week.weekly_distance_km = round(week.weekly_distance_km * factor, 1)
+    week.weekly_volume_hours = round(
+        sum(workout.total_duration_minutes for workout in week.workouts) / 60, 1
+    )
+
+
+def taper_length(weeks: List[WeekPlan], limit: int = 3) -> int:
+    """Number of trailing weeks whose focus marks them as taper / race weeks."""
+    count = 0
+    for week in reversed(weeks):
+        if count >= limit or not any(word in week.focus.lower() for word in _TAPER_WORDS):
+            break
+        count += 1
+    return count
+
+
+def resample_weeks(weeks: List[WeekPlan], target_weeks: int) -> List[WeekPlan]:
+    """Trim or pad ``weeks`` to ``target_weeks``, keeping the phase order.
+
+    The taper block is kept as-is and the weeks before it are stretched or
+    compressed evenly (padding repeats weeks, trimming drops them), so base,
+    build and peak keep their share of the program. Weeks are renumbered.
+    """
+    taper = min(taper_length(weeks), max(0, target_weeks - 1))
+    body, tail = weeks[:len(weeks) - taper], weeks[len(weeks) - taper:]
+    body_target = target_weeks - len(tail)
+    if body:
+        resampled = [
+            body[i * len(body) // body_target].model_copy(deep=True)
+            for i in range(body_target)
+        ]
+    else:
+        resampled = [tail[0].model_copy(deep=True) for _ in range(body_target)]
+    result = resampled + [week.model_copy(deep=True) for week in tail]
+    for number, week in enumerate(result, start=1):
+        week.week_number = number
+    return result
+
+
+def adapt_program(
+    program: TrainingProgram,
+    source_hours: float,
+    request: WorkoutRequest,
+    source_program_id: Optional[int] = None,
+) -> TrainingProgram:
+    """A copy of ``program`` fitted to ``request``'s hours and duration."""
+    weeks = resample_weeks(program.weeks, request.duration_weeks)
+    factor = request.available_hours_per_week / source_hours if source_hours else 1.0
+    if abs(factor - 1) > 1e-9:
+        for week in weeks:
+            scale_week(week, factor)
+    source = f" program #{source_program_id}" if source_program_id is not None else ""
+    notes = (
+        f"{program.notes}\n\nAdapted from{source or ' a previous program'} "
+        f"({len(program.weeks)} weeks, {source_hours:g} h/week) to "
+        f"{request.duration_weeks} weeks at {request.available_hours_per_week} h/week."
+    )
+    return program.model_copy(update={
+        "goal": request.goal,
+        "fitness_level": request.fitness_level,
+        "duration_weeks": request.duration_weeks,
+        "weeks": weeks,
+        "notes": notes,
+    })
+
+
+def phase_lengths(total_weeks: int) -> Tuple[int, int, int, int]:
+    """Weeks of base, build, peak and taper in a ``total_weeks`` cycle."""
+    taper = 1 if total_weeks < 8 else 2
+    peak = max(1, round(total_weeks * 0.08)) if total_weeks > 4 else 0
+    build = round(total_weeks * 0.25)
+    base = max(1, total_weeks - taper - peak - build)
+    return base, total_weeks - taper - peak - base, peak, taper
+
+
+def phase_for_week(week_number: int, total_weeks: int) -> str:
+    """The phase (one of PHASES) of 1-based ``week_number`` in a ``total_weeks`` cycle."""
+    end = 0
+    for phase, length in zip(PHASES, phase_lengths(total_weeks)):
+        end += length
+        if week_number <= end:
+            return phase
+    return PHASES[-1]
+
+
+def relabel_focus(focus: str, phase: str) -> str:
+    """``focus`` with its leading phase name replaced by ``phase``.
+
+    Recovery and race weeks keep their focus; it says more than the phase.
+    """
+    lowered = focus.lower()
+    if "recovery" in lowered or "race" in lowered:
+        return focus
+    detail = _PHASE_PREFIX.sub("", focus, count=1).strip()
+    return f"{phase} - {detail}" if detail else f"{phase} phase"
+
+
+def derive_from_week(
+    program: TrainingProgram, start_week: int, source_program_id: Optional[int] = None
+) -> TrainingProgram:
+    """Weeks ``start_week``..end of ``program``, for an athlete joining mid-cycle.
+
+    The race date is unchanged, so each week keeps the phase of its position
+    in the full cycle; the weeks are renumbered from 1 and relabelled.
+    """
+    total = len(program.weeks)
+    if not 1 <= start_week <= total:
+        raise ValueError(f"start_week must be between 1 and {total}, got {start_week}")
+    weeks = [week.model_copy(deep=True) for week in program.weeks[start_week - 1:]]
+    for offset, week in enumerate(weeks):
+        week.focus = relabel_focus(week.focus, phase_for_week(start_week + offset, total))
+        week.week_number = offset + 1
+    if source_program_id is not None:
+        source = f"the {total}-week program #{source_program_id}"
+    else:
+        source = f"a {total}-week program"
+    notes = (
+        f"{program.notes}\n\nWeeks {start_week}-{total} of {source}, "
+        f"for an athlete joining at week {start_week}."
+    )
+    return program.model_copy(update={
+        "duration_weeks": len(weeks),
+        "weeks": weeks,
+        "notes": notes,
+    })
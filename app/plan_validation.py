@@ -0,0 +1,222 @@
+"""Rule checks for generated programs, computed over flattened NumPy arrays.
+
+The rules are the ones the system prompt asks the LLM to follow:
+  volume_jump            a week's minutes exceed the highest previous week by
+                         more than plan_max_volume_increase (so returning to
+                         volume after a recovery week is not a jump)
+  missing_rest_day       more than plan_max_workouts_per_week workouts
+  weekly_volume_mismatch weekly_volume_hours disagrees with the sum of
+                         total_duration_minutes
+  interval_overflow      main-set interval minutes exceed the workout total
+
+A program is flattened once into per-week, per-workout and per-interval
+arrays and every rule is a handful of array operations, so a 52-week program
+is checked in well under a millisecond. PLAN_VALIDATION decides what
+`check_program` does with violations before the program is saved: "off",
+"warn" (log and count them), "reject" (raise PlanValidationError) or "repair"
+(fix them deterministically, without another LLM call).
+"""
+import logging
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.metrics import plan_violations
+from app.models import TrainingProgram
+from app.periodization import scale_week
+
+logger = logging.getLogger("app.plan_validation")
+
+MODES = ("off", "warn", "reject", "repair")
+# weekly_volume_hours is usually given to 0.1 h.
+_MIN_VOLUME_TOLERANCE_MINUTES = 6.0
+
+
+@dataclass
+class Violation:
+    """One broken rule, located by week (and workout, 0-based within the week)."""
+    rule: str
+    week_number: int
+    message: str
+    value: float
+    limit: float
+    workout_index: Optional[int] = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class PlanValidationError(ValueError):
+    """Raised by check_program in "reject" mode."""
+
+    def __init__(self, violations: List[Violation]):
+        self.violations = violations
+        super().__init__(
+            f"Generated program breaks {len(violations)} training rule(s): "
+            + "; ".join(v.message for v in violations[:5])
+        )
+
+
+@dataclass
+class _Arrays:
+    week_numbers: np.ndarray  # per week
+    week_hours: np.ndarray  # per week, as stated
+    week_minutes: np.ndarray  # per week, sum of workout totals
+    workouts_per_week: np.ndarray  # per week
+    workout_week: np.ndarray  # per workout: index of its week
+    workout_minutes: np.ndarray  # per workout
+    interval_minutes: np.ndarray  # per workout, sum of main-set durations
+
+
+def _flatten(program: TrainingProgram) -> _Arrays:
+    # Plain comprehensions: most of the cost is attribute access on the models.
+    weeks = program.weeks
+    workouts = [workout for week in weeks for workout in week.workouts]
+    counts = np.array([len(week.workouts) for week in weeks], dtype=np.int64)
+    minutes = np.array([workout.total_duration_minutes for workout in workouts], dtype=float)
+    workout_week = np.repeat(np.arange(len(weeks)), counts)
+    interval_workout = np.repeat(
+        np.arange(len(workouts)),
+        np.array([len(workout.main_set) for workout in workouts], dtype=np.int64),
+    )
+    interval_minutes = np.array(
+        [i.duration_minutes or 0 for workout in workouts for i in workout.main_set], dtype=float
+    )
+    return _Arrays(
+        week_numbers=np.array([week.week_number for week in weeks]),
+        week_hours=np.array([week.weekly_volume_hours for week in weeks], dtype=float),
+        week_minutes=np.bincount(workout_week, weights=minutes, minlength=len(weeks)),
+        workouts_per_week=counts,
+        workout_week=workout_week,
+        workout_minutes=minutes,
+        interval_minutes=np.bincount(
+            interval_workout, weights=interval_minutes, minlength=len(workouts)
+        ),
+    )
+
+
+def validate_program(program: TrainingProgram) -> List[Violation]:
+    """All rule violations of ``program``, in rule order then week order."""
+    if not program.weeks:
+        return []
+    a = _flatten(program)
+    violations = []
+
+    max_increase = settings.plan_max_volume_increase
+    prior_peak = np.maximum.accumulate(a.week_minutes)[:-1]
+    allowed = prior_peak * (1 + max_increase)
+    for i in np.flatnonzero((prior_peak > 0) & (a.week_minutes[1:] > allowed + 1e-9)):
+        increase = a.week_minutes[i + 1] / prior_peak[i] - 1
+        violations.append(Violation(
+            "volume_jump", int(a.week_numbers[i + 1]),
+            f"week {a.week_numbers[i + 1]} volume is {increase:.0%} above the highest "
+            f"previous week (max {max_increase:.0%})",
+            round(float(a.week_minutes[i + 1]), 1), round(float(allowed[i]), 1),
+        ))
+
+    max_workouts = settings.plan_max_workouts_per_week
+    for i in np.flatnonzero(a.workouts_per_week > max_workouts):
+        violations.append(Violation(
+            "missing_rest_day", int(a.week_numbers[i]),
+            f"week {a.week_numbers[i]} has {a.workouts_per_week[i]} workouts and no rest day",
+            int(a.workouts_per_week[i]), max_workouts,
+        ))
+
+    stated = a.week_hours * 60
+    tolerance = np.maximum(
+        a.week_minutes * settings.plan_volume_tolerance, _MIN_VOLUME_TOLERANCE_MINUTES
+    )
+    for i in np.flatnonzero(np.abs(stated - a.week_minutes) > tolerance):
+        violations.append(Violation(
+            "weekly_volume_mismatch", int(a.week_numbers[i]),
+            f"week {a.week_numbers[i]} states {a.week_hours[i]:g} h but its workouts "
+            f"add up to {a.week_minutes[i] / 60:.1f} h",
+            float(a.week_hours[i]), round(float(a.week_minutes[i]) / 60, 2),
+        ))
+
+    if len(a.workout_minutes):
+        week_start = np.concatenate(([0], np.cumsum(a.workouts_per_week)[:-1]))
+        for j in np.flatnonzero(a.interval_minutes > a.workout_minutes):
+            week = a.workout_week[j]
+            violations.append(Violation(
+                "interval_overflow", int(a.week_numbers[week]),
+                f"week {a.week_numbers[week]} workout {j - week_start[week] + 1}: intervals "
+                f"add up to {a.interval_minutes[j]:g} min, more than its "
+                f"{a.workout_minutes[j]:g} min total",
+                float(a.interval_minutes[j]), float(a.workout_minutes[j]),
+                workout_index=int(j - week_start[week]),
+            ))
+    return violations
+
+
+def repair_program(program: TrainingProgram) -> TrainingProgram:
+    """A copy of ``program`` with every rule enforced.
+
+    Weeks with too many workouts lose their shortest ones, weeks that jump
+    in volume are scaled down to the allowed increase, intervals that
+    overflow their workout are shortened proportionally, and
+    weekly_volume_hours is recomputed from the workouts.
+    """
+    program = program.model_copy(deep=True)
+    max_workouts = settings.plan_max_workouts_per_week
+    max_increase = settings.plan_max_volume_increase
+    peak = 0.0
+    for week in program.weeks:
+        if len(week.workouts) > max_workouts:
+            keep = sorted(
+                range(len(week.workouts)),
+                key=lambda i: week.workouts[i].total_duration_minutes,
+                reverse=True,
+            )[:max_workouts]
+            week.workouts = [week.workouts[i] for i in sorted(keep)]
+
+        minutes = sum(workout.total_duration_minutes for workout in week.workouts)
+        if peak and minutes > peak * (1 + max_increase):
+            scale_week(week, peak * (1 + max_increase) / minutes)
+            minutes = sum(workout.total_duration_minutes for workout in week.workouts)
+        peak = max(peak, minutes)
+
+        for workout in week.workouts:
+            interval_total = sum(i.duration_minutes or 0 for i in workout.main_set)
+            if interval_total > workout.total_duration_minutes:
+                factor = workout.total_duration_minutes / interval_total
+                for interval in workout.main_set:
+                    if interval.duration_minutes:
+                        interval.duration_minutes = int(interval.duration_minutes * factor)
+        week.weekly_volume_hours = round(minutes / 60, 1)
+    return program
+
+
+def check_program(
+    program: TrainingProgram, mode: Optional[str] = None
+) -> Tuple[TrainingProgram, List[Violation]]:
+    """Apply PLAN_VALIDATION to a generated program before it is saved.
+
+    Returns the program to save (repaired in "repair" mode) and the
+    violations found in the generated program; raises PlanValidationError in
+    "reject" mode.
+    """
+    mode = (mode or settings.plan_validation).lower()
+    if mode not in MODES:
+        raise ValueError(f"Unknown PLAN_VALIDATION {mode!r}; use one of {', '.join(MODES)}")
+    if mode == "off":
+        return program, []
+    violations = validate_program(program)
+    for violation in violations:
+        plan_violations.inc(rule=violation.rule, mode=mode)
+    if not violations:
+        return program, []
+    if mode == "reject":
+        raise PlanValidationError(violations)
+    if mode == "repair":
+        program = repair_program(program)
+        remaining = validate_program(program)
+        if remaining:
+            logger.warning("Plan still breaks %d rule(s) after repair: %s",
+                           len(remaining), remaining[0].message)
+    else:
+        logger.warning("Generated plan breaks %d rule(s): %s",
+                       len(violations), "; ".join(v.message for v in violations[:5]))
+    return program, violations
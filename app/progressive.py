@@ -0,0 +1,252 @@
+"""Progressive generation: a program a chunk of weeks per provider call.
+
+Programs whose predicted output does not fit one response (app.token_budget)
+are generated in chunks of the plan's chunk_weeks weeks (GENERATION_CHUNK_WEEKS,
+e.g. a 4-week mesocycle, or fewer when the provider's output cap requires).
+Chunks never span two phases (app.periodization) and a phase is split into
+chunks of even length. Instead of the earlier weeks' JSON, each call carries
+one line per week of the previous chunk (focus, volume, distance, minutes per
+sport) and the highest weekly volume so far, which is what the progression
+rules need.
+
+With GENERATION_CHUNK_PARALLEL above 1, that many chunks of one phase are
+requested at once. They all see the weeks before the phase rather than the
+chunk right before them, so progression inside a phase is looser; phases
+still run in order.
+"""
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+from app.config import settings
+from app.metrics import span
+from app.models import TrainingProgram, WeekPlan, WorkoutRequest
+from app.periodization import PHASES, phase_lengths
+from app.storage import summarize_week
+from app.token_budget import GenerationPlan
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """Weeks ``first_week``-``last_week`` (1-based, inclusive), all in ``phase``."""
+
+    phase: str
+    first_week: int
+    last_week: int
+    phase_first_week: int
+    phase_weeks: int
+
+    @property
+    def weeks(self) -> int:
+        return self.last_week - self.first_week + 1
+
+
+# agent.generate_weeks(request, chunk, context, progress=...) -> one dict per week
+ChunkGenerator = Callable[..., List[Dict[str, Any]]]
+
+
+def plan_chunks(total_weeks: int, chunk_weeks: int) -> List[List[Chunk]]:
+    """Chunks of at most ``chunk_weeks`` weeks, grouped by phase, in order."""
+    phases: List[List[Chunk]] = []
+    start = 1
+    for phase, length in zip(PHASES, phase_lengths(total_weeks)):
+        if length <= 0:
+            continue
+        count = math.ceil(length / max(1, chunk_weeks))
+        chunks, first = [], start
+        for index in range(count):
+            size = length // count + (1 if index < length % count else 0)
+            chunks.append(Chunk(phase, first, first + size - 1, start, length))
+            first += size
+        phases.append(chunks)
+        start += length
+    return phases
+
+
+def chunk_context(previous: List[WeekPlan], peak_hours: float) -> str:
+    """What a chunk's prompt says about the weeks before it."""
+    if not previous:
+        return "These are the first weeks of the program."
+    lines = ["Previous weeks (continue the progression from these; do not repeat them):"]
+    for week in previous:
+        summary = summarize_week(week)
+        minutes = summary["sport_minutes"]
+        lines.append(
+            f"- Week {summary['week_number']}, {summary['focus']}: "
+            f"{summary['weekly_volume_hours']:g} h, {summary['weekly_distance_km']:g} km, "
+            f"{summary['workout_count']} workouts "
+            f"(swim {minutes['swim']}, bike {minutes['bike']}, run {minutes['run']} min)"
+        )
+    limit = round(peak_hours * (1 + settings.plan_max_volume_increase), 1)
+    lines.append(
+        f"Highest weekly volume so far: {peak_hours:g} h; no week above {limit:g} h."
+    )
+    return "\n".join(lines)
+
+
+def chunk_prompt(request: WorkoutRequest, chunk: Chunk, context: str, race: str) -> str:
+    """User prompt asking for the weeks of ``chunk`` as {"weeks": [...]}."""
+    phase_position = chunk.first_week - chunk.phase_first_week + 1
+    weeks = (
+        f"Week {chunk.first_week}" if chunk.weeks == 1
+        else f"Weeks {chunk.first_week}-{chunk.last_week}"
+    )
+    return f"""Create {weeks} of a {request.duration_weeks}-week {race} training program.
+
+**Phase**: {chunk.phase} (weeks {phase_position}-{phase_position + chunk.weeks - 1} of a {chunk.phase_weeks}-week {chunk.phase} phase)
+**Fitness Level**: {request.fitness_level.value}
+**Available Hours**: {request.available_hours_per_week} hours/week
+
+{context}
+
+Return a JSON object with one entry per week, week_number {chunk.first_week} to {chunk.last_week} (be CONCISE in descriptions):
+```json
+{{
+  "weeks": [
+    {{
+      "week_number": {chunk.first_week},
+      "focus": "{chunk.phase} Training",
+      "workouts": [
+        {{
+          "sport": "swim|bike|run",
+          "title": "Brief title",
+          "total_duration_minutes": 60,
+          "total_distance_km": 5.0,
+          "warmup": "Brief description",
+          "main_set": [
+            {{
+              "duration_minutes": 30,
+              "distance_km": 3.0,
+              "intensity": "Zone 2",
+              "description": "Brief description"
+            }}
+          ],
+          "cooldown": "Brief description",
+          "notes": "Brief notes"
+        }}
+      ],
+      "weekly_volume_hours": 6.5,
+      "weekly_distance_km": 45.0
+    }}
+  ]
+}}
+```
+
+Create 5-6 workouts per week. Include swim, bike, run. Recovery week every 3-4 weeks. Keep descriptions under 10 words. Return ONLY valid JSON.
+"""
+
+
+def chunk_weeks_data(data: Any) -> List[Dict[str, Any]]:
+    """The week dicts of a parsed chunk response ({"weeks": [...]}, a list or one week)."""
+    if isinstance(data, dict) and isinstance(data.get("weeks"), list):
+        return data["weeks"]
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict) and "workouts" in data:
+        return [data]
+    raise ValueError("Chunk response has no weeks")
+
+
+class _ParallelProgress:
+    """``progress`` of chunks generated at once: their streamed text is not counted.
+
+    GenerationJob.text counts weeks in one stream, and the streams of
+    concurrent chunks would be added up; generate_progressive reports each
+    chunk's weeks when it finishes instead.
+    """
+
+    def __init__(self, progress):
+        self._progress = progress
+
+    def __getattr__(self, name):
+        return getattr(self._progress, name)
+
+    def text(self, chunk: str) -> None:
+        pass
+
+
+def _generate_chunk(
+    request: WorkoutRequest,
+    chunk: Chunk,
+    context: str,
+    generate_chunk: ChunkGenerator,
+    provider: str,
+    progress,
+) -> List[WeekPlan]:
+    with span("chunk", provider=provider, first_week=chunk.first_week, weeks=chunk.weeks, phase=chunk.phase):
+        weeks_data = generate_chunk(request, chunk, context, progress=progress)
+        if len(weeks_data) < chunk.weeks:
+            raise ValueError(
+                f"Weeks {chunk.first_week}-{chunk.last_week}: "
+                f"model returned {len(weeks_data)} of {chunk.weeks} weeks"
+            )
+        with span("validation", provider=provider, week=chunk.first_week):
+            weeks = [WeekPlan.model_validate(data) for data in weeks_data[:chunk.weeks]]
+    for number, week in enumerate(weeks, start=chunk.first_week):
+        week.week_number = number
+    return weeks
+
+
+def generate_progressive(
+    request: WorkoutRequest,
+    plan: GenerationPlan,
+    generate_chunk: ChunkGenerator,
+    provider: str,
+    progress=None,
+) -> TrainingProgram:
+    """Generate ``request`` chunk by chunk with ``generate_chunk`` (an agent's generate_weeks).
+
+    A cancelled ``progress`` job (app.generation.GenerationJob) stops at its
+    next provider call; ``progress.week_done`` follows the finished weeks.
+    """
+    weeks: List[WeekPlan] = []
+    previous: List[WeekPlan] = []  # the last chunk generated
+    peak_hours = 0.0
+    phases = plan_chunks(request.duration_weeks, plan.chunk_weeks)
+    for chunks in phases:
+        parallel = min(max(1, settings.generation_chunk_parallel), len(chunks))
+        if parallel == 1:
+            for chunk in chunks:
+                context = chunk_context(previous, peak_hours)
+                previous = _generate_chunk(request, chunk, context, generate_chunk, provider, progress)
+                weeks.extend(previous)
+                peak_hours = max(peak_hours, *(week.weekly_volume_hours for week in previous))
+                if progress is not None:
+                    progress.week_done(len(weeks))
+            continue
+
+        context = chunk_context(previous, peak_hours)
+        done = len(weeks)
+        chunk_progress = _ParallelProgress(progress) if progress is not None else None
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            futures = {
+                pool.submit(
+                    _generate_chunk, request, chunk, context, generate_chunk, provider, chunk_progress
+                ): chunk
+                for chunk in chunks
+            }
+            results: Dict[int, List[WeekPlan]] = {}
+            try:
+                for future in as_completed(futures):
+                    results[futures[future].first_week] = future.result()
+                    done += futures[future].weeks
+                    if progress is not None:
+                        progress.week_done(done)
+            except BaseException:
+                for future in futures:
+                    future.cancel()  # chunks not started yet
+                raise
+        for chunk in chunks:
+            weeks.extend(results[chunk.first_week])
+        previous = results[chunks[-1].first_week]
+        peak_hours = max(peak_hours, *(week.weekly_volume_hours for week in weeks))
+
+    phase_notes = ", ".join(f"{chunks[0].phase_weeks}w {chunks[0].phase}" for chunks in phases)
+    return TrainingProgram(
+        goal=request.goal,
+        fitness_level=request.fitness_level,
+        duration_weeks=request.duration_weeks,
+        weeks=weeks,
+        notes=f"{request.duration_weeks}-week {request.goal.value} program with {phase_notes} phases",
+    )
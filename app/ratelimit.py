@@ -0,0 +1,86 @@
+"""Token-bucket rate limiting of LLM provider requests.
+
+Every provider request (a whole program, one week of a progressive
+generation, or one provider batch submission) takes a token from a bucket
+shared by all requests in the process, refilled at LLM_REQUESTS_PER_MINUTE
+and holding at most LLM_RATE_LIMIT_BURST tokens. The limit is per process:
+with several gunicorn workers, divide the provider quota between them.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+from app.config import settings
+from app.metrics import span
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, ``capacity`` at most."""
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take ``tokens`` if available and return 0, else the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Block until ``tokens`` are taken; False if ``timeout`` runs out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+_limiter: Optional[TokenBucket] = None
+_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter() -> Optional[TokenBucket]:
+    """This process's provider rate limiter, or None when unlimited."""
+    global _limiter
+    if settings.llm_requests_per_minute <= 0:
+        return None
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = TokenBucket(
+                    settings.llm_requests_per_minute / 60, settings.llm_rate_limit_burst
+                )
+    return _limiter
+
+
+def acquire_llm_slot(provider: str) -> None:
+    """Wait for the provider rate limit; time spent waiting is its own stage."""
+    limiter = get_llm_limiter()
+    if limiter is None or limiter.try_acquire() == 0:
+        return
+    with span("rate_limit_wait", provider=provider):
+        limiter.acquire()
+
+
+def _reset_after_fork():
+    global _limiter, _limiter_lock
+    _limiter = None
+    _limiter_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
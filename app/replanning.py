@@ -0,0 +1,254 @@
+"""Replanning of upcoming weeks from logged workouts.
+
+Logged workouts (WorkoutHistory rows with a program_id) fall in the program
+week counted from the program's created_at, as in app.analytics. Logging a
+workout schedules a replan of its program after REPLAN_DEBOUNCE_SECONDS; a
+burst of logs for the same program moves the timer instead of adding runs.
+
+A replan compares the last REPLAN_LOOKBACK_WEEKS finished weeks with the plan:
+completed vs planned minutes and kilometres, with the mean rating (taken as
+perceived difficulty, 3 = as expected) nudging the result. The weeks after the
+current one are then scaled by that factor, bounded by REPLAN_MAX_DECREASE
+and PLAN_MAX_VOLUME_INCREASE. Changes under REPLAN_MIN_CHANGE are ignored;
+above REPLAN_LLM_CHANGE the next week is regenerated by the LLM for the
+adjusted hours, since scaling alone no longer gives a sensible week. A
+program is replanned at most once per program week, so late logs do not
+compound the scaling.
+
+The debounce timers are per worker, so logs for one program reaching
+different workers can start a replan on each. A replan therefore claims the
+week in the database (a conditional update of replanned_week) before
+changing anything, and only the first claim proceeds. At most
+REPLAN_LLM_CONCURRENCY LLM regenerations run at once per worker.
+"""
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SavedProgram, SessionLocal, WorkoutHistory
+from app.metrics import replans, span
+from app.models import TrainingProgram, WeekPlan, WorkoutRequest, parse_program
+from app.periodization import phase_for_week, scale_week
+from app.plan_validation import PlanValidationError, check_program
+from app.repository import ProgramRepository
+
+logger = logging.getLogger("app.replanning")
+
+# Volume change per rating point away from 3 (e.g. a mean rating of 5 -> -10%).
+RATING_STEP = 0.05
+
+_llm_slots = threading.BoundedSemaphore(max(1, settings.replan_llm_concurrency))
+
+
+@dataclass
+class WeekCompliance:
+    week_number: int
+    planned_minutes: int
+    planned_km: float
+    completed_minutes: int = 0
+    completed_km: float = 0.0
+    ratings: List[int] = field(default_factory=list)
+
+
+def program_week(started: datetime, when: datetime) -> int:
+    """1-based program week of ``when`` for a program started at ``started``."""
+    return (when - started).days // 7 + 1
+
+
+def compare(
+    program: TrainingProgram, started: datetime, history: List[WorkoutHistory]
+) -> Dict[int, WeekCompliance]:
+    """Planned vs completed volume per program week."""
+    weeks = {
+        week.week_number: WeekCompliance(
+            week.week_number,
+            sum(workout.total_duration_minutes for workout in week.workouts),
+            sum(workout.total_distance_km or 0 for workout in week.workouts),
+        )
+        for week in program.weeks
+    }
+    for workout in history:
+        if workout.completed_at < started:
+            continue
+        week = weeks.get(program_week(started, workout.completed_at))
+        if week is None:
+            continue
+        week.completed_minutes += workout.duration_minutes
+        week.completed_km += workout.distance_km or 0
+        if workout.rating is not None:
+            week.ratings.append(workout.rating)
+    return weeks
+
+
+def volume_factor(weeks: List[WeekCompliance]) -> float:
+    """Scale for the upcoming weeks from the compliance of ``weeks``."""
+    planned = sum(week.planned_minutes for week in weeks)
+    ratios = [sum(week.completed_minutes for week in weeks) / planned] if planned else []
+    planned_km = sum(week.planned_km for week in weeks)
+    completed_km = sum(week.completed_km for week in weeks)
+    if planned_km and completed_km:  # distances are optional when logging
+        ratios.append(completed_km / planned_km)
+    factor = sum(ratios) / len(ratios) if ratios else 1.0
+    ratings = [rating for week in weeks for rating in week.ratings]
+    if ratings:
+        factor *= 1 - RATING_STEP * (sum(ratings) / len(ratings) - 3)
+    return min(1 + settings.plan_max_volume_increase, max(1 - settings.replan_max_decrease, factor))
+
+
+def _regenerated_week(
+    agent, saved: SavedProgram, week: WeekPlan, factor: float, total: int
+) -> WeekPlan:
+    request = WorkoutRequest.model_validate_json(saved.request_json)
+    hours = min(30, max(3, round(request.available_hours_per_week * factor)))
+    data = agent.generate_single_week(
+        request.model_copy(update={"available_hours_per_week": hours}),
+        week.week_number,
+        phase_for_week(week.week_number, total),
+    )
+    new_week = WeekPlan.model_validate(data)
+    new_week.week_number = week.week_number
+    return new_week
+
+
+def replan_program(
+    db: Session, program_id: int, agent_factory=None, now: Optional[datetime] = None
+) -> dict:
+    """Rescale (or regenerate) the weeks after the current one; returns what was done.
+
+    ``agent_factory`` is called only when a week is regenerated, so a provider
+    that cannot be built still leaves the weeks scaled.
+    """
+    now = now or datetime.utcnow()
+    saved = ProgramRepository.get_program(db, program_id)
+    if saved is None:
+        return {"status": "not_found"}
+    started = saved.created_at or now
+    current = program_week(started, now)
+    program = parse_program(saved.program_text)
+    total = len(program.weeks)
+    if current >= total:
+        return {"status": "skipped", "reason": "no upcoming weeks", "current_week": current}
+    if saved.replanned_week is not None and saved.replanned_week >= current:
+        return {"status": "skipped", "reason": "already replanned", "current_week": current}
+
+    history = list(db.scalars(
+        select(WorkoutHistory).where(WorkoutHistory.program_id == program_id)
+    ))
+    compliance = compare(program, started, history)
+    lookback = [
+        compliance[number]
+        for number in range(max(1, current - settings.replan_lookback_weeks), current)
+        if number in compliance
+    ]
+    if not lookback:
+        return {"status": "skipped", "reason": "no finished weeks", "current_week": current}
+    factor = volume_factor(lookback)
+    result = {"current_week": current, "factor": round(factor, 3), "weeks": [current + 1, total]}
+    if abs(factor - 1) < settings.replan_min_change:
+        return {"status": "unchanged", **result}
+
+    previous = saved.replanned_week
+    if not ProgramRepository.claim_replan(db, program_id, current):
+        return {"status": "skipped", "reason": "already replanned", "current_week": current}
+    try:
+        changed = _replan_weeks(db, saved, program, agent_factory, current, factor, now)
+    except BaseException:
+        ProgramRepository.release_replan(db, program_id, current, previous)
+        raise
+    if changed["status"] == "rejected":
+        ProgramRepository.release_replan(db, program_id, current, previous)
+    return {**changed, **result}
+
+
+def _replan_weeks(
+    db: Session, saved: SavedProgram, program: TrainingProgram, agent_factory,
+    current: int, factor: float, now: datetime,
+) -> dict:
+    """Rescale or regenerate the weeks after ``current`` and save the program."""
+    program_id = saved.id
+    total = len(program.weeks)
+    upcoming = program.weeks[current:]
+    regenerated = []
+    regenerate = saved.request_json and abs(factor - 1) >= settings.replan_llm_change
+    if agent_factory is not None and regenerate:
+        try:
+            agent = agent_factory()
+            with _llm_slots:
+                upcoming[0] = _regenerated_week(agent, saved, upcoming[0], factor, total)
+            program.weeks[current] = upcoming[0]
+            regenerated.append(upcoming[0].week_number)
+        except Exception:
+            logger.exception(
+                "Regenerating week %d of program %d failed; scaling it", current + 1, program_id
+            )
+    for week in upcoming:
+        if week.week_number not in regenerated:
+            scale_week(week, factor)
+
+    percent = round((factor - 1) * 100)
+    program.notes = (
+        f"{program.notes}\n\nReplanned in week {current} ({now:%Y-%m-%d}): weeks "
+        f"{current + 1}-{total} {'+' if percent > 0 else ''}{percent}% volume from logged workouts."
+    )
+    try:
+        program, _ = check_program(program)
+    except PlanValidationError as e:
+        logger.warning("Replan of program %d rejected: %s", program_id, e)
+        return {"status": "rejected"}
+    ProgramRepository.update_program(db, program_id, program, replanned_week=current)
+    return {"status": "regenerated" if regenerated else "scaled", "regenerated_weeks": regenerated}
+
+
+def run_replan(program_id: int, agent_factory=None) -> dict:
+    """Replan ``program_id`` in its own session (blocking), counting the outcome."""
+    db = SessionLocal()
+    try:
+        with span("replan", provider=settings.llm_provider.lower(), program_id=program_id):
+            result = replan_program(db, program_id, agent_factory)
+    except Exception:
+        logger.exception("Replanning program %d failed", program_id)
+        result = {"status": "failed"}
+    finally:
+        db.close()
+    replans.inc(outcome=result["status"])
+    return result
+
+
+_timers: Dict[int, threading.Timer] = {}
+_timers_lock = threading.Lock()
+
+
+def schedule_replan(program_id: int, agent_factory) -> None:
+    """Replan ``program_id`` once no workout has been logged for it for the debounce time."""
+    def fire():
+        with _timers_lock:
+            if _timers.get(program_id) is not timer:
+                return  # superseded by a later log
+            del _timers[program_id]
+        run_replan(program_id, agent_factory)
+
+    timer = threading.Timer(settings.replan_debounce_seconds, fire)
+    timer.daemon = True
+    with _timers_lock:
+        previous = _timers.get(program_id)
+        if previous is not None:
+            previous.cancel()
+        _timers[program_id] = timer
+    timer.start()
+
+
+def _reset_after_fork():
+    global _timers_lock, _llm_slots
+    _timers.clear()
+    _timers_lock = threading.Lock()
+    _llm_slots = threading.BoundedSemaphore(max(1, settings.replan_llm_concurrency))
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,34 +1,289 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from sqlalchemy import Select, Text, cast, func, literal_column, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
 import json
-from app.database import SavedProgram, WorkoutHistory
-from app.models import TrainingProgram
+import logging
+from app.cache import get_program_cache
+from app.config import settings
+from app.database import (
+    IS_POSTGRES,
+    SavedProgram,
+    WorkoutHistory,
+    content_hash_for,
+    get_write_queue,
+)
+from app.models import TrainingProgram, parse_program
+from app.storage import (
+    COMPACT_PLACEHOLDER,
+    FORMAT_COMPACT,
+    FORMAT_JSON,
+    compact_available,
+    decode_compact_json,
+    encode_compact_checked,
+    serialize_program,
+    week_range_bounds,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Query builders are plain SQLAlchemy 2.0 statements so the same queries can be
+# executed by a sync Session or an AsyncSession.
+
+def _list_programs_stmt(skip: int, limit: int, goal: Optional[str]) -> Select:
+    stmt = select(SavedProgram)
+    if goal:
+        stmt = stmt.where(SavedProgram.goal == goal)
+    return stmt.order_by(SavedProgram.created_at.desc()).offset(skip).limit(limit)
+
+
+def _workout_history_stmt(
+    program_id: Optional[int], sport: Optional[str], skip: int, limit: int
+) -> Select:
+    stmt = select(WorkoutHistory)
+    if program_id:
+        stmt = stmt.where(WorkoutHistory.program_id == program_id)
+    if sport:
+        stmt = stmt.where(WorkoutHistory.sport == sport)
+    return stmt.order_by(WorkoutHistory.completed_at.desc()).offset(skip).limit(limit)
+
+
+def _workout_stats_stmt(sport: Optional[str]) -> Select:
+    stmt = select(
+        func.count(WorkoutHistory.id),
+        func.sum(WorkoutHistory.duration_minutes),
+        func.sum(func.coalesce(WorkoutHistory.distance_km, 0)),
+        # Unrated (NULL or 0) workouts don't count towards the average.
+        func.avg(func.nullif(WorkoutHistory.rating, 0)),
+    )
+    if sport:
+        stmt = stmt.where(WorkoutHistory.sport == sport)
+    return stmt
+
+
+def _workout_stats_from_row(row) -> dict:
+    total_workouts, total_duration, total_distance, avg_rating = row
+    if not total_workouts:
+        return {
+            "total_workouts": 0,
+            "total_duration_minutes": 0,
+            "total_distance_km": 0,
+            "average_rating": 0
+        }
+    return {
+        "total_workouts": total_workouts,
+        "total_duration_minutes": int(total_duration or 0),
+        "total_distance_km": round(float(total_distance or 0), 2),
+        "average_rating": round(float(avg_rating or 0), 2)
+    }
+
+
+def _week_index_stmt(program_id: int) -> Select:
+    return select(
+        SavedProgram.content_hash, SavedProgram.week_offsets, SavedProgram.week_summary
+    ).where(SavedProgram.id == program_id)
+
+
+def _weeks_slice_stmt(program_id: int, offsets: List[List[int]], first: int, last: int) -> Select:
+    """Select weeks first..last as a JSON array without reading the whole document.
+
+    Compact rows have no JSON to slice in SQL; the statement also returns
+    their blob, and :func:`_weeks_from_row` slices the decoded text instead.
+    """
+    if IS_POSTGRES:
+        # JSONB re-serializes documents, so offsets don't apply; slice server-side.
+        path = literal_column(f"'$.weeks[{first - 1} to {last - 1}]'::jsonpath")
+        weeks = cast(func.jsonb_path_query_array(SavedProgram.program_json, path), Text)
+    else:
+        start, end = week_range_bounds(offsets, first, last)
+        weeks = "[" + func.substr(SavedProgram.program_json, start + 1, end - start, type_=Text) + "]"
+    return select(
+        weeks, SavedProgram.program_format, SavedProgram.program_blob
+    ).where(SavedProgram.id == program_id)
+
+
+def _weeks_from_row(row, offsets: List[List[int]], first: int, last: int) -> Optional[str]:
+    if row is None:
+        return None
+    weeks, program_format, program_blob = row
+    if program_format != FORMAT_COMPACT:
+        return weeks
+    start, end = week_range_bounds(offsets, first, last)
+    return "[" + decode_compact_json(program_blob)[start:end] + "]"
+
+
+def _invalidate_cached(program_id: int) -> None:
+    cache = get_program_cache()
+    if cache is not None:
+        cache.invalidate(program_id)
+
+
+def _storage_format() -> str:
+    if settings.program_storage_format.lower() != "compact":
+        return FORMAT_JSON
+    if not compact_available():
+        logger.warning("PROGRAM_STORAGE_FORMAT=compact needs msgpack and zstandard; storing JSON")
+        return FORMAT_JSON
+    return FORMAT_COMPACT
+
+
+def _apply_storage(
+    db_program: SavedProgram, program: TrainingProgram, storage_format: Optional[str] = None
+) -> SavedProgram:
+    stored = serialize_program(program)
+    blob = None
+    if (storage_format or _storage_format()) == FORMAT_COMPACT:
+        blob = encode_compact_checked(program, stored.program_json, settings.program_zstd_level)
+        if blob is None:
+            logger.warning("Compact encoding does not round-trip; storing JSON")
+    db_program.program_format = FORMAT_COMPACT if blob is not None else FORMAT_JSON
+    db_program.program_blob = blob
+    db_program.program_json = COMPACT_PLACEHOLDER if blob is not None else stored.program_json
+    db_program._program_text = stored.program_json
+    db_program.week_offsets = stored.week_offsets
+    db_program.week_summary = stored.week_summary
+    db_program.content_hash = content_hash_for(stored.program_json)
+    return db_program
+
+
+def _stored_size(program: SavedProgram) -> int:
+    return len(program.program_json.encode("utf-8")) + len(program.program_blob or b"")
+
+
+def _new_saved_program(
+    program: TrainingProgram, request_data: dict, source_program_id: Optional[int] = None
+) -> SavedProgram:
+    return _apply_storage(SavedProgram(
+        goal=request_data["goal"],
+        fitness_level=request_data["fitness_level"],
+        duration_weeks=request_data["duration_weeks"],
+        available_hours_per_week=request_data["available_hours_per_week"],
+        notes=program.notes,
+        request_json=json.dumps(request_data, separators=(",", ":")),
+        source_program_id=source_program_id,
+    ), program)
+
+
+def _new_workout(
+    program_id: Optional[int],
+    sport: str,
+    title: str,
+    duration_minutes: int,
+    distance_km: Optional[float],
+    notes: Optional[str],
+    rating: Optional[int]
+) -> WorkoutHistory:
+    return WorkoutHistory(
+        program_id=program_id,
+        sport=sport,
+        title=title,
+        duration_minutes=duration_minutes,
+        distance_km=distance_km,
+        notes=notes,
+        rating=rating
+    )
+
+
+def _persist(db: Session, instance):
+    """Insert and commit a new row, via the batching write queue when enabled."""
+    write_queue = get_write_queue()
+    if write_queue is not None:
+        return write_queue.add(instance)
+    db.add(instance)
+    db.commit()
+    db.refresh(instance)
+    return instance
+
+
+def _adder_all(instances: list):
+    def _add_all(session: Session) -> list:
+        session.add_all(instances)
+        session.flush()
+        return instances
+
+    return _add_all
+
+
+def _persist_all(db: Session, instances: list) -> list:
+    """Insert several rows in one transaction (one write-queue item when enabled)."""
+    write_queue = get_write_queue()
+    if write_queue is not None:
+        return write_queue.run(_adder_all(instances))
+    db.add_all(instances)
+    db.commit()
+    for instance in instances:
+        db.refresh(instance)
+    return instances
+
+
+async def _persist_async(db: AsyncSession, instance):
+    """Async counterpart of _persist; never blocks the event loop on the commit."""
+    write_queue = get_write_queue()
+    if write_queue is not None:
+        return await write_queue.add_async(instance)
+    db.add(instance)
+    await db.commit()
+    await db.refresh(instance)
+    return instance
 
 
 class ProgramRepository:
     """Repository for managing training programs in the database."""
     
     @staticmethod
-    def save_program(db: Session, program: TrainingProgram, request_data: dict) -> SavedProgram:
+    def save_program(
+        db: Session,
+        program: TrainingProgram,
+        request_data: dict,
+        source_program_id: Optional[int] = None,
+    ) -> SavedProgram:
         """Save a training program to the database."""
-        db_program = SavedProgram(
-            goal=request_data["goal"],
-            fitness_level=request_data["fitness_level"],
-            duration_weeks=request_data["duration_weeks"],
-            available_hours_per_week=request_data["available_hours_per_week"],
-            program_json=program.model_dump_json(),
-            notes=program.notes
-        )
-        db.add(db_program)
-        db.commit()
-        db.refresh(db_program)
-        return db_program
+        return _persist(db, _new_saved_program(program, request_data, source_program_id))
+    
+    @staticmethod
+    def save_programs(
+        db: Session, items: List[Tuple[TrainingProgram, dict, Optional[int]]]
+    ) -> List[SavedProgram]:
+        """Save (program, request_data, source_program_id) in a single transaction."""
+        return _persist_all(db, [_new_saved_program(p, r, s) for p, r, s in items])
     
     @staticmethod
     def get_program(db: Session, program_id: int) -> Optional[SavedProgram]:
         """Retrieve a program by ID."""
-        return db.query(SavedProgram).filter(SavedProgram.id == program_id).first()
+        return db.get(SavedProgram, program_id)
+    
+    @staticmethod
+    def get_content_hash(db: Session, program_id: int) -> Optional[str]:
+        """Return a program's content hash without loading the document."""
+        return db.scalar(
+            select(SavedProgram.content_hash).where(SavedProgram.id == program_id)
+        )
+    
+    @staticmethod
+    def get_week_index(
+        db: Session, program_id: int
+    ) -> Optional[Tuple[str, List[List[int]], str]]:
+        """Return (content_hash, week offsets, week summary JSON) for a program."""
+        row = db.execute(_week_index_stmt(program_id)).first()
+        if row is None:
+            return None
+        if row.week_offsets is None or row.week_summary is None:
+            program = db.get(SavedProgram, program_id)
+            _apply_storage(program, parse_program(program.program_text))
+            db.commit()
+            _invalidate_cached(program_id)
+            row = program
+        return row.content_hash, json.loads(row.week_offsets), row.week_summary
+    
+    @staticmethod
+    def get_weeks_json(
+        db: Session, program_id: int, offsets: List[List[int]], first: int, last: int
+    ) -> str:
+        """Return weeks first..last (1-based, inclusive) as a JSON array string."""
+        row = db.execute(_weeks_slice_stmt(program_id, offsets, first, last)).first()
+        return _weeks_from_row(row, offsets, first, last)
     
     @staticmethod
     def list_programs(
@@ -38,21 +293,93 @@ class ProgramRepository:
         goal: Optional[str] = None
     ) -> List[SavedProgram]:
         """List all saved programs with optional filtering."""
-        query = db.query(SavedProgram)
-        if goal:
-            query = query.filter(SavedProgram.goal == goal)
-        return query.order_by(SavedProgram.created_at.desc()).offset(skip).limit(limit).all()
+        return list(db.scalars(_list_programs_stmt(skip, limit, goal)))
+    
+    @staticmethod
+    def update_program(
+        db: Session, program_id: int, program: TrainingProgram, **fields
+    ) -> Optional[SavedProgram]:
+        """Replace a program's document; the content hash (ETag) and week index follow."""
+        saved = db.get(SavedProgram, program_id)
+        if saved is None:
+            return None
+        _apply_storage(saved, program)
+        saved.notes = program.notes
+        for name, value in fields.items():
+            setattr(saved, name, value)
+        db.commit()
+        _invalidate_cached(program_id)
+        return saved
     
+    @staticmethod
+    def claim_replan(db: Session, program_id: int, week: int) -> bool:
+        """Mark a program replanned in ``week``; False if it already was (by any worker)."""
+        claimed = db.execute(
+            update(SavedProgram)
+            .where(
+                SavedProgram.id == program_id,
+                (SavedProgram.replanned_week.is_(None)) | (SavedProgram.replanned_week < week),
+            )
+            .values(replanned_week=week)
+        ).rowcount
+        db.commit()
+        return claimed > 0
+
+    @staticmethod
+    def release_replan(db: Session, program_id: int, week: int, previous: Optional[int]) -> None:
+        """Undo claim_replan(week) after a replan that changed nothing."""
+        db.execute(
+            update(SavedProgram)
+            .where(SavedProgram.id == program_id, SavedProgram.replanned_week == week)
+            .values(replanned_week=previous)
+        )
+        db.commit()
+
     @staticmethod
     def delete_program(db: Session, program_id: int) -> bool:
         """Delete a program by ID."""
-        program = db.query(SavedProgram).filter(SavedProgram.id == program_id).first()
+        program = db.get(SavedProgram, program_id)
         if program:
             db.delete(program)
             db.commit()
+            _invalidate_cached(program_id)
             return True
         return False
 
+    @staticmethod
+    def convert_storage(
+        db: Session, storage_format: str, batch_size: int = 200
+    ) -> Tuple[int, int, int]:
+        """Rewrite every program not yet in ``storage_format`` (json or msgpack+zstd).
+
+        Commits per batch, so it can be interrupted and resumed. Returns
+        (programs converted, stored bytes before, stored bytes after).
+        """
+        if storage_format == FORMAT_COMPACT and not compact_available():
+            raise RuntimeError("Compact storage requires the msgpack and zstandard packages")
+        pending = func.coalesce(SavedProgram.program_format, FORMAT_JSON) != storage_format
+        converted = before = after = 0
+        last_id = 0
+        while True:
+            programs = list(db.scalars(
+                select(SavedProgram)
+                .where(pending, SavedProgram.id > last_id)
+                .order_by(SavedProgram.id)
+                .limit(batch_size)
+            ))
+            if not programs:
+                return converted, before, after
+            for program in programs:
+                before += _stored_size(program)
+                old_hash = program.content_hash
+                _apply_storage(program, parse_program(program.program_text), storage_format)
+                after += _stored_size(program)
+                if program.content_hash != old_hash:
+                    _invalidate_cached(program.id)
+                converted += 1
+            db.commit()
+            last_id = programs[-1].id
+
 
 class WorkoutHistoryRepository:
     """Repository for managing workout history."""
@@ -69,19 +396,10 @@ class WorkoutHistoryRepository:
         rating: Optional[int]
     ) -> WorkoutHistory:
         """Log a completed workout."""
-        workout = WorkoutHistory(
-            program_id=program_id,
-            sport=sport,
-            title=title,
-            duration_minutes=duration_minutes,
-            distance_km=distance_km,
-            notes=notes,
-            rating=rating
+        workout = _new_workout(
+            program_id, sport, title, duration_minutes, distance_km, notes, rating
         )
-        db.add(workout)
-        db.commit()
-        db.refresh(workout)
-        return workout
+        return _persist(db, workout)
     
     @staticmethod
     def get_workout_history(
@@ -92,38 +410,155 @@ class WorkoutHistoryRepository:
         limit: int = 100
     ) -> List[WorkoutHistory]:
         """Retrieve workout history with optional filtering."""
-        query = db.query(WorkoutHistory)
-        if program_id:
-            query = query.filter(WorkoutHistory.program_id == program_id)
-        if sport:
-            query = query.filter(WorkoutHistory.sport == sport)
-        return query.order_by(WorkoutHistory.completed_at.desc()).offset(skip).limit(limit).all()
+        return list(db.scalars(_workout_history_stmt(program_id, sport, skip, limit)))
     
     @staticmethod
     def get_workout_stats(db: Session, sport: Optional[str] = None) -> dict:
         """Get aggregate statistics for workouts."""
-        query = db.query(WorkoutHistory)
-        if sport:
-            query = query.filter(WorkoutHistory.sport == sport)
-        
-        workouts = query.all()
-        
-        if not workouts:
-            return {
-                "total_workouts": 0,
-                "total_duration_minutes": 0,
-                "total_distance_km": 0,
-                "average_rating": 0
-            }
-        
-        total_duration = sum(w.duration_minutes for w in workouts)
-        total_distance = sum(w.distance_km or 0 for w in workouts)
-        ratings = [w.rating for w in workouts if w.rating]
-        avg_rating = sum(ratings) / len(ratings) if ratings else 0
-        
-        return {
-            "total_workouts": len(workouts),
-            "total_duration_minutes": total_duration,
-            "total_distance_km": round(total_distance, 2),
-            "average_rating": round(avg_rating, 2)
-        }
+        return _workout_stats_from_row(db.execute(_workout_stats_stmt(sport)).one())
+
+
+class AsyncProgramRepository:
+    """Async counterpart of ProgramRepository for use with AsyncSession."""
+
+    @staticmethod
+    async def save_program(
+        db: AsyncSession,
+        program: TrainingProgram,
+        request_data: dict,
+        source_program_id: Optional[int] = None,
+    ) -> SavedProgram:
+        """Save a training program to the database."""
+        return await _persist_async(
+            db, _new_saved_program(program, request_data, source_program_id)
+        )
+
+    @staticmethod
+    async def set_source_program(db: AsyncSession, program_id: int, source_program_id: int) -> None:
+        """Mark a saved program as a copy of ``source_program_id``."""
+        await db.execute(
+            update(SavedProgram)
+            .where(SavedProgram.id == program_id)
+            .values(source_program_id=source_program_id)
+        )
+        await db.commit()
+
+    @staticmethod
+    async def get_program(db: AsyncSession, program_id: int) -> Optional[SavedProgram]:
+        """Retrieve a program by ID."""
+        return await db.get(SavedProgram, program_id)
+
+    @staticmethod
+    async def get_content_hash(db: AsyncSession, program_id: int) -> Optional[str]:
+        """Return a program's content hash without loading the document."""
+        return await db.scalar(
+            select(SavedProgram.content_hash).where(SavedProgram.id == program_id)
+        )
+
+    @staticmethod
+    async def get_created_at(db: AsyncSession, program_id: int) -> Optional[datetime]:
+        """Return when a program was saved without loading the document."""
+        return await db.scalar(
+            select(SavedProgram.created_at).where(SavedProgram.id == program_id)
+        )
+
+    @staticmethod
+    async def get_header(db: AsyncSession, program_id: int) -> Optional[dict]:
+        """Return the program-level fields shown above the weeks, from columns only."""
+        row = (await db.execute(
+            select(
+                SavedProgram.goal, SavedProgram.fitness_level, SavedProgram.duration_weeks,
+                SavedProgram.available_hours_per_week, SavedProgram.notes, SavedProgram.created_at,
+            ).where(SavedProgram.id == program_id)
+        )).first()
+        if row is None:
+            return None
+        header = row._asdict()
+        header["created_at"] = row.created_at.isoformat() if row.created_at else None
+        return header
+
+    @staticmethod
+    async def get_week_index(
+        db: AsyncSession, program_id: int
+    ) -> Optional[Tuple[str, List[List[int]], str]]:
+        """Return (content_hash, week offsets, week summary JSON) for a program.
+
+        Programs saved before the index existed are re-serialized and indexed
+        on first access.
+        """
+        row = (await db.execute(_week_index_stmt(program_id))).first()
+        if row is None:
+            return None
+        if row.week_offsets is None or row.week_summary is None:
+            program = await db.get(SavedProgram, program_id)
+            _apply_storage(program, parse_program(program.program_text))
+            await db.commit()
+            _invalidate_cached(program_id)
+            row = program
+        return row.content_hash, json.loads(row.week_offsets), row.week_summary
+
+    @staticmethod
+    async def get_weeks_json(
+        db: AsyncSession, program_id: int, offsets: List[List[int]], first: int, last: int
+    ) -> str:
+        """Return weeks first..last (1-based, inclusive) as a JSON array string."""
+        row = (await db.execute(_weeks_slice_stmt(program_id, offsets, first, last))).first()
+        return _weeks_from_row(row, offsets, first, last)
+
+    @staticmethod
+    async def list_programs(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 100,
+        goal: Optional[str] = None
+    ) -> List[SavedProgram]:
+        """List all saved programs with optional filtering."""
+        return list(await db.scalars(_list_programs_stmt(skip, limit, goal)))
+
+    @staticmethod
+    async def delete_program(db: AsyncSession, program_id: int) -> bool:
+        """Delete a program by ID."""
+        program = await db.get(SavedProgram, program_id)
+        if program:
+            await db.delete(program)
+            await db.commit()
+            _invalidate_cached(program_id)
+            return True
+        return False
+
+
+class AsyncWorkoutHistoryRepository:
+    """Async counterpart of WorkoutHistoryRepository for use with AsyncSession."""
+
+    @staticmethod
+    async def log_workout(
+        db: AsyncSession,
+        program_id: Optional[int],
+        sport: str,
+        title: str,
+        duration_minutes: int,
+        distance_km: Optional[float],
+        notes: Optional[str],
+        rating: Optional[int]
+    ) -> WorkoutHistory:
+        """Log a completed workout."""
+        workout = _new_workout(
+            program_id, sport, title, duration_minutes, distance_km, notes, rating
+        )
+        return await _persist_async(db, workout)
+
+    @staticmethod
+    async def get_workout_history(
+        db: AsyncSession,
+        program_id: Optional[int] = None,
+        sport: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[WorkoutHistory]:
+        """Retrieve workout history with optional filtering."""
+        return list(await db.scalars(_workout_history_stmt(program_id, sport, skip, limit)))
+
+    @staticmethod
+    async def get_workout_stats(db: AsyncSession, sport: Optional[str] = None) -> dict:
+        """Get aggregate statistics for workouts."""
+        return _workout_stats_from_row((await db.execute(_workout_stats_stmt(sport))).one())
@@ -0,0 +1,170 @@
+"""Response helpers for serving stored program JSON without re-encoding it."""
+import gzip
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Default response class for JSON endpoints: orjson when installed.
+DefaultJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+
+class RawJSONResponse(Response):
+    """Response whose body is already-serialized JSON bytes."""
+    media_type = "application/json"
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def splice_json(envelope: Dict[str, Any], key: str, raw_json: str | bytes) -> bytes:
+    """Serialize ``envelope`` with ``raw_json`` inserted verbatim under ``key``.
+
+    The stored document is trusted to be valid JSON (it was produced by
+    ``model_dump_json``), so it is copied into the body without parsing.
+    """
+    head = _dumps(envelope)
+    if isinstance(raw_json, str):
+        raw_json = raw_json.encode("utf-8")
+    separator = b"," if len(head) > 2 else b""
+    return b"".join((head[:-1], separator, _dumps(key), b":", raw_json, b"}"))
+
+
+def program_envelope(program) -> Dict[str, Any]:
+    """Metadata fields returned alongside a saved program."""
+    return {
+        "id": program.id,
+        "created_at": program.created_at.isoformat(),
+        "goal": program.goal,
+        "fitness_level": program.fitness_level,
+        "duration_weeks": program.duration_weeks,
+    }
+
+
+def program_response_body(program) -> bytes:
+    """Body for GET /api/workouts/{id}: envelope plus the stored program JSON."""
+    return splice_json(program_envelope(program), "program", program.program_text)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, or None for identity."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if token:
+            accepted[token] = quality
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress ``body`` with the negotiated content coding."""
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.brotli_quality)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=settings.gzip_level, mtime=0)
+    raise ValueError(f"Unsupported content encoding: {encoding!r}")
+
+
+def make_etag(content_hash: str, encoding: Optional[str] = None) -> str:
+    """Strong ETag for a program representation.
+
+    Each content coding is a different byte sequence, so it gets its own
+    validator (``"<hash>-gzip"``) derived from the same content hash.
+    """
+    return f'"{content_hash}-{encoding}"' if encoding else f'"{content_hash}"'
+
+
+def etag_matches(if_none_match: Optional[str], content_hash: Optional[str]) -> bool:
+    """True if any entity tag in an If-None-Match header refers to ``content_hash``."""
+    if not if_none_match or not content_hash:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == content_hash or tag.rsplit("-", 1)[0] == content_hash:
+            return True
+    return False
+
+
+def not_modified(request: Request, content_hash: str) -> Response:
+    """304 response for a program the client already has."""
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    return Response(
+        status_code=304,
+        headers={
+            "ETag": make_etag(content_hash, encoding),
+            "Cache-Control": settings.program_cache_control,
+            "Vary": "Accept-Encoding",
+        },
+    )
+
+
+def encode_for_request(request: Request, body: bytes) -> Tuple[Optional[str], bytes]:
+    """Compress ``body`` per Accept-Encoding if it is above the size threshold."""
+    if len(body) < settings.compression_min_bytes:
+        return None, body
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding is None:
+        return None, body
+    return encoding, compress(body, encoding)
+
+
+def json_bytes_response(
+    body: bytes,
+    encoding: Optional[str] = None,
+    content_hash: Optional[str] = None,
+) -> Response:
+    """Response for an already-encoded JSON body.
+
+    With ``content_hash`` the response also carries a strong ETag and the
+    program Cache-Control policy so browsers revalidate with If-None-Match.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if content_hash:
+        headers["ETag"] = make_etag(content_hash, encoding)
+        headers["Cache-Control"] = settings.program_cache_control
+    return RawJSONResponse(body, headers=headers)
+
+
+def encoded_json_response(
+    request: Request,
+    body: bytes,
+    content_hash: Optional[str] = None,
+) -> Response:
+    """JSON response compressed per Accept-Encoding above the size threshold."""
+    encoding, body = encode_for_request(request, body)
+    return json_bytes_response(body, encoding, content_hash)
@@ -0,0 +1,235 @@
+"""Reuse of saved programs for similar requests (SIMILARITY_REUSE).
+
+A request is compared with the saved programs of the same goal and fitness
+level on hours per week, duration and focus areas:
+
+    score = 0.4 * hours + 0.2 * weeks + 0.4 * focus
+
+where hours and weeks are 1 - relative difference, and focus is the cosine
+similarity of TF-IDF vectors over the focus-area words and their character
+trigrams (so "swim technique" also matches "swimming technique"). When the
+best score reaches SIMILARITY_THRESHOLD, the saved program is adapted to the
+request (app.periodization.adapt_program) instead of calling the LLM.
+
+Only LLM-generated programs are indexed, so adaptations are not compounded.
+The index is per process: loaded from training_programs on first use and
+topped up with rows saved since (by any worker) before each lookup.
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SavedProgram, SessionLocal
+from app.metrics import program_reuse, span
+from app.models import TrainingProgram, WorkoutRequest, loads_json, parse_program
+from app.periodization import adapt_program
+from app.repository import ProgramRepository
+
+HOURS_WEIGHT = 0.4
+WEEKS_WEIGHT = 0.2
+FOCUS_WEIGHT = 0.4
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def focus_terms(focus_areas: Optional[List[str]]) -> Counter:
+    """Term counts of focus areas: words plus their character trigrams."""
+    terms: Counter = Counter()
+    for word in _WORD.findall(" ".join(focus_areas or ()).lower()):
+        terms[word] += 1
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            terms["#" + padded[i:i + 3]] += 1
+    return terms
+
+
+@dataclass
+class Match:
+    program_id: int
+    score: float
+    hours: float  # available_hours_per_week of the saved program
+    weeks: int
+
+
+class _Bucket:
+    """Indexed programs of one goal and fitness level."""
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self.hours: List[float] = []
+        self.weeks: List[int] = []
+        self.terms: List[Counter] = []
+        self._built = None
+
+    def add(self, program_id: int, hours: float, weeks: int, terms: Counter) -> None:
+        self.ids.append(program_id)
+        self.hours.append(hours)
+        self.weeks.append(weeks)
+        self.terms.append(terms)
+        self._built = None
+
+    def discard(self, program_id: int) -> None:
+        if program_id in self.ids:
+            i = self.ids.index(program_id)
+            for column in (self.ids, self.hours, self.weeks, self.terms):
+                del column[i]
+            self._built = None
+
+    def _build(self):
+        # IDF changes as programs are added, so vectors are rebuilt lazily.
+        n = len(self.ids)
+        df: Counter = Counter()
+        for terms in self.terms:
+            df.update(terms.keys())
+        idf = {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()}
+        postings: Dict[str, Tuple[list, list]] = defaultdict(lambda: ([], []))
+        for row, terms in enumerate(self.terms):
+            weights = {term: count * idf[term] for term, count in terms.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values()))
+            for term, weight in weights.items():
+                rows, values = postings[term]
+                rows.append(row)
+                values.append(weight / norm)
+        self._built = (
+            np.array(self.ids),
+            np.array(self.hours, dtype=float),
+            np.array(self.weeks, dtype=float),
+            np.array([bool(terms) for terms in self.terms]),
+            {term: (np.array(rows), np.array(values)) for term, (rows, values) in postings.items()},
+            idf,
+        )
+        return self._built
+
+    def best(self, hours: float, weeks: int, terms: Counter) -> Optional[Match]:
+        if not self.ids:
+            return None
+        ids, all_hours, all_weeks, has_focus, postings, idf = self._built or self._build()
+        hours_score = 1 - np.abs(all_hours - hours) / np.maximum(all_hours, hours)
+        weeks_score = 1 - np.abs(all_weeks - weeks) / np.maximum(all_weeks, weeks)
+        if terms:
+            unseen = math.log(1 + len(ids)) + 1
+            query = {term: count * idf.get(term, unseen) for term, count in terms.items()}
+            norm = math.sqrt(sum(w * w for w in query.values()))
+            focus_score = np.zeros(len(ids))
+            for term, weight in query.items():
+                if term in postings:
+                    rows, values = postings[term]
+                    focus_score[rows] += weight / norm * values
+        else:
+            # No focus areas matches programs that had none either.
+            focus_score = (~has_focus).astype(float)
+        score = HOURS_WEIGHT * hours_score + WEEKS_WEIGHT * weeks_score + FOCUS_WEIGHT * focus_score
+        best = int(np.argmax(score))
+        return Match(int(ids[best]), float(score[best]), float(all_hours[best]), int(all_weeks[best]))
+
+
+class SimilarityIndex:
+    """Saved request parameters by (goal, fitness_level), for nearest-match lookups."""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, db: Session) -> None:
+        """Index programs saved since the last refresh."""
+        rows = db.execute(
+            select(
+                SavedProgram.id,
+                SavedProgram.goal,
+                SavedProgram.fitness_level,
+                SavedProgram.duration_weeks,
+                SavedProgram.available_hours_per_week,
+                SavedProgram.request_json,
+                SavedProgram.source_program_id,
+            )
+            .where(SavedProgram.id > self._last_id)
+            .order_by(SavedProgram.id)
+        ).all()
+        with self._lock:
+            for row in rows:
+                if row.id <= self._last_id:
+                    continue  # indexed by a concurrent refresh
+                self._last_id = row.id
+                if row.source_program_id is not None:
+                    continue
+                focus_areas = loads_json(row.request_json).get("focus_areas") if row.request_json else None
+                self._bucket(row.goal, row.fitness_level).add(
+                    row.id, row.available_hours_per_week, row.duration_weeks, focus_terms(focus_areas)
+                )
+
+    def _bucket(self, goal: str, fitness_level: str) -> _Bucket:
+        return self._buckets.setdefault((goal.lower(), fitness_level.lower()), _Bucket())
+
+    def discard(self, program_id: int) -> None:
+        with self._lock:
+            for bucket in self._buckets.values():
+                bucket.discard(program_id)
+
+    def best_match(self, request: WorkoutRequest) -> Optional[Match]:
+        """The most similar indexed program of the same goal and fitness level."""
+        with self._lock:
+            bucket = self._buckets.get((request.goal.value, request.fitness_level.value))
+            if bucket is None:
+                return None
+            return bucket.best(
+                request.available_hours_per_week,
+                request.duration_weeks,
+                focus_terms(request.focus_areas),
+            )
+
+
+_index: Optional[SimilarityIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_similarity_index() -> SimilarityIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SimilarityIndex()
+    return _index
+
+
+def find_reusable(request: WorkoutRequest) -> Optional[Tuple[TrainingProgram, Match]]:
+    """A saved program adapted to ``request``, if one is similar enough (blocking)."""
+    index = get_similarity_index()
+    db = SessionLocal()
+    try:
+        with span("similarity_lookup", provider="reuse"):
+            index.refresh(db)
+            match = index.best_match(request)
+        if match is None or match.score < settings.similarity_threshold:
+            program_reuse.inc(outcome="miss")
+            return None
+        saved = ProgramRepository.get_program(db, match.program_id)
+        if saved is None:  # deleted since it was indexed
+            index.discard(match.program_id)
+            program_reuse.inc(outcome="miss")
+            return None
+        source = parse_program(saved.program_text)
+    finally:
+        db.close()
+    with span("adaptation", provider="reuse"):
+        program = adapt_program(source, match.hours, request, match.program_id)
+    program_reuse.inc(outcome="hit")
+    return program, match
+
+
+def _reset_after_fork():
+    global _index, _index_lock
+    _index = None
+    _index_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
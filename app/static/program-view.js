@@ -0,0 +1,326 @@
+/*
+ * Virtualized program view (program.html, /benchmarks/render).
+ *
+ * The page is laid out from the compact summary (GET /api/workouts/{id}/summary):
+ * every week gets a placeholder sized from its workout count, and only weeks
+ * near the viewport are materialized, with their workouts fetched a few weeks
+ * at a time from GET /api/workouts/{id}/weeks. Weeks scrolled far away are
+ * turned back into placeholders, so the DOM stays small for 52-week plans.
+ *
+ * The summary and every fetched week are kept in IndexedDB together with the
+ * summary's ETag. A revisit sends one conditional request; on 304 the cached
+ * weeks are used as they are, otherwise the entry is replaced.
+ */
+(function (global) {
+    'use strict';
+
+    const WEEKS_PER_FETCH = 4;         // weeks per /weeks range request
+    const ROOT_MARGIN = '1500px 0px';  // materialize this far above/below the viewport
+    const WEEK_CHROME_PX = 110;        // placeholder height: card padding and header
+    const WORKOUT_PX = 420;            // ... plus this per workout
+
+    const DB_NAME = 'triathlon-programs';
+    const STORE = 'programs';
+
+    const ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+
+    function esc(value) {
+        return value == null ? '' : String(value).replace(/[&<>"']/g, c => ESCAPES[c]);
+    }
+
+    function fixed1(value) {
+        return Number(value || 0).toFixed(1);
+    }
+
+    // Rendering (strings, so the same code runs in the benchmark and under node)
+
+    function renderHeader(program) {
+        const created = program.created_at ? new Date(program.created_at).toLocaleDateString() : '';
+        return `
+            <h2>${esc(String(program.goal).replace('_', ' ').toUpperCase())} Training Program</h2>
+            <div style="margin-top: 15px; display: flex; gap: 30px; flex-wrap: wrap;">
+                <div><strong>Fitness Level:</strong> ${esc(program.fitness_level)}</div>
+                <div><strong>Duration:</strong> ${esc(program.duration_weeks)} weeks</div>
+                ${created ? `<div><strong>Created:</strong> ${esc(created)}</div>` : ''}
+            </div>
+            <p style="margin-top: 20px; color: #666;">${esc(program.notes)}</p>
+        `;
+    }
+
+    function renderWeekHeader(week) {
+        return `
+            <div class="week-header">
+                <h2>Week ${esc(week.week_number)}: ${esc(week.focus)}</h2>
+                <div class="week-stats">
+                    <span><strong>Volume:</strong> ${fixed1(week.weekly_volume_hours)} hours</span>
+                    <span><strong>Distance:</strong> ${fixed1(week.weekly_distance_km)} km</span>
+                </div>
+            </div>
+        `;
+    }
+
+    function renderPlaceholder(summary) {
+        const sports = Object.entries(summary.sport_minutes || {})
+            .filter(([, minutes]) => minutes > 0)
+            .map(([sport, minutes]) => `<span class="sport-badge ${esc(sport)}">${esc(sport.toUpperCase())} ${esc(minutes)} min</span>`)
+            .join(' ');
+        return `
+            ${renderWeekHeader(summary)}
+            <div class="week-status">${esc(summary.workout_count)} workouts ${sports}</div>
+        `;
+    }
+
+    function renderInterval(interval) {
+        return `
+            <div class="interval">
+                <div class="interval-header">
+                    <span>
+                        ${interval.duration_minutes ? `${esc(interval.duration_minutes)} min` : ''}
+                        ${interval.distance_km ? `${esc(interval.distance_km)} km` : ''}
+                    </span>
+                    <span class="intensity">${esc(interval.intensity)}</span>
+                </div>
+                <p style="color: #666;">${esc(interval.description)}</p>
+            </div>
+        `;
+    }
+
+    function renderWorkout(workout) {
+        const sport = esc(workout.sport);
+        return `
+            <div class="workout ${sport}">
+                <div class="workout-header">
+                    <span class="workout-title">${esc(workout.title)}</span>
+                    <span class="sport-badge ${sport}">${sport.toUpperCase()}</span>
+                </div>
+                <div style="display: flex; gap: 20px; margin-bottom: 15px; color: #666;">
+                    <span><strong>Duration:</strong> ${esc(workout.total_duration_minutes)} min</span>
+                    ${workout.total_distance_km ? `<span><strong>Distance:</strong> ${esc(workout.total_distance_km)} km</span>` : ''}
+                </div>
+                <div class="workout-section">
+                    <h4>Warmup</h4>
+                    <p>${esc(workout.warmup)}</p>
+                </div>
+                <div class="workout-section">
+                    <h4>Main Set</h4>
+                    ${(workout.main_set || []).map(renderInterval).join('')}
+                </div>
+                <div class="workout-section">
+                    <h4>Cooldown</h4>
+                    <p>${esc(workout.cooldown)}</p>
+                </div>
+                ${workout.notes ? `
+                    <div class="workout-section">
+                        <h4>Notes</h4>
+                        <p style="color: #666; font-style: italic;">${esc(workout.notes)}</p>
+                    </div>
+                ` : ''}
+            </div>
+        `;
+    }
+
+    function renderWeek(week) {
+        return renderWeekHeader(week) + week.workouts.map(renderWorkout).join('');
+    }
+
+    function estimateHeight(summary) {
+        return WEEK_CHROME_PX + WORKOUT_PX * (summary.workout_count || 0);
+    }
+
+    // IndexedDB cache: {id, etag, summary, weeks: {week_number: week}} per program
+
+    function openCache() {
+        if (!global.indexedDB) return Promise.resolve(null);
+        return new Promise(resolve => {
+            const request = global.indexedDB.open(DB_NAME, 1);
+            request.onupgradeneeded = () => request.result.createObjectStore(STORE, { keyPath: 'id' });
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => resolve(null);  // private mode etc.: run uncached
+            request.onblocked = () => resolve(null);
+        });
+    }
+
+    function cacheGet(db, id) {
+        if (!db) return Promise.resolve(null);
+        return new Promise(resolve => {
+            const request = db.transaction(STORE).objectStore(STORE).get(id);
+            request.onsuccess = () => resolve(request.result || null);
+            request.onerror = () => resolve(null);
+        });
+    }
+
+    function cachePut(db, entry) {
+        if (!db) return;
+        try {
+            db.transaction(STORE, 'readwrite').objectStore(STORE).put(entry);
+        } catch (error) {
+            console.warn('Could not cache program:', error);
+        }
+    }
+
+    async function loadSummary(programId, db) {
+        const id = String(programId);
+        const cached = await cacheGet(db, id);
+        let response;
+        try {
+            response = await fetch(`/api/workouts/${id}/summary`, {
+                headers: cached && cached.etag ? { 'If-None-Match': cached.etag } : {},
+            });
+        } catch (error) {
+            if (cached) return cached;  // offline: show what we have
+            throw error;
+        }
+        if (response.status === 304 && cached) return cached;
+        if (!response.ok) throw new Error(`Failed to load program (${response.status})`);
+        const entry = { id, etag: response.headers.get('ETag'), summary: await response.json(), weeks: {} };
+        cachePut(db, entry);
+        return entry;
+    }
+
+    // Weeks are fetched in aligned ranges of WEEKS_PER_FETCH; concurrent
+    // requests for weeks of the same range share one fetch.
+    class WeekSource {
+        constructor(programId, entry, db = null, fetchRange = null) {
+            this.programId = programId;
+            this.entry = entry;
+            this.db = db;
+            this.total = entry.summary.total_weeks;
+            this.pending = new Map();
+            this.fetchRange = fetchRange || (async (from, to) => {
+                const response = await fetch(`/api/workouts/${programId}/weeks?from=${from}&to=${to}`);
+                if (!response.ok) throw new Error(`Failed to load weeks ${from}-${to} (${response.status})`);
+                return (await response.json()).weeks;
+            });
+            this.saveTimer = null;
+        }
+
+        get(weekNumber) {
+            const cached = this.entry.weeks[weekNumber];
+            if (cached) return Promise.resolve(cached);
+            const from = Math.floor((weekNumber - 1) / WEEKS_PER_FETCH) * WEEKS_PER_FETCH + 1;
+            let range = this.pending.get(from);
+            if (!range) {
+                const to = Math.min(from + WEEKS_PER_FETCH - 1, this.total);
+                range = this.fetchRange(from, to).then(weeks => {
+                    weeks.forEach(week => { this.entry.weeks[week.week_number] = week; });
+                    this._save();
+                }).finally(() => this.pending.delete(from));
+                this.pending.set(from, range);
+            }
+            return range.then(() => this.entry.weeks[weekNumber]);
+        }
+
+        _save() {
+            // One write per burst of range fetches rather than one per range.
+            if (!this.db || this.saveTimer) return;
+            this.saveTimer = setTimeout(() => {
+                this.saveTimer = null;
+                cachePut(this.db, this.entry);
+            }, 500);
+        }
+    }
+
+    class VirtualWeekList {
+        constructor(container, summaries, loadWeek, { root = null, rootMargin = ROOT_MARGIN } = {}) {
+            this.container = container;
+            this.summaries = summaries;
+            this.loadWeek = loadWeek;
+            this.root = root;
+            this.rootMargin = rootMargin;
+            this.elements = [];
+            this.materialized = new Set();
+            this.inflight = new Set();
+            this.observer = null;
+        }
+
+        mount() {
+            const fragment = document.createDocumentFragment();
+            for (const summary of this.summaries) {
+                const element = document.createElement('div');
+                element.className = 'week-card week-placeholder';
+                element.dataset.week = summary.week_number;
+                element.style.minHeight = `${estimateHeight(summary)}px`;
+                element.innerHTML = renderPlaceholder(summary);
+                fragment.appendChild(element);
+                this.elements.push(element);
+            }
+            this.container.replaceChildren(fragment);
+            this.observer = new IntersectionObserver(
+                entries => this._onIntersect(entries),
+                { root: this.root, rootMargin: this.rootMargin }
+            );
+            this.elements.forEach(element => this.observer.observe(element));
+            return this;
+        }
+
+        destroy() {
+            if (this.observer) this.observer.disconnect();
+            this.observer = null;
+        }
+
+        // Resolves once the weeks currently in range are rendered.
+        async settled() {
+            await new Promise(resolve => requestAnimationFrame(() => requestAnimationFrame(resolve)));
+            while (this.inflight.size) await Promise.all([...this.inflight]);
+        }
+
+        _onIntersect(entries) {
+            for (const entry of entries) {
+                if (entry.isIntersecting) this._materialize(entry.target);
+                else this._release(entry.target);
+            }
+        }
+
+        _materialize(element) {
+            const weekNumber = Number(element.dataset.week);
+            if (this.materialized.has(weekNumber)) return;
+            this.materialized.add(weekNumber);
+            const task = Promise.resolve(this.loadWeek(weekNumber)).then(week => {
+                if (!this.materialized.has(weekNumber)) return;  // scrolled away meanwhile
+                element.innerHTML = renderWeek(week);
+                element.classList.remove('week-placeholder');
+                element.style.minHeight = '';
+            }, error => {
+                console.error(`Error loading week ${weekNumber}:`, error);
+                this.materialized.delete(weekNumber);
+                const status = element.querySelector('.week-status');
+                if (status) status.textContent = 'Could not load this week. Scroll away and back to retry.';
+            });
+            this.inflight.add(task);
+            task.finally(() => this.inflight.delete(task));
+        }
+
+        _release(element) {
+            const weekNumber = Number(element.dataset.week);
+            if (!this.materialized.delete(weekNumber)) return;
+            // Keep the rendered height so content above the viewport does not jump.
+            element.style.minHeight = `${element.offsetHeight}px`;
+            element.classList.add('week-placeholder');
+            element.innerHTML = renderPlaceholder(this.summaries[weekNumber - 1]);
+        }
+    }
+
+    async function showProgram(programId, { header, weeks }) {
+        const db = await openCache();
+        const entry = await loadSummary(programId, db);
+        header.innerHTML = renderHeader(entry.summary);
+        const source = new WeekSource(programId, entry, db);
+        return new VirtualWeekList(weeks, entry.summary.weeks, n => source.get(n)).mount();
+    }
+
+    const ProgramView = {
+        WEEKS_PER_FETCH,
+        esc,
+        renderHeader,
+        renderPlaceholder,
+        renderWeek,
+        estimateHeight,
+        openCache,
+        loadSummary,
+        WeekSource,
+        VirtualWeekList,
+        showProgram,
+    };
+    global.ProgramView = ProgramView;
+    if (typeof module !== 'undefined' && module.exports) module.exports = ProgramView;
+})(typeof window !== 'undefined' ? window : globalThis);
@@ -0,0 +1,230 @@
+"""Serialization of training programs for storage, with a per-week index.
+
+Programs are stored as one JSON document, laid out so that the weeks array is
+the last member. Alongside it we keep the character offsets of every week in
+that document and a small per-week summary, so a range of weeks can be read
+with a single substring and the overview can be served without touching the
+workouts at all.
+
+Optionally (PROGRAM_STORAGE_FORMAT=compact) the document itself is stored as
+a compact binary blob instead: field names are dropped in favour of the model
+field order, every string is interned into a table (sports, intensities and
+boilerplate descriptions repeat hundreds of times), and the msgpack result is
+zstd-compressed. The blob decodes to exactly the JSON text it replaces, so
+content hashes and week offsets are shared by both formats.
+"""
+import json
+from dataclasses import dataclass
+from enum import Enum
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+from app.models import TrainingProgram, WeekPlan
+
+try:
+    import orjson
+except ImportError:  # optional; decoding falls back to pydantic
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional; compact storage is unavailable without it
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # optional; compact storage is unavailable without it
+    zstandard = None
+
+WEEKS_KEY = ',"weeks":['
+
+FORMAT_JSON = "json"
+FORMAT_COMPACT = "msgpack+zstd"
+COMPACT_VERSION = 1
+# program_json is NOT NULL; compact rows keep a valid, empty document there.
+COMPACT_PLACEHOLDER = "{}"
+
+
+@dataclass
+class StoredProgram:
+    """Column values for a serialized program."""
+    program_json: str
+    week_offsets: str  # JSON list of [start, end) character offsets, one per week
+    week_summary: str  # JSON list of per-week summaries
+
+
+def summarize_week(week: WeekPlan) -> dict:
+    """Per-week overview: focus, volume and distance, no workout bodies."""
+    sport_minutes = {"swim": 0, "bike": 0, "run": 0}
+    for workout in week.workouts:
+        sport_minutes[workout.sport.value] += workout.total_duration_minutes
+    return {
+        "week_number": week.week_number,
+        "focus": week.focus,
+        "weekly_volume_hours": week.weekly_volume_hours,
+        "weekly_distance_km": week.weekly_distance_km,
+        "workout_count": len(week.workouts),
+        "sport_minutes": sport_minutes,
+    }
+
+
+def serialize_program(program: TrainingProgram) -> StoredProgram:
+    """Serialize a program and index the position of each week in the document."""
+    head = program.model_dump_json(exclude={"weeks"})
+    parts = [head[:-1], WEEKS_KEY]
+    position = len(head) - 1 + len(WEEKS_KEY)
+    offsets: List[Tuple[int, int]] = []
+    for index, week in enumerate(program.weeks):
+        if index:
+            parts.append(",")
+            position += 1
+        week_json = week.model_dump_json()
+        parts.append(week_json)
+        offsets.append((position, position + len(week_json)))
+        position += len(week_json)
+    parts.append("]}")
+    return StoredProgram(
+        program_json="".join(parts),
+        week_offsets=json.dumps(offsets, separators=(",", ":")),
+        week_summary=json.dumps(
+            [summarize_week(week) for week in program.weeks], separators=(",", ":")
+        ),
+    )
+
+
+def week_range_bounds(offsets: List[List[int]], first: int, last: int) -> Tuple[int, int]:
+    """Character span covering weeks ``first``..``last`` (1-based, inclusive).
+
+    Weeks are contiguous in the document, so the span is a comma-separated
+    run of week objects that only needs brackets around it to be a JSON array.
+    """
+    return offsets[first - 1][0], offsets[last - 1][1]
+
+
+# --- compact binary format ---------------------------------------------------
+
+_MODEL, _LIST_MODEL, _STRING, _LIST_STRING, _SCALAR = range(5)
+
+
+def compact_available() -> bool:
+    """Whether the optional msgpack and zstandard packages are installed."""
+    return msgpack is not None and zstandard is not None
+
+
+@lru_cache(maxsize=None)
+def _field_plan(model: type) -> Tuple[Tuple[str, int, Optional[type]], ...]:
+    """(name, kind, nested model) for each field, in declaration order."""
+    plan = []
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        if get_origin(annotation) is Union:  # Optional[X]
+            annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+        item = get_args(annotation)[0] if get_origin(annotation) in (list, List) else None
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            plan.append((name, _MODEL, annotation))
+        elif isinstance(item, type) and issubclass(item, BaseModel):
+            plan.append((name, _LIST_MODEL, item))
+        elif isinstance(annotation, type) and issubclass(annotation, Enum):
+            plan.append((name, _STRING, annotation))
+        elif annotation is str:
+            plan.append((name, _STRING, None))
+        elif item is str:
+            plan.append((name, _LIST_STRING, None))
+        else:
+            plan.append((name, _SCALAR, None))
+    return tuple(plan)
+
+
+def _pack(model: type, obj: BaseModel, strings: dict) -> list:
+    def intern(value: Any) -> Optional[int]:
+        if value is None:
+            return None
+        value = value.value if isinstance(value, Enum) else value
+        return strings.setdefault(value, len(strings))
+
+    values = []
+    for name, kind, nested in _field_plan(model):
+        value = getattr(obj, name)
+        if value is None or kind == _SCALAR:
+            values.append(value)
+        elif kind == _STRING:
+            values.append(intern(value))
+        elif kind == _MODEL:
+            values.append(_pack(nested, value, strings))
+        elif kind == _LIST_MODEL:
+            values.append([_pack(nested, item, strings) for item in value])
+        else:
+            values.append([intern(item) for item in value])
+    return values
+
+
+def _unpack(model: type, values: list, strings: List[str]) -> dict:
+    data = {}
+    # Blobs written before a field was added decode with that field's default.
+    for (name, kind, nested), value in zip(_field_plan(model), values):
+        if value is None or kind == _SCALAR:
+            data[name] = value
+        elif kind == _STRING:
+            data[name] = strings[value]
+        elif kind == _MODEL:
+            data[name] = _unpack(nested, value, strings)
+        elif kind == _LIST_MODEL:
+            data[name] = [_unpack(nested, item, strings) for item in value]
+        else:
+            data[name] = [strings[item] for item in value]
+    return data
+
+
+def encode_compact(program: TrainingProgram, level: int = 3) -> bytes:
+    """Encode a program as zstd-compressed msgpack with interned strings."""
+    if not compact_available():
+        raise RuntimeError("Compact storage requires the msgpack and zstandard packages")
+    strings: dict = {}
+    root = _pack(TrainingProgram, program, strings)
+    packed = msgpack.packb([COMPACT_VERSION, list(strings), root], use_bin_type=True)
+    return zstandard.ZstdCompressor(level=level).compress(packed)
+
+
+def _decode_data(blob: bytes) -> dict:
+    if not compact_available():
+        raise RuntimeError("Compact storage requires the msgpack and zstandard packages")
+    version, strings, root = msgpack.unpackb(
+        zstandard.ZstdDecompressor().decompress(blob), raw=False, use_list=True
+    )
+    if version != COMPACT_VERSION:
+        raise ValueError(f"Unsupported compact program version {version}")
+    return _unpack(TrainingProgram, root, strings)
+
+
+def decode_compact(blob: bytes) -> TrainingProgram:
+    """Decode a blob written by :func:`encode_compact`."""
+    return TrainingProgram.model_validate(_decode_data(blob))
+
+
+def decode_compact_json(blob: bytes) -> str:
+    """JSON text of a compact blob, in the layout of :func:`serialize_program`.
+
+    The decoded values were validated before they were encoded, so they are
+    rendered directly (orjson formats them exactly like pydantic) instead of
+    being rebuilt into models first.
+    """
+    if orjson is None:
+        return serialize_program(decode_compact(blob)).program_json
+    data = _decode_data(blob)
+    weeks = data.pop("weeks")
+    head = orjson.dumps(data).decode()
+    return "".join(
+        [head[:-1], WEEKS_KEY, ",".join(orjson.dumps(week).decode() for week in weeks), "]}"]
+    )
+
+
+def encode_compact_checked(program: TrainingProgram, program_json: str, level: int = 3) -> Optional[bytes]:
+    """Compact blob for ``program``, or None if it would not decode to ``program_json``.
+
+    Week offsets and the content hash are computed on the JSON text, so a
+    blob is only used when it reproduces that text exactly.
+    """
+    blob = encode_compact(program, level)
+    return blob if decode_compact_json(blob) == program_json else None
@@ -0,0 +1,82 @@
+"""Deterministic synthetic training programs.
+
+Used by the replay provider when no recording fits a request, and by the
+benchmarks. Output is shaped and sized like real LLM responses. This module
+must not import app.config, so benchmarks can use it before configuring the
+environment.
+"""
+from typing import Optional
+
+SPORTS = ("swim", "bike", "run")
+INTENSITIES = ("Zone 1", "Zone 2", "Zone 3", "Zone 4", "Zone 5")
+PHASES = ("Base", "Build", "Peak", "Taper")
+
+
+def synthetic_week_data(
+    week_number: int,
+    total_weeks: int,
+    workouts_per_week: int = 6,
+    intervals: int = 4,
+    phase: Optional[str] = None,
+    hours_per_week: Optional[float] = None,
+) -> dict:
+    """Build a WeekPlan-shaped dict.
+
+    With ``hours_per_week`` the interval durations are scaled so the week adds
+    up to roughly that volume.
+    """
+    phase = phase or PHASES[min(3, (week_number - 1) * 4 // total_weeks)]
+    base_minutes = workouts_per_week * (20 + sum(10 + 5 * i for i in range(intervals)))
+    scale = hours_per_week * 60 / base_minutes if hours_per_week else 1.0
+    workouts = []
+    for w in range(workouts_per_week):
+        sport = SPORTS[w % 3]
+        main_set = [
+            {
+                "duration_minutes": max(1, round((10 + 5 * i) * scale)),
+                "distance_km": round((1.5 + i * 0.75) * scale, 2),
+                "intensity": INTENSITIES[(w + i) % 5],
+                "description": f"{sport.title()} interval {i + 1} at steady effort",
+            }
+            for i in range(intervals)
+        ]
+        workouts.append({
+            "sport": sport,
+            "title": f"{phase} {sport} session {w + 1}",
+            "total_duration_minutes": 20 + sum(i["duration_minutes"] for i in main_set),
+            "total_distance_km": round(sum(i["distance_km"] for i in main_set) + 1.0, 2),
+            "warmup": "10 min easy with drills",
+            "main_set": main_set,
+            "cooldown": "5 min easy",
+            "notes": "Keep cadence high and form relaxed",
+        })
+    return {
+        "week_number": week_number,
+        "focus": f"{phase} Training",
+        "workouts": workouts,
+        "weekly_volume_hours": round(sum(w["total_duration_minutes"] for w in workouts) / 60, 1),
+        "weekly_distance_km": round(sum(w["total_distance_km"] for w in workouts), 1),
+    }
+
+
+def synthetic_program_data(
+    weeks: int,
+    workouts_per_week: int = 6,
+    intervals: int = 4,
+    goal: str = "full_ironman",
+    fitness_level: str = "intermediate",
+    hours_per_week: Optional[float] = None,
+) -> dict:
+    """Build a TrainingProgram-shaped dict comparable in size to LLM output."""
+    return {
+        "goal": goal,
+        "fitness_level": fitness_level,
+        "duration_weeks": weeks,
+        "weeks": [
+            synthetic_week_data(
+                week_number, weeks, workouts_per_week, intervals, hours_per_week=hours_per_week
+            )
+            for week_number in range(1, weeks + 1)
+        ],
+        "notes": f"Synthetic {weeks}-week benchmark program",
+    }
@@ -0,0 +1,228 @@
+"""Output token budgets of provider calls.
+
+Each provider response is modelled as
+
+    output_tokens ~ header * programs + per_week * weeks + per_workout * workouts
+
+where ``programs`` is 1 when the response carries the program header (goal,
+duration, notes) and 0 for week calls. The coefficients start from priors and
+are refitted per provider from every response's recorded usage: the weeks and
+workouts it contains are counted in its text, so truncated responses count
+too. Older observations fade with TOKEN_BUDGET_DECAY.
+
+A request's workouts per week follow from available_hours_per_week. The
+planner predicts the output of a whole program, adds a margin (at least
+TOKEN_BUDGET_MARGIN, more when predictions have been off) and generates the
+program in one call when that fits the provider's output cap, else
+progressively, GENERATION_CHUNK_WEEKS weeks per call or as many as fit the cap
+(app.progressive). Every call gets max_output_tokens sized to its predicted
+output: too small truncates the response, too large reserves provider quota
+(tokens per minute) that is never used.
+
+The fitted model is per process, like the rate limiter; GET /api/token-budget
+shows this worker's.
+"""
+import math
+import os
+import threading
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.config import settings
+from app.models import WorkoutRequest
+
+# Output cap per call when LLM_MAX_OUTPUT_TOKENS is not set
+PROVIDER_MAX_OUTPUT_TOKENS = {"anthropic": 8192, "azure_ai": 16000}
+DEFAULT_MAX_OUTPUT_TOKENS = 8192
+
+# (header, per_week, per_workout) before any usage is recorded
+PRIOR = (120.0, 60.0, 170.0)
+PRIOR_WEIGHT = 3.0  # the prior counts as this many typical observations
+TYPICAL = (1.0, 8.0, 45.0)  # feature sizes of a typical response, to scale the prior
+
+MIN_OUTPUT_TOKENS = 1024
+ROUND_TO = 256
+MAX_MARGIN = 1.0
+
+
+def workouts_per_week(hours: int) -> int:
+    """Workouts per week expected for ``hours`` of training (the prompts ask for 5-6)."""
+    return min(settings.plan_max_workouts_per_week, max(5, round(2 + hours / 3)))
+
+
+def count_output(text: str) -> tuple[int, int, int]:
+    """(programs, weeks, workouts) in a response, also a partial one."""
+    return (
+        1 if '"duration_weeks"' in text else 0,
+        text.count('"week_number"'),
+        text.count('"sport"'),
+    )
+
+
+class TokenModel:
+    """Online ridge regression of output tokens on (programs, weeks, workouts).
+
+    The ridge term pulls the coefficients towards PRIOR, so a few responses
+    move them gradually. The relative error of each prediction, made before
+    the response is fitted, feeds the margin.
+    """
+
+    def __init__(self, prior=PRIOR, prior_weight: float = PRIOR_WEIGHT, decay: Optional[float] = None):
+        self.prior = np.array(prior, dtype=float)
+        self.ridge = np.diag(prior_weight * np.square(TYPICAL))
+        self.decay = settings.token_budget_decay if decay is None else decay
+        self._xtx = np.zeros((3, 3))
+        self._xty = np.zeros(3)
+        self._coef = self.prior.copy()
+        self._error_var = (settings.token_budget_margin / 2) ** 2
+        self.observations = 0
+        self.truncations = 0
+        self._lock = threading.Lock()
+
+    def predict(self, programs: int, weeks: int, workouts: int) -> float:
+        with self._lock:
+            return float(self._coef @ (programs, weeks, workouts))
+
+    @property
+    def margin(self) -> float:
+        """Headroom over a prediction: twice the observed relative error, at least the setting."""
+        return min(MAX_MARGIN, max(settings.token_budget_margin, 2 * math.sqrt(self._error_var)))
+
+    def budget(self, programs: int, weeks: int, workouts: int) -> int:
+        """max_output_tokens for a response of this size, before the provider cap."""
+        tokens = self.predict(programs, weeks, workouts) * (1 + self.margin)
+        return max(MIN_OUTPUT_TOKENS, ROUND_TO * math.ceil(tokens / ROUND_TO))
+
+    def observe(self, programs: int, weeks: int, workouts: int, output_tokens: int, truncated: bool = False) -> None:
+        """Fit one response of ``output_tokens`` containing these counts."""
+        if output_tokens <= 0 or weeks + workouts == 0:
+            return
+        x = np.array((programs, weeks, workouts), dtype=float)
+        with self._lock:
+            predicted = float(self._coef @ x)
+            if predicted > 0 and not truncated:
+                # A truncated response's size is the cap, not what it needed.
+                error = (output_tokens - predicted) / predicted
+                self._error_var = self.decay * self._error_var + (1 - self.decay) * error * error
+            self._xtx = self.decay * self._xtx + np.outer(x, x)
+            self._xty = self.decay * self._xty + x * output_tokens
+            self._coef = np.linalg.solve(
+                self._xtx + self.ridge, self._xty + self.ridge @ self.prior
+            )
+            self.observations += 1
+            self.truncations += int(truncated)
+
+    def state(self) -> Dict[str, float]:
+        header, per_week, per_workout = (round(float(c), 1) for c in self._coef)
+        return {
+            "header": header,
+            "per_week": per_week,
+            "per_workout": per_workout,
+            "margin": round(self.margin, 3),
+            "observations": self.observations,
+            "truncations": self.truncations,
+        }
+
+
+@dataclass(frozen=True)
+class GenerationPlan:
+    """How to generate one request: in one call or a chunk of weeks per call."""
+
+    mode: str  # "single" or "progressive"
+    workouts_per_week: int
+    predicted_tokens: int  # the whole program
+    max_output_tokens: int  # the program call (single) or a full chunk (progressive)
+    chunk_weeks: int  # weeks per progressive call: GENERATION_CHUNK_WEEKS, if they fit the cap
+
+    def as_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+
+_models: Dict[str, TokenModel] = {}
+_models_lock = threading.Lock()
+
+
+def get_token_model(provider: str) -> TokenModel:
+    """This process's output model of ``provider``."""
+    model = _models.get(provider)
+    if model is None:
+        with _models_lock:
+            model = _models.get(provider)
+            if model is None:
+                model = _models[provider] = TokenModel()
+    return model
+
+
+def output_cap(provider: str) -> int:
+    """Largest max_output_tokens a single call to ``provider`` may ask for."""
+    return settings.llm_max_output_tokens or PROVIDER_MAX_OUTPUT_TOKENS.get(
+        provider, DEFAULT_MAX_OUTPUT_TOKENS
+    )
+
+
+def chunk_output_tokens(request: WorkoutRequest, provider: str, weeks: int) -> int:
+    """max_output_tokens of a call generating ``weeks`` weeks of ``request``."""
+    budget = get_token_model(provider).budget(
+        0, weeks, weeks * workouts_per_week(request.available_hours_per_week)
+    )
+    return min(budget, output_cap(provider))
+
+
+def week_output_tokens(request: WorkoutRequest, provider: str) -> int:
+    """max_output_tokens of one week call for ``request``."""
+    return chunk_output_tokens(request, provider, 1)
+
+
+def program_output_tokens(request: WorkoutRequest, provider: str) -> int:
+    """max_output_tokens of a call generating all of ``request`` at once."""
+    weeks = request.duration_weeks
+    budget = get_token_model(provider).budget(
+        1, weeks, weeks * workouts_per_week(request.available_hours_per_week)
+    )
+    return min(budget, output_cap(provider))
+
+
+def plan_generation(request: WorkoutRequest, provider: str) -> GenerationPlan:
+    """Mode and output budgets of generating ``request`` with ``provider``."""
+    model = get_token_model(provider)
+    cap = output_cap(provider)
+    per_week = workouts_per_week(request.available_hours_per_week)
+    weeks = request.duration_weeks
+    predicted = model.predict(1, weeks, weeks * per_week)
+    week_tokens = max(1.0, model.predict(0, 1, per_week))
+    fit = int(cap / (1 + model.margin) / week_tokens)
+    chunk_weeks = max(1, min(weeks, settings.generation_chunk_weeks, fit))
+    if model.budget(1, weeks, weeks * per_week) <= cap:
+        return GenerationPlan(
+            "single", per_week, round(predicted), program_output_tokens(request, provider), chunk_weeks
+        )
+    return GenerationPlan(
+        "progressive", per_week, round(predicted),
+        chunk_output_tokens(request, provider, chunk_weeks), chunk_weeks,
+    )
+
+
+def record_output(provider: str, text: str, output_tokens: Optional[int], truncated: bool = False) -> None:
+    """Fit ``provider``'s model to a response and the output tokens it used."""
+    if not output_tokens or not text:
+        return
+    get_token_model(provider).observe(*count_output(text), output_tokens, truncated=truncated)
+
+
+def token_budget_state() -> Dict[str, Dict[str, float]]:
+    """Fitted model of each provider this process has called."""
+    return {
+        provider: {**model.state(), "max_output_tokens": output_cap(provider)}
+        for provider, model in list(_models.items())
+    }
+
+
+def _reset_after_fork():
+    global _models, _models_lock
+    _models = {}
+    _models_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,68 @@
+"""Mid-cycle variants of existing programs (DERIVE_CURRENT_WEEK).
+
+A request with current_week > 1 is otherwise a new LLM generation, although
+it differs from an already saved full-length program (same goal, fitness
+level, hours, duration and focus areas, starting at week 1) only in where
+the athlete joins. Such a request is answered from the full-length program
+with app.periodization.derive_from_week: the remaining weeks, renumbered and
+relabelled, saved as a new program.
+"""
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.batch import request_key
+from app.database import LibraryProgram, SavedProgram
+from app.models import TrainingProgram, WorkoutRequest, parse_program
+from app.periodization import derive_from_week
+
+# Saved candidates with matching columns examined for a matching request.
+_CANDIDATES = 50
+
+
+async def find_full_program(
+    db: AsyncSession, request: WorkoutRequest
+) -> Optional[Tuple[TrainingProgram, Optional[int]]]:
+    """The week-1 program for ``request``'s parameters: (program, saved id or None)."""
+    key = request_key(request.model_copy(update={"current_week": 1}))
+    rows = (await db.execute(
+        select(SavedProgram.id, SavedProgram.request_json)
+        .where(
+            SavedProgram.goal == request.goal.value,
+            SavedProgram.fitness_level == request.fitness_level.value,
+            SavedProgram.duration_weeks == request.duration_weeks,
+            SavedProgram.available_hours_per_week == request.available_hours_per_week,
+            SavedProgram.request_json.is_not(None),
+        )
+        .order_by(SavedProgram.id.desc())
+        .limit(_CANDIDATES)
+    )).all()
+    for program_id, raw in rows:
+        try:
+            if request_key(WorkoutRequest.model_validate_json(raw)) != key:
+                continue
+        except ValueError:
+            continue
+        saved = await db.get(SavedProgram, program_id)
+        if saved is not None:
+            return parse_program(saved.program_text), program_id
+    program_json = await db.scalar(
+        select(LibraryProgram.program_json).where(LibraryProgram.request_key == key)
+    )
+    return None if program_json is None else (parse_program(program_json), None)
+
+
+async def find_variant(
+    db: AsyncSession, request: WorkoutRequest
+) -> Optional[Tuple[TrainingProgram, Optional[int]]]:
+    """``request``'s program derived from a full-length one: (program, source id or None)."""
+    if request.current_week <= 1:
+        return None
+    found = await find_full_program(db, request)
+    if found is None:
+        return None
+    program, source_id = found
+    if request.current_week > len(program.weeks):
+        return None
+    return derive_from_week(program, request.current_week, source_id), source_id
@@ -0,0 +1,68 @@
+"""Deferred initialization and readiness.
+
+Expensive start-up work (schema creation, provider SDK import and client
+construction) is registered as warm-up hooks instead of running at import
+time. The server starts listening immediately; the hooks run in the
+background after start-up, on the first /ready probe, or lazily on first use.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_hooks: List[Tuple[str, Callable[[], None]]] = []
+_status: Dict[str, dict] = {}
+_run_lock = threading.Lock()
+
+
+def warmup_hook(name: str):
+    """Register ``fn`` to run during warm-up under ``name``."""
+    def register(fn: Callable[[], None]) -> Callable[[], None]:
+        _hooks.append((name, fn))
+        return fn
+
+    return register
+
+
+def is_ready() -> bool:
+    """True once every warm-up hook has completed successfully."""
+    return all(_status.get(name, {}).get("ok") for name, _ in _hooks)
+
+
+def run_warmup() -> bool:
+    """Run every hook that hasn't succeeded yet; returns readiness."""
+    with _run_lock:
+        for name, fn in _hooks:
+            if _status.get(name, {}).get("ok"):
+                continue
+            start = time.perf_counter()
+            try:
+                fn()
+            except Exception as exc:
+                logger.exception("Warm-up hook %r failed", name)
+                _status[name] = {"ok": False, "error": str(exc)}
+            else:
+                _status[name] = {"ok": True}
+            _status[name]["seconds"] = round(time.perf_counter() - start, 3)
+    return is_ready()
+
+
+def readiness() -> dict:
+    """Readiness report: overall flag plus per-hook status and timing."""
+    return {
+        "ready": is_ready(),
+        "checks": {name: _status.get(name, {"ok": False, "pending": True}) for name, _ in _hooks},
+    }
+
+
+def _reset_after_fork():
+    # Process-local clients must be rebuilt in each worker.
+    global _run_lock
+    _status.clear()
+    _run_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,152 @@
+"""Single-writer queue that serializes and batches small database commits."""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple, TypeVar
+
+from sqlalchemy.orm import Session, sessionmaker
+
+T = TypeVar("T")
+WorkItem = Tuple[Callable[[Session], Any], Future]
+
+_STOP = object()
+
+
+def _adder(instance: T) -> Callable[[Session], T]:
+    def _add(session: Session) -> T:
+        session.add(instance)
+        session.flush()
+        return instance
+
+    return _add
+
+
+class WriteQueue:
+    """Funnel writes through one background thread and commit them in batches.
+
+    SQLite allows a single writer at a time. Routing every small insert through
+    one connection turns lock contention ("database is locked") into a short
+    in-process queue, and lets a burst of writes share a single commit.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        max_batch: int = 64,
+        max_wait_ms: int = 2,
+    ):
+        self._session_factory = session_factory
+        self._max_batch = max(1, max_batch)
+        self._max_wait = max(0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, work: Callable[[Session], T]) -> "Future[T]":
+        """Queue ``work(session)`` for the writer thread and return its future.
+
+        ``work`` should add/flush objects but must not commit; the queue commits
+        once per batch and resolves the future after the commit succeeds.
+        """
+        self._ensure_started()
+        future: "Future[T]" = Future()
+        self._queue.put((work, future))
+        return future
+
+    def run(self, work: Callable[[Session], T]) -> T:
+        """Queue ``work`` and block until its batch has been committed."""
+        return self.submit(work).result()
+
+    def add(self, instance: T) -> T:
+        """Insert a single ORM instance and return it once committed."""
+        return self.run(_adder(instance))
+
+    async def add_async(self, instance: T) -> T:
+        """Like :meth:`add`, but awaits the commit instead of blocking the loop."""
+        return await asyncio.wrap_future(self.submit(_adder(instance)))
+
+    def close(self, timeout: float | None = None) -> None:
+        """Drain outstanding work and stop the writer thread."""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _ensure_started(self) -> None:
+        # Started lazily so that the thread is created in the process that
+        # actually writes (e.g. after a gunicorn fork), not at import time.
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="db-write-queue", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch: List[WorkItem] = [item]
+            stop = False
+            deadline = time.monotonic() + self._max_wait
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self, batch: List[WorkItem]) -> None:
+        batch = [(work, fut) for work, fut in batch if fut.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        session = self._session_factory()
+        try:
+            results = [(fut, work(session)) for work, fut in batch]
+            session.commit()
+        except Exception:
+            session.rollback()
+            results = None
+        finally:
+            session.close()
+
+        if results is None:
+            # One bad item must not fail its neighbours: retry them one by one.
+            for work, fut in batch:
+                self._commit_single(work, fut)
+            return
+
+        for fut, result in results:
+            fut.set_result(result)
+
+    def _commit_single(self, work: Callable[[Session], Any], fut: Future) -> None:
+        session = self._session_factory()
+        try:
+            result = work(session)
+            session.commit()
+        except Exception as exc:
+            session.rollback()
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+        finally:
+            session.close()
@@ -0,0 +1,125 @@
+"""
+Planned-vs-completed compliance: row-by-row ORM vs columnar.
+
+Fills a temporary SQLite database with --programs synthetic programs and
+--workouts completed workouts, then times the per-(program, week, sport)
+compliance table computed
+  orm       per program: get_program + parse_program + get_workout_history,
+            aggregated in Python dicts
+  columns   app.analytics.load_columns + compliance (NumPy)
+  files     compliance on the exported Parquet dataset (read_table)
+  query     compliance alone, on columns already in memory
+and checks that they agree.
+
+Usage:
+    pip install pyarrow
+    python benchmarks/bench_analytics.py --programs 300 --workouts 20000
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from common import request_data_for, synthetic_program_data, use_temp_database
+
+
+def fill(db, programs: int, workouts: int, weeks: int) -> None:
+    from app.database import SavedProgram, WorkoutHistory
+    from app.models import TrainingProgram
+    from app.repository import ProgramRepository
+
+    rng = random.Random(1)
+    program = TrainingProgram(**synthetic_program_data(weeks))
+    for _ in range(programs):
+        ProgramRepository.save_program(db, program, request_data_for(weeks))
+    start = {row.id: row.created_at for row in db.query(SavedProgram)}
+    db.bulk_save_objects([
+        WorkoutHistory(
+            program_id=program_id,
+            completed_at=start[program_id] + timedelta(hours=rng.randint(0, weeks * 7 * 24 - 1)),
+            sport=rng.choice(["swim", "bike", "run"]),
+            title="Logged workout",
+            duration_minutes=rng.randint(20, 120),
+            rating=3,
+        )
+        for program_id in (rng.choice(list(start)) for _ in range(workouts))
+    ])
+    db.commit()
+
+
+def orm_compliance(db) -> dict:
+    from app.models import parse_program
+    from app.repository import ProgramRepository, WorkoutHistoryRepository
+
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for row in ProgramRepository.list_programs(db, skip=0, limit=1_000_000):
+        saved = ProgramRepository.get_program(db, row.id)
+        for week in parse_program(saved.program_text).weeks:
+            for workout in week.workouts:
+                key = (saved.id, week.week_number, workout.sport.value)
+                totals[key][0] += workout.total_duration_minutes
+        for workout in WorkoutHistoryRepository.get_workout_history(
+            db, program_id=saved.id, limit=1_000_000
+        ):
+            week_number = (workout.completed_at - saved.created_at).days // 7 + 1
+            totals[(saved.id, week_number, workout.sport)][1] += workout.duration_minutes
+    return totals
+
+
+def as_dict(result) -> dict:
+    return {
+        (int(p), int(w), s): [pm, cm]
+        for p, w, s, pm, cm in zip(
+            result["program_id"], result["week_number"], result["sport"],
+            result["planned_minutes"], result["completed_minutes"],
+        )
+    }
+
+
+def timed(func):
+    start = time.perf_counter()
+    value = func()
+    return value, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--programs", type=int, default=300)
+    parser.add_argument("--workouts", type=int, default=20000)
+    parser.add_argument("--weeks", type=int, default=12)
+    args = parser.parse_args()
+
+    use_temp_database()
+    from app import analytics
+    from app.database import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    fill(db, args.programs, args.workouts, args.weeks)
+    out_dir = tempfile.mkdtemp(prefix="tri-analytics-")
+    _, export_ms = timed(lambda: analytics.export_analytics(db, out_dir))
+
+    expected, orm_ms = timed(lambda: orm_compliance(db))
+    db.expunge_all()
+    columns, columns_ms = timed(lambda: analytics.compliance(*analytics.load_columns(db)))
+    tables, read_ms = timed(lambda: (
+        analytics.read_table(out_dir, "planned"), analytics.read_table(out_dir, "completed")
+    ))
+    files, query_ms = timed(lambda: analytics.compliance(*tables))
+    assert as_dict(columns) == as_dict(files) == dict(expected)
+    db.close()
+
+    print(f"{args.programs} programs x {args.weeks} weeks, {args.workouts} completed workouts, "
+          f"{len(expected)} groups (export took {export_ms:.0f} ms)")
+    timings = {
+        "orm": orm_ms, "columns": columns_ms, "files": read_ms + query_ms, "query": query_ms,
+    }
+    for name, ms in timings.items():
+        print(f"{name:<10}{ms:>10.1f} ms{orm_ms / ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
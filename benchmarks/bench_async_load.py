@@ -0,0 +1,110 @@
+"""
+Load test: read latency while writes are in flight.
+
+Drives the ASGI app in-process with httpx at a fixed (open-loop) request
+rate. Readers fetch a 52-week program, the history list and stats; in the
+second phase writers log workouts at the same time. With the async repository
+layer, read latency should stay roughly flat when writers are added, because
+no request waits on another request's database I/O.
+
+Usage:
+    python benchmarks/bench_async_load.py --read-rate 40 --write-rate 100 --seconds 5
+"""
+
+import argparse
+import asyncio
+import time
+
+from common import percentile, request_data_for, synthetic_program_data, use_temp_database
+
+use_temp_database()
+
+import httpx  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import TrainingProgram  # noqa: E402
+from app.repository import ProgramRepository  # noqa: E402
+
+
+def seed_program(weeks: int = 52) -> int:
+    init_db()
+    program = TrainingProgram(**synthetic_program_data(weeks))
+    db = SessionLocal()
+    try:
+        return ProgramRepository.save_program(db, program, request_data_for(weeks)).id
+    finally:
+        db.close()
+
+
+async def run_phase(client, program_id: int, read_rate: float, write_rate: float, seconds: float):
+    read_latencies: list[float] = []
+    write_latencies: list[float] = []
+    read_paths = [f"/api/workouts/{program_id}", "/api/history?limit=20", "/api/stats"]
+
+    async def read(n: int):
+        start = time.perf_counter()
+        response = await client.get(read_paths[n % len(read_paths)])
+        response.raise_for_status()
+        read_latencies.append(time.perf_counter() - start)
+
+    async def write(n: int):
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/history/log",
+            params={"program_id": program_id, "title": f"bench-{n}", "duration_minutes": 45},
+        )
+        response.raise_for_status()
+        write_latencies.append(time.perf_counter() - start)
+
+    async def drive(rate: float, make_request):
+        # Open loop: requests are issued on schedule whether or not earlier
+        # ones have finished, so slow responses show up as latency.
+        if rate <= 0:
+            return
+        tasks = []
+        start = time.perf_counter()
+        for n in range(int(rate * seconds)):
+            delay = start + n / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(make_request(n)))
+        await asyncio.gather(*tasks)
+
+    await asyncio.gather(drive(read_rate, read), drive(write_rate, write))
+    return read_latencies, write_latencies
+
+
+def report(label: str, latencies: list[float], seconds: float) -> None:
+    print(
+        f"{label:<24}{len(latencies) / seconds:>10.1f}"
+        f"{percentile(latencies, 50) * 1000:>10.2f}"
+        f"{percentile(latencies, 95) * 1000:>10.2f}"
+        f"{percentile(latencies, 99) * 1000:>10.2f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--read-rate", type=float, default=40, help="reads per second")
+    parser.add_argument("--write-rate", type=float, default=100, help="writes per second")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    program_id = seed_program()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await run_phase(client, program_id, 10, 10, 0.5)  # warm up pools
+
+        print(f"{'phase':<24}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        reads, _ = await run_phase(client, program_id, args.read_rate, 0, args.seconds)
+        report("reads (no writers)", reads, args.seconds)
+        reads, writes = await run_phase(
+            client, program_id, args.read_rate, args.write_rate, args.seconds
+        )
+        report("reads (with writers)", reads, args.seconds)
+        report("writes", writes, args.seconds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Time ICS/TCX exports of stored programs (app/exports.py).
+
+Per 4-52 week program: rendering week by week from the stored document, a
+naive render that validates the whole TrainingProgram first, and a cache hit.
+Then a bulk export of --programs 52-week programs, serially and on the
+process pool (pool start-up excluded).
+
+Usage:
+    python benchmarks/bench_exports.py
+    python benchmarks/bench_exports.py --programs 64
+"""
+
+import argparse
+import json
+import os
+import time
+import timeit
+from datetime import date, datetime
+
+from common import synthetic_program_data
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark-placeholder")
+
+from app.exports import bulk_export, get_export_cache, get_export_pool, render_export  # noqa: E402
+from app.models import TrainingProgram  # noqa: E402
+from app.storage import serialize_program  # noqa: E402
+
+WEEKS = (4, 12, 24, 52)
+START = date(2026, 1, 5)
+CREATED = datetime(2026, 1, 1)
+
+
+def stored(weeks: int):
+    program = serialize_program(TrainingProgram(**synthetic_program_data(weeks)))
+    return program.program_json, json.loads(program.week_offsets)
+
+
+def naive_render(program_text: str, fmt: str) -> bytes:
+    """Validate the whole program, then render it from the model."""
+    serialized = serialize_program(TrainingProgram.model_validate_json(program_text))
+    offsets = json.loads(serialized.week_offsets)
+    return render_export(0, serialized.program_json, offsets, fmt, START, CREATED)
+
+
+def best_ms(func) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--programs", type=int, default=32, help="programs in the bulk export")
+    args = parser.parse_args()
+
+    cache = get_export_cache()
+    print(f"{'format':>6}{'weeks':>6}{'streamed':>12}{'naive':>12}{'cached':>12}{'size':>10}")
+    for fmt in ("ics", "tcx"):
+        for weeks in WEEKS:
+            text, offsets = stored(weeks)
+            body = render_export(0, text, offsets, fmt, START, CREATED)
+            cache.set(f"bench/{fmt}/{weeks}", body)
+            print(
+                f"{fmt:>6}{weeks:>6}"
+                f"{best_ms(lambda: render_export(0, text, offsets, fmt, START, CREATED)):>10.2f}ms"
+                f"{best_ms(lambda: naive_render(text, fmt)):>10.2f}ms"
+                f"{best_ms(lambda: cache.get(f'bench/{fmt}/{weeks}')) * 1e3:>10.2f}us"
+                f"{len(body) // 1024:>8}KB"
+            )
+
+    text, offsets = stored(52)
+    sources = [(i, f"bench-{i}", text, offsets, CREATED) for i in range(args.programs)]
+    cache.clear()
+    started = time.perf_counter()
+    for source in sources:
+        render_export(source[0], text, offsets, "ics", START, CREATED)
+    serial = time.perf_counter() - started
+    get_export_pool().submit(int).result()  # start the workers
+    list(get_export_pool().map(int, range(os.cpu_count() or 1)))
+    started = time.perf_counter()
+    bulk_export(sources, "ics", START)
+    pooled = time.perf_counter() - started
+    print(
+        f"\nbulk ics x{args.programs}: serial {serial * 1e3:.0f}ms, "
+        f"pool {pooled * 1e3:.0f}ms (incl. zip), {serial / pooled:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
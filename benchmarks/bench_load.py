@@ -0,0 +1,173 @@
+"""
+Offline load test of the main endpoints with the replay provider.
+
+Runs the app with LLM_PROVIDER=replay, so program generation streams
+recorded (or synthetic) responses with simulated provider latency instead of
+calling a paid API. A fixed number of concurrent clients (closed loop) issue a
+weighted mix of POST /api/workouts/generate, GET /api/workouts/{id},
+GET /api/history and GET /api/stats, and the script reports throughput and
+p50/p95/p99 per endpoint. --max-p95-ms turns it into a regression gate: the
+exit status is 1 when an endpoint's p95 exceeds its budget.
+
+By default the app is driven in-process; with --url it targets a running
+server instead (start that with LLM_PROVIDER=replay and matching REPLAY_*
+settings).
+
+Usage:
+    python benchmarks/bench_load.py --concurrency 32 --seconds 20 --speedup 20
+    python benchmarks/bench_load.py --mix generate=1,get=8,history=2,stats=1 \\
+        --max-p95-ms get=50 --max-p95-ms stats=100
+    python benchmarks/bench_load.py --url http://localhost:8000 --recordings recordings/
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+from common import percentile, use_temp_database
+
+ENDPOINTS = ("generate", "get", "history", "stats")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--mix", default="generate=1,get=6,history=2,stats=1",
+                        help="relative weight of each endpoint")
+    parser.add_argument("--weeks", type=int, default=12, help="duration_weeks of generated programs")
+    parser.add_argument("--speedup", type=float, default=20.0,
+                        help="divide simulated provider latency by this (REPLAY_SPEEDUP)")
+    parser.add_argument("--recordings", help="directory of recorded responses (REPLAY_DIR)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="target a running server instead of the in-process app")
+    parser.add_argument("--max-p95-ms", action="append", default=[], metavar="ENDPOINT=MS",
+                        help="fail if the endpoint's p95 exceeds MS (repeatable)")
+    args = parser.parse_args()
+    args.weights = {name: 0.0 for name in ENDPOINTS}
+    for item in args.mix.split(","):
+        name, weight = item.split("=")
+        if name not in args.weights:
+            parser.error(f"unknown endpoint in --mix: {name}")
+        args.weights[name] = float(weight)
+    args.budgets = {}
+    for item in args.max_p95_ms:
+        name, ms = item.split("=")
+        args.budgets[name] = float(ms)
+    return args
+
+
+def configure_environment(args) -> None:
+    # Must run before app is imported: settings are read at import time.
+    use_temp_database()
+    os.environ["LLM_PROVIDER"] = "replay"
+    os.environ["REPLAY_SPEEDUP"] = str(args.speedup)
+    os.environ["REPLAY_SEED"] = str(args.seed)
+    if args.recordings:
+        os.environ["REPLAY_DIR"] = args.recordings
+
+
+async def run(client, args) -> dict:
+    rng = random.Random(args.seed)
+    names = [name for name in ENDPOINTS if args.weights[name] > 0]
+    weights = [args.weights[name] for name in names]
+    request_body = {
+        "goal": "half_ironman",
+        "fitness_level": "intermediate",
+        "available_hours_per_week": 10,
+        "duration_weeks": args.weeks,
+    }
+    program_ids: list[int] = []
+    results = {name: {"latencies": [], "errors": 0} for name in ENDPOINTS}
+
+    async def call(name: str):
+        if name == "generate":
+            response = await client.post("/api/workouts/generate", json=request_body)
+            if response.status_code == 200:
+                program_ids.append(response.json()["id"])
+            return response
+        if name == "get":
+            return await client.get(f"/api/workouts/{rng.choice(program_ids)}")
+        if name == "history":
+            return await client.get("/api/history", params={"limit": 20})
+        return await client.get("/api/stats")
+
+    # Reads need something to read.
+    response = await call("generate")
+    response.raise_for_status()
+
+    deadline = time.perf_counter() + args.seconds
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await call(name)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            if ok:
+                results[name]["latencies"].append(time.perf_counter() - start)
+            else:
+                results[name]["errors"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    results["elapsed"] = time.perf_counter() - start
+    return results
+
+
+def report(results: dict, budgets: dict) -> bool:
+    elapsed = results["elapsed"]
+    print(f"{'endpoint':<12}{'requests':>10}{'errors':>8}{'req/s':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'budget':>10}")
+    ok = True
+    total = 0
+    for name in ENDPOINTS:
+        latencies = results[name]["latencies"]
+        if not latencies and not results[name]["errors"]:
+            continue
+        total += len(latencies)
+        p95 = percentile(latencies, 95) * 1000
+        budget = budgets.get(name)
+        verdict = ""
+        if budget is not None:
+            passed = p95 <= budget and not results[name]["errors"]
+            ok = ok and passed
+            verdict = f"{'ok' if passed else 'FAIL'} {budget:g}"
+        print(
+            f"{name:<12}{len(latencies):>10}{results[name]['errors']:>8}"
+            f"{len(latencies) / elapsed:>10.1f}"
+            f"{percentile(latencies, 50) * 1000:>10.2f}{p95:>10.2f}"
+            f"{percentile(latencies, 99) * 1000:>10.2f}{verdict:>10}"
+        )
+    print(f"{'total':<12}{total:>10}{'':>8}{total / elapsed:>10.1f}")
+    return ok
+
+
+async def main():
+    args = parse_args()
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=600)
+    else:
+        configure_environment(args)
+        from app.main import app
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=600
+        )
+    async with client:
+        results = await run(client, args)
+    print(f"concurrency={args.concurrency} seconds={args.seconds:g} weeks={args.weeks} "
+          f"speedup={args.speedup:g} mix={args.mix}")
+    return report(results, args.budgets)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
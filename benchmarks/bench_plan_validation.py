@@ -0,0 +1,71 @@
+"""
+Time the plan-validation rules (app/plan_validation.py) per program.
+
+For 4-52 week programs, reports validate_program on a clean program and on
+one that breaks every rule, and repair_program; --max-us fails (exit 1) when
+validating a 52-week program takes longer than that.
+
+Usage:
+    python benchmarks/bench_plan_validation.py
+    python benchmarks/bench_plan_validation.py --max-us 1000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+from common import synthetic_program_data
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark-placeholder")
+
+from app.models import TrainingProgram  # noqa: E402
+from app.plan_validation import repair_program, validate_program  # noqa: E402
+
+WEEKS = (4, 12, 24, 52)
+
+
+def broken_program(weeks: int) -> TrainingProgram:
+    """Synthetic program with a volume jump, a 7-workout week, a wrong weekly
+    total and an overflowing interval set."""
+    data = synthetic_program_data(weeks)
+    data["weeks"][1]["workouts"] = [
+        dict(workout, total_duration_minutes=workout["total_duration_minutes"] * 2)
+        for workout in data["weeks"][1]["workouts"]
+    ]
+    data["weeks"][2]["workouts"].append(dict(data["weeks"][2]["workouts"][0]))
+    data["weeks"][3]["weekly_volume_hours"] += 4
+    data["weeks"][-1]["workouts"][0]["main_set"][0]["duration_minutes"] = 600
+    return TrainingProgram(**data)
+
+
+def best_us(func) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=7, number=number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-us", type=float, help="budget for a clean 52-week program")
+    args = parser.parse_args()
+
+    print(f"{'weeks':>6}{'clean':>12}{'broken':>12}{'violations':>12}{'repair':>12}")
+    for weeks in WEEKS:
+        clean = TrainingProgram(**synthetic_program_data(weeks))
+        broken = broken_program(weeks)
+        assert not validate_program(clean)
+        assert not validate_program(repair_program(broken))
+        clean_us = best_us(lambda: validate_program(clean))
+        print(
+            f"{weeks:>6}{clean_us:>10.0f}us{best_us(lambda: validate_program(broken)):>10.0f}us"
+            f"{len(validate_program(broken)):>12}{best_us(lambda: repair_program(broken)):>10.0f}us"
+        )
+    if args.max_us is not None and clean_us > args.max_us:
+        print(f"FAIL: 52-week validation took {clean_us:.0f}us (budget {args.max_us:g}us)")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
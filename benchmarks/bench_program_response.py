@@ -0,0 +1,98 @@
+"""
+Benchmark: serializing GET /api/workouts/{id} responses for large programs.
+
+Compares the previous path (json.loads of the stored document, then FastAPI's
+jsonable_encoder + JSONResponse), the same with an orjson-backed response
+class, and the raw pass-through that splices the stored JSON into the
+envelope. Reports p50/p99 latency and peak allocations per response.
+
+Usage:
+    python benchmarks/bench_program_response.py --iterations 200
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+
+from common import percentile, synthetic_program_data
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.models import TrainingProgram
+from app.responses import orjson, program_response_body
+
+
+def legacy_body(program) -> bytes:
+    content = {
+        "id": program.id,
+        "created_at": program.created_at.isoformat(),
+        "goal": program.goal,
+        "fitness_level": program.fitness_level,
+        "duration_weeks": program.duration_weeks,
+        "program": json.loads(program.program_json),
+    }
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def orjson_body(program) -> bytes:
+    from fastapi.responses import ORJSONResponse
+
+    content = {
+        "id": program.id,
+        "created_at": program.created_at.isoformat(),
+        "goal": program.goal,
+        "fitness_level": program.fitness_level,
+        "duration_weeks": program.duration_weeks,
+        "program": orjson.loads(program.program_json),
+    }
+    return ORJSONResponse(jsonable_encoder(content)).body
+
+
+def measure(fn, program, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(program)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(program)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return percentile(timings, 50), percentile(timings, 99), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--weeks", type=int, nargs="*", default=[4, 12, 24, 52])
+    args = parser.parse_args()
+
+    paths = [("json.loads + JSONResponse", legacy_body)]
+    if orjson is not None:
+        paths.append(("orjson response class", orjson_body))
+    paths.append(("raw pass-through", program_response_body))
+
+    print(f"{'weeks':>5} {'size KB':>8}  {'path':<28}{'p50 ms':>9}{'p99 ms':>9}{'peak KB':>10}")
+    for weeks in args.weeks:
+        program_json = TrainingProgram(**synthetic_program_data(weeks)).model_dump_json()
+        program = SimpleNamespace(
+            id=1,
+            created_at=datetime.utcnow(),
+            goal="full_ironman",
+            fitness_level="intermediate",
+            duration_weeks=weeks,
+            program_json=program_json,
+        )
+        assert json.loads(program_response_body(program)) == json.loads(legacy_body(program))
+        for name, fn in paths:
+            p50, p99, peak = measure(fn, program, args.iterations)
+            print(f"{weeks:>5} {len(program_json) / 1024:>8.0f}  {name:<28}"
+                  f"{p50 * 1000:>9.3f}{p99 * 1000:>9.3f}{peak / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Provider calls, input tokens and wall time of progressive generation.
+
+Programs too long for one response used to be generated one week per call,
+each call paying for the system prompt again. They are now generated a chunk
+of weeks per call (GENERATION_CHUNK_WEEKS) with a few lines summarizing the
+previous chunk, optionally with chunks of one phase in parallel
+(GENERATION_CHUNK_PARALLEL). Runs app.progressive with the replay provider
+for 12/24/52-week programs; input tokens are counted from the prompts a real
+provider would be sent, wall time is simulated provider latency divided by
+--speedup.
+
+Usage:
+    python benchmarks/bench_progressive.py
+    python benchmarks/bench_progressive.py --chunk-weeks 6 --parallel 3 --speedup 50
+"""
+
+import argparse
+import dataclasses
+import os
+import time
+
+from common import request_data_for
+
+WEEKS = (12, 24, 52)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunk-weeks", type=int, default=4)
+    parser.add_argument("--parallel", type=int, default=2)
+    parser.add_argument("--speedup", type=float, default=20.0,
+                        help="divide simulated provider latency by this (REPLAY_SPEEDUP)")
+    args = parser.parse_args()
+
+    os.environ["REPLAY_SPEEDUP"] = str(args.speedup)
+    os.environ.setdefault("REPLAY_SEED", "1")
+    from app.agent_replay import CHARS_PER_TOKEN, SYSTEM_PROMPT_TOKENS, TriathlonWorkoutAgentReplay
+    from app.config import settings
+    from app.models import WorkoutRequest
+    from app.progressive import chunk_prompt, generate_progressive
+    from app.token_budget import plan_generation
+
+    agent = TriathlonWorkoutAgentReplay()
+    modes = [
+        ("1 week per call (before)", 1, 1),
+        (f"{args.chunk_weeks} weeks per call", args.chunk_weeks, 1),
+        (f"{args.chunk_weeks} weeks, {args.parallel} in parallel", args.chunk_weeks, args.parallel),
+    ]
+
+    print(f"{'weeks':>5}  {'mode':<30}{'calls':>7}{'input tok':>11}{'seconds':>9}")
+    for weeks in WEEKS:
+        request = WorkoutRequest(**request_data_for(weeks))
+        for name, chunk_weeks, parallel in modes:
+            input_tokens = []
+
+            def generate_chunk(request, chunk, context, progress=None):
+                prompt = chunk_prompt(request, chunk, context, request.goal.value)
+                input_tokens.append(SYSTEM_PROMPT_TOKENS + len(prompt) // CHARS_PER_TOKEN)
+                return agent.generate_weeks(request, chunk, context, progress=progress)
+
+            settings.generation_chunk_parallel = parallel
+            plan = dataclasses.replace(plan_generation(request, "replay"), chunk_weeks=chunk_weeks)
+            start = time.perf_counter()
+            program = generate_progressive(request, plan, generate_chunk, "replay")
+            elapsed = time.perf_counter() - start
+            assert [week.week_number for week in program.weeks] == list(range(1, weeks + 1))
+            print(f"{weeks:>5}  {name:<30}{len(input_tokens):>7}{sum(input_tokens):>11}{elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Payload behind the first screen of program.html for 12/24/52-week programs.
+
+The page used to fetch the whole program (GET /api/workouts/{id}) before
+rendering anything. It now fetches the summary and the first range of weeks,
+then the rest as they scroll into view; a revisit with the program in
+IndexedDB is a single conditional summary request answered with 304.
+Reports bytes and p50 latency of each, through the ASGI app. The whole
+program and the summary come from the response cache once hot; week ranges
+are sliced from the stored document on every request.
+
+Render times in the browser are measured by the page at /benchmarks/render
+(start the server with BENCHMARK_PAGES=true and open it; results are also
+left in window.renderBenchmarkResults for headless runs).
+
+Usage:
+    python benchmarks/bench_render.py
+    python benchmarks/bench_render.py --iterations 200
+"""
+
+import argparse
+import time
+
+from common import percentile, request_data_for, synthetic_program_data, use_temp_database
+
+use_temp_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.database import SessionLocal, ensure_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import TrainingProgram  # noqa: E402
+from app.repository import ProgramRepository  # noqa: E402
+
+WEEKS = (12, 24, 52)
+WEEKS_PER_FETCH = 4  # as in app/static/program-view.js
+
+
+def measure(client: TestClient, paths, iterations: int, headers=None):
+    """(total bytes, p50 ms) of fetching ``paths`` one after another."""
+    timings, size = [], 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        size = sum(len(client.get(path, headers=headers).content) for path in paths)
+        timings.append(time.perf_counter() - start)
+    return size, percentile(timings, 50) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    ensure_db()
+    db = SessionLocal()
+    try:
+        ids = {
+            weeks: ProgramRepository.save_program(
+                db, TrainingProgram(**synthetic_program_data(weeks)), request_data_for(weeks)
+            ).id
+            for weeks in WEEKS
+        }
+    finally:
+        db.close()
+
+    print(f"{'weeks':>5}  {'request':<34}{'KB':>8}{'p50 ms':>9}")
+    with TestClient(app) as client:
+        for weeks, program_id in ids.items():
+            summary = f"/api/workouts/{program_id}/summary"
+            etag = client.get(summary).headers["etag"]
+            cases = [
+                ("whole program (before)", [f"/api/workouts/{program_id}"], None),
+                ("summary + first weeks", [summary, f"/api/workouts/{program_id}/weeks?from=1&to={WEEKS_PER_FETCH}"], None),
+                ("revisit (summary 304)", [summary], {"If-None-Match": etag}),
+            ]
+            for name, paths, headers in cases:
+                size, p50 = measure(client, paths, args.iterations, headers)
+                print(f"{weeks:>5}  {name:<34}{size / 1024:>8.1f}{p50:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Concurrency benchmark for the SQLite profile: mixed readers and writers.
+
+Runs every profile in a fresh subprocess (settings are read at import time)
+against a temporary database file and reports throughput, latency percentiles
+and "database is locked" errors.
+
+Usage:
+    python benchmarks/bench_sqlite_concurrency.py
+    python benchmarks/bench_sqlite_concurrency.py --readers 16 --writers 8 --seconds 10
+    python benchmarks/bench_sqlite_concurrency.py --profile tuned
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Environment overrides for each profile.
+PROFILES = {
+    # Rollback journal, full fsync, no busy wait, every request commits itself.
+    "default": {
+        "SQLITE_JOURNAL_MODE": "delete",
+        "SQLITE_SYNCHRONOUS": "full",
+        "SQLITE_BUSY_TIMEOUT_MS": "0",
+        "SQLITE_MMAP_SIZE": "0",
+        "SQLITE_CACHE_SIZE": "-2000",
+        "SQLITE_WRITE_QUEUE": "false",
+    },
+    # WAL + pragmas, direct commits.
+    "wal": {
+        "SQLITE_WRITE_QUEUE": "false",
+    },
+    # WAL + pragmas + batching single-writer queue (the shipped defaults).
+    "tuned": {},
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_profile(readers: int, writers: int, seconds: float) -> dict:
+    """Run the workload in this process with whatever settings are in the env."""
+    sys.path.insert(0, str(ROOT))
+    from app.database import init_db, SessionLocal
+    from app.models import TrainingProgram
+    from app.repository import ProgramRepository, WorkoutHistoryRepository
+
+    init_db()
+    program = TrainingProgram(
+        goal="sprint",
+        fitness_level="beginner",
+        duration_weeks=4,
+        weeks=[],
+        notes="benchmark",
+    )
+    request_data = {
+        "goal": "sprint",
+        "fitness_level": "beginner",
+        "duration_weeks": 4,
+        "available_hours_per_week": 6,
+    }
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    results = {"read": [], "write": [], "read_errors": 0, "write_errors": 0, "locked": 0}
+
+    def record(kind, elapsed, error=None):
+        with lock:
+            if error is None:
+                results[kind].append(elapsed)
+            else:
+                results[f"{kind}_errors"] += 1
+                if "locked" in str(error):
+                    results["locked"] += 1
+
+    def reader():
+        while not stop.is_set():
+            db = SessionLocal()
+            start = time.perf_counter()
+            try:
+                ProgramRepository.list_programs(db, limit=20)
+                WorkoutHistoryRepository.get_workout_history(db, limit=20)
+                WorkoutHistoryRepository.get_workout_stats(db)
+                record("read", time.perf_counter() - start)
+            except Exception as exc:
+                record("read", 0, exc)
+            finally:
+                db.close()
+
+    def writer(index):
+        n = 0
+        while not stop.is_set():
+            db = SessionLocal()
+            start = time.perf_counter()
+            try:
+                if n % 4 == 0:
+                    ProgramRepository.save_program(db, program, request_data)
+                else:
+                    WorkoutHistoryRepository.log_workout(
+                        db, None, "run", f"w{index}-{n}", 45, 8.0, None, 3
+                    )
+                record("write", time.perf_counter() - start)
+            except Exception as exc:
+                db.rollback()
+                record("write", 0, exc)
+            finally:
+                db.close()
+            n += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    summary = {}
+    for kind in ("read", "write"):
+        latencies = results[kind]
+        summary[kind] = {
+            "ops_per_s": round(len(latencies) / seconds, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+            "errors": results[f"{kind}_errors"],
+        }
+    summary["locked_errors"] = results["locked"]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--profile", choices=sorted(PROFILES), action="append")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_profile(args.readers, args.writers, args.seconds)))
+        return
+
+    profiles = args.profile or list(PROFILES)
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds}s per profile")
+    print(f"{'profile':<10}{'reads/s':>10}{'r p50':>9}{'r p99':>9}"
+          f"{'writes/s':>10}{'w p50':>9}{'w p99':>9}{'locked':>8}")
+    for name in profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ)
+            env.update(PROFILES[name])
+            env["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'bench.db'}"
+            proc = subprocess.run(
+                [sys.executable, __file__, "--worker",
+                 "--readers", str(args.readers),
+                 "--writers", str(args.writers),
+                 "--seconds", str(args.seconds)],
+                env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+            )
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        r, w = result["read"], result["write"]
+        print(f"{name:<10}{r['ops_per_s']:>10}{r['p50_ms']:>9}{r['p99_ms']:>9}"
+              f"{w['ops_per_s']:>10}{w['p50_ms']:>9}{w['p99_ms']:>9}{result['locked_errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Stored size, encode time and decode time: JSON vs compact program storage.
+
+For each program length, compares
+  json          program_json text as stored today
+  json+zstd     the same text zstd-compressed (reference point)
+  compact       msgpack with interned strings + zstd (PROGRAM_STORAGE_FORMAT=compact)
+and then the on-disk size of a SQLite database holding --programs programs
+in each format.
+
+Synthetic programs repeat the same strings far more than LLM output does, so
+pass --recordings (a directory written by `python -m app.agent_replay export`)
+to measure real programs.
+
+Usage:
+    python benchmarks/bench_storage_format.py
+    python benchmarks/bench_storage_format.py --recordings recordings/ --programs 500
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import timeit
+from pathlib import Path
+
+from common import ROOT, synthetic_program_data
+
+from app.models import TrainingProgram, parse_program
+from app.storage import (
+    compact_available,
+    decode_compact,
+    decode_compact_json,
+    encode_compact,
+    serialize_program,
+)
+
+import zstandard
+
+WEEKS = (4, 12, 24, 52)
+
+
+def varied_program(weeks: int, seed: int) -> TrainingProgram:
+    """Synthetic program with some per-workout variation in strings and numbers."""
+    rng = random.Random(seed)
+    data = synthetic_program_data(weeks)
+    for week in data["weeks"]:
+        for workout in week["workouts"]:
+            workout["notes"] = rng.choice(
+                ["Keep cadence high", "Relaxed shoulders", "Negative split", "Fuel every 30 min"]
+            ) + f" ({rng.randint(1, 99)})"
+            for interval in workout["main_set"]:
+                interval["distance_km"] = round(interval["distance_km"] * rng.uniform(0.8, 1.2), 2)
+    return TrainingProgram(**data)
+
+
+def load_programs(args) -> dict:
+    if args.recordings:
+        programs = {}
+        for path in sorted(Path(args.recordings).glob("*.json")):
+            text = path.read_text(encoding="utf-8")
+            if '"weeks"' in text:
+                program = parse_program(text)
+                programs.setdefault(len(program.weeks), program)
+        return programs
+    return {weeks: varied_program(weeks, weeks) for weeks in WEEKS}
+
+
+def best_ms(func) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number * 1000
+
+
+def compare_codecs(programs: dict) -> None:
+    compressor = zstandard.ZstdCompressor(level=3)
+    print(f"{'weeks':>6}{'json B':>10}{'json+zstd B':>13}{'compact B':>11}{'ratio':>8}"
+          f"{'enc json':>11}{'enc compact':>13}{'dec text':>10}{'dec model':>11}{'json->model':>13}")
+    for weeks, program in sorted(programs.items()):
+        text = serialize_program(program).program_json
+        raw = text.encode("utf-8")
+        blob = encode_compact(program)
+        assert decode_compact_json(blob) == text
+        print(
+            f"{weeks:>6}{len(raw):>10,}{len(compressor.compress(raw)):>13,}{len(blob):>11,}"
+            f"{len(raw) / len(blob):>7.1f}x"
+            f"{best_ms(lambda: serialize_program(program)):>9.2f}ms"
+            f"{best_ms(lambda: (serialize_program(program), encode_compact(program))):>11.2f}ms"
+            f"{best_ms(lambda: decode_compact_json(blob)):>8.2f}ms"
+            f"{best_ms(lambda: decode_compact(blob)):>9.2f}ms"
+            f"{best_ms(lambda: parse_program(raw)):>11.2f}ms"
+        )
+    print("enc compact includes serialize_program (offsets/hash are always computed on the JSON);")
+    print("dec text = JSON for the response, dec model = TrainingProgram; JSON rows need no text decode.")
+
+
+def database_size(storage_format: str, programs: int, weeks: int) -> int:
+    """Fill a fresh SQLite database in a subprocess and return its file size."""
+    script = (
+        "import os, sys\n"
+        "sys.path.insert(0, 'benchmarks')\n"
+        "from bench_storage_format import varied_program\n"
+        "from app.database import SessionLocal, init_db, engine\n"
+        "from app.repository import ProgramRepository\n"
+        "init_db(); db = SessionLocal()\n"
+        f"for i in range({programs}):\n"
+        f"    ProgramRepository.save_program(db, varied_program({weeks}, i), "
+        f"{{'goal': 'olympic', 'fitness_level': 'beginner', 'duration_weeks': {weeks}, "
+        f"'available_hours_per_week': 8}})\n"
+        "db.close(); engine.dispose()\n"
+    )
+    path = Path(os.environ.get("TMPDIR", "/tmp")) / f"tri-storage-{storage_format}.db"
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{path}",
+        PROGRAM_STORAGE_FORMAT=storage_format,
+        SQLITE_JOURNAL_MODE="delete",
+        ANTHROPIC_API_KEY="benchmark-placeholder",
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, check=True)
+    size = path.stat().st_size
+    path.unlink()
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--recordings", help="directory of recorded programs")
+    parser.add_argument("--programs", type=int, default=200, help="programs per database")
+    parser.add_argument("--db-weeks", type=int, default=24, help="weeks per database program")
+    args = parser.parse_args()
+    if not compact_available():
+        sys.exit("Compact storage needs: pip install msgpack zstandard")
+
+    compare_codecs(load_programs(args))
+    print()
+    sizes = {fmt: database_size(fmt, args.programs, args.db_weeks) for fmt in ("json", "compact")}
+    print(f"SQLite file, {args.programs} x {args.db_weeks}-week programs: "
+          f"json {sizes['json'] / 1e6:.1f} MB, compact {sizes['compact'] / 1e6:.1f} MB "
+          f"({sizes['json'] / sizes['compact']:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Micro-benchmarks for parsing and validating TrainingProgram JSON.
+
+Compares, for programs of 4, 12, 24 and 52 weeks:
+  current     json.loads + TrainingProgram(**data)    (previous agent code)
+  json_bytes  TrainingProgram.model_validate_json(bytes)
+  adapter     prebuilt TypeAdapter(TrainingProgram).validate_json(bytes)
+  parse       app.models.parse_program(bytes)          (orjson + model_validate)
+plus json.loads alone and model_dump_json for reference.
+
+As a pytest-benchmark suite (requires `pip install pytest-benchmark`):
+    python -m pytest benchmarks/bench_validation.py --benchmark-group-by=param:raw
+
+As a script, printing the speedup of each path against `current`:
+    python benchmarks/bench_validation.py
+"""
+
+import json
+import timeit
+
+import pytest
+from pydantic import TypeAdapter
+
+from common import synthetic_program_data
+
+from app.models import TrainingProgram, parse_program
+
+if __name__ != "__main__":
+    # The pytest suite needs the `benchmark` fixture; skip cleanly without it.
+    pytest.importorskip("pytest_benchmark")
+
+WEEKS = (4, 12, 24, 52)
+PROGRAM_ADAPTER = TypeAdapter(TrainingProgram)
+
+
+def program_bytes(weeks: int) -> bytes:
+    data = synthetic_program_data(weeks)
+    # Mixed-case enum values exercise the case-insensitive lookups.
+    data["goal"] = data["goal"].upper()
+    for week in data["weeks"]:
+        week["workouts"][0]["sport"] = "Brick"
+    return json.dumps(data).encode()
+
+
+PATHS = {
+    "current": lambda raw: TrainingProgram(**json.loads(raw)),
+    "json_bytes": lambda raw: TrainingProgram.model_validate_json(raw),
+    "adapter": lambda raw: PROGRAM_ADAPTER.validate_json(raw),
+    "parse": lambda raw: parse_program(raw),
+}
+
+
+@pytest.fixture(params=WEEKS, ids=lambda weeks: f"{weeks}w")
+def raw(request):
+    return program_bytes(request.param)
+
+
+@pytest.mark.parametrize("path", list(PATHS))
+def test_validate(benchmark, raw, path):
+    program = benchmark(PATHS[path], raw)
+    assert program.goal.value == "full_ironman"
+
+
+def test_json_loads(benchmark, raw):
+    benchmark(json.loads, raw)
+
+
+def test_model_dump_json(benchmark, raw):
+    program = parse_program(raw)
+    benchmark(program.model_dump_json)
+
+
+def best_ms(func, *args, budget: float = 0.5) -> float:
+    timer = timeit.Timer(lambda: func(*args))
+    number, _ = timer.autorange()
+    number = max(1, int(number * budget / 0.2))
+    return min(timer.repeat(repeat=5, number=number)) / number * 1000
+
+
+def main():
+    columns = list(PATHS) + ["json.loads", "dump_json"]
+    print(f"{'weeks':>6}{'KB':>8}" + "".join(f"{name:>16}" for name in columns))
+    for weeks in WEEKS:
+        raw = program_bytes(weeks)
+        timings = {name: best_ms(path, raw) for name, path in PATHS.items()}
+        timings["json.loads"] = best_ms(json.loads, raw)
+        timings["dump_json"] = best_ms(parse_program(raw).model_dump_json)
+        baseline = timings["current"]
+        cells = []
+        for name in columns:
+            ms = timings[name]
+            speedup = f" {baseline / ms:.2f}x" if name in PATHS and name != "current" else ""
+            cells.append(f"{ms:.2f}ms{speedup}".rjust(16))
+        print(f"{weeks:>6}{len(raw) / 1024:>8.0f}" + "".join(cells))
+
+
+if __name__ == "__main__":
+    main()
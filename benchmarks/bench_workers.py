@@ -0,0 +1,142 @@
+"""
+Throughput against gunicorn worker count.
+
+For each worker count, starts gunicorn with gunicorn.conf.py on a seeded
+temporary SQLite database, drives a mix of read endpoints (program, week
+range, summary, history, stats) plus workout logging at a fixed concurrency,
+and reports requests/s and latency percentiles.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 2 4 --concurrency 64 --seconds 10
+    python benchmarks/bench_workers.py --preload --no-cache
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from common import ROOT, percentile, use_temp_database
+
+import httpx
+
+
+def seed(database_url: str, programs: int) -> list[int]:
+    """Create the schema and some 24-week programs in a fresh process."""
+    script = (
+        "import json, sys\n"
+        "sys.path.insert(0, 'benchmarks')\n"
+        "from common import request_data_for, synthetic_program_data\n"
+        "from app.database import SessionLocal, init_db\n"
+        "from app.models import TrainingProgram\n"
+        "from app.repository import ProgramRepository\n"
+        "init_db(); db = SessionLocal()\n"
+        "program = TrainingProgram(**synthetic_program_data(24))\n"
+        f"ids = [ProgramRepository.save_program(db, program, request_data_for(24)).id for _ in range({programs})]\n"
+        "print(json.dumps(ids))\n"
+    )
+    env = dict(os.environ, DATABASE_URL=database_url)
+    out = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, env=env, check=True,
+        capture_output=True, text=True,
+    ).stdout
+    import json
+    return json.loads(out.strip().splitlines()[-1])
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/api/stats")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("gunicorn did not become ready")
+
+
+async def drive(base_url: str, program_ids: list[int], concurrency: int, seconds: float):
+    paths = []
+    for pid in program_ids:
+        paths += [
+            f"/api/workouts/{pid}",
+            f"/api/workouts/{pid}/weeks?from=1&to=4",
+            f"/api/workouts/{pid}/summary",
+        ]
+    paths += ["/api/history?limit=20", "/api/stats"]
+
+    latencies: list[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        await wait_ready(client)
+        deadline = time.perf_counter() + seconds
+
+        async def user(index: int):
+            nonlocal errors
+            n = index
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                if n % 10 == 0:
+                    response = await client.post(
+                        "/api/history/log", params={"title": "bench", "duration_minutes": 30}
+                    )
+                else:
+                    response = await client.get(paths[n % len(paths)])
+                if response.status_code >= 400:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+                n += 1
+
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--preload", action="store_true", help="GUNICORN_PRELOAD=true")
+    parser.add_argument("--no-cache", action="store_true", help="disable the program cache")
+    args = parser.parse_args()
+
+    print(f"concurrency {args.concurrency}, {args.seconds}s per run, "
+          f"preload={args.preload}, cache={'off' if args.no_cache else 'on'}")
+    print(f"{'workers':>7}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for workers in args.workers:
+        database_url = use_temp_database()
+        program_ids = seed(database_url, 5)
+        env = dict(
+            os.environ,
+            DATABASE_URL=database_url,
+            PORT=str(args.port),
+            WEB_CONCURRENCY=str(workers),
+            GUNICORN_PRELOAD="true" if args.preload else "false",
+        )
+        if args.no_cache:
+            env["PROGRAM_CACHE_MAX_BYTES"] = "0"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn.conf.py",
+             "--access-logfile", "/dev/null", "--error-logfile", "/dev/null"],
+            cwd=ROOT, env=env,
+        )
+        try:
+            latencies, errors = asyncio.run(
+                drive(f"http://127.0.0.1:{args.port}", program_ids, args.concurrency, args.seconds)
+            )
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        print(f"{workers:>7}{len(latencies) / args.seconds:>10.1f}"
+              f"{percentile(latencies, 50) * 1000:>10.2f}"
+              f"{percentile(latencies, 95) * 1000:>10.2f}"
+              f"{percentile(latencies, 99) * 1000:>10.2f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
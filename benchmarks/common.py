@@ -0,0 +1,38 @@
+"""Shared helpers for the benchmark scripts."""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# Re-exported for the benchmark scripts; app.synthetic does not read settings.
+from app.synthetic import synthetic_program_data  # noqa: E402,F401
+
+
+def use_temp_database() -> str:
+    """Point DATABASE_URL at a fresh SQLite file (call before importing app)."""
+    path = Path(tempfile.mkdtemp(prefix="tri-bench-")) / "bench.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark-placeholder")
+    return os.environ["DATABASE_URL"]
+
+
+def request_data_for(weeks: int) -> dict:
+    return {
+        "goal": "full_ironman",
+        "fitness_level": "intermediate",
+        "duration_weeks": weeks,
+        "available_hours_per_week": 12,
+    }
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,33 @@
+"""Gunicorn configuration for single- and multi-worker deployments.
+
+    WEB_CONCURRENCY   number of worker processes (default 1)
+    GUNICORN_PRELOAD  "true" to import the app once in the master before forking
+    PORT              listen port (default 8000)
+
+Schema creation runs once in the master before any worker starts. Database
+pools, the SQLite write queue, the program cache and the LLM client are
+process-local and recreated in each worker after fork (see
+os.register_at_fork hooks in app.database, app.cache and app.main). The
+program cache is only shared between workers when PROGRAM_CACHE_URL points
+at a shared backend.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() in ("1", "true", "yes")
+
+# LLM calls can take several minutes.
+timeout = 600
+graceful_timeout = 30
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    """Create/migrate the schema once, in the master, before workers fork."""
+    from app.database import ensure_db
+
+    ensure_db()
@@ -0,0 +1,42 @@
+"""
+Convert saved programs between the JSON and compact storage formats.
+
+Rewrites every row of training_programs that is not yet in the target format
+(see PROGRAM_STORAGE_FORMAT in app/config.py), committing in batches, so it
+can be run on a live database and resumed after an interruption. Set
+PROGRAM_STORAGE_FORMAT to the same value so new programs are saved that way.
+
+    pip install msgpack zstandard
+    python migrate_program_storage.py --to compact
+    python migrate_program_storage.py --to json        # back to plain JSON
+"""
+
+import argparse
+
+from app.database import SessionLocal, init_db
+from app.repository import ProgramRepository
+from app.storage import FORMAT_COMPACT, FORMAT_JSON
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--to", choices=["compact", "json"], required=True)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        converted, before, after = ProgramRepository.convert_storage(
+            db,
+            FORMAT_COMPACT if args.to == "compact" else FORMAT_JSON,
+            batch_size=args.batch_size,
+        )
+    finally:
+        db.close()
+    ratio = f" ({before / after:.1f}x)" if after else ""
+    print(f"Converted {converted} programs: {before:,} -> {after:,} bytes{ratio}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,15 @@
 # Startup script for Azure App Services
 echo "Starting Triathlon Program Generator..."
 
-# Create database if it doesn't exist
-python -c "from app.database import init_db; init_db()"
-
 # Get PORT from Azure environment variable (defaults to 8000)
-PORT="${PORT:-8000}"
+export PORT="${PORT:-8000}"
 
-# Start the application with gunicorn
+# Start the application with gunicorn (see gunicorn.conf.py)
+# - The database schema is created once in the gunicorn master before forking
 # - Use a longer timeout for LLM calls
-# - Use a single worker to reduce memory pressure on smaller App Service plans
-gunicorn app.main:app --workers 1 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:$PORT --timeout 600 --access-logfile - --error-logfile -
+# - WEB_CONCURRENCY sets the worker count; it defaults to a single worker to
+#   reduce memory pressure on smaller App Service plans
+# - GUNICORN_PRELOAD=true imports the app once in the master (lower memory
+#   per worker, faster worker boot)
+export WEB_CONCURRENCY="${WEB_CONCURRENCY:-1}"
+gunicorn app.main:app -c gunicorn.conf.py
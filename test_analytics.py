@@ -0,0 +1,104 @@
+"""
+Checks for the NumPy compliance grouping of app/analytics.py on small
+hand-built planned/completed tables (no database or pyarrow needed):
+    python test_analytics.py
+"""
+
+import math
+
+from app.analytics import COMPLETED_COLUMNS, PLANNED_COLUMNS, _numpy_columns, compliance
+
+
+def _table(spec, rows):
+    """NumPy columns of ``spec`` that compliance reads, from dict rows."""
+    spec = [(name, kind) for name, kind in spec if kind not in ("date", "timestamp")]
+    columns = {name: [row.get(name) for row in rows] for name, _ in spec}
+    return _numpy_columns(columns, spec)
+
+
+def _planned(program_id, week_number, sport, minutes, km, intervals=1, month="2026-01"):
+    """The rows of one workout: one per interval, interval_index 0 first."""
+    return [
+        {"program_id": program_id, "week_number": week_number, "sport": sport, "month": month,
+         "workout_minutes": minutes, "workout_km": km, "interval_index": index,
+         "interval_minutes": minutes // intervals}
+        for index in range(intervals)
+    ]
+
+
+def _completed(program_id, week_number, sport, minutes, km, month="2026-01"):
+    return {"program_id": program_id, "week_number": week_number, "sport": sport,
+            "month": month, "duration_minutes": minutes, "distance_km": km}
+
+
+def _rows(result, by):
+    keys = zip(*(result[name].tolist() for name in by))
+    return {
+        key: (int(result["planned_workouts"][i]), int(result["completed_workouts"][i]),
+              float(result["planned_minutes"][i]), float(result["completed_minutes"][i]),
+              float(result["minutes_ratio"][i]))
+        for i, key in enumerate(keys)
+    }
+
+
+def test_compliance():
+    print("Checking compliance grouping")
+    print("=" * 50)
+
+    planned = _table(PLANNED_COLUMNS, [
+        *_planned(1, 1, "swim", 60, 2.0, intervals=3),
+        *_planned(1, 1, "run", 30, 5.0),
+        *_planned(1, 2, "run", 40, 7.0, intervals=2),
+        *_planned(2, 1, "bike", 90, 30.0, month="2026-02"),
+    ])
+    completed = _table(COMPLETED_COLUMNS, [
+        _completed(1, 1, "swim", 45, 1.5),
+        _completed(1, 1, "run", 30, 5.0),
+        _completed(1, 1, "run", 20, None),
+        _completed(1, 2, "bike", 60, 20.0),  # nothing planned
+        _completed(None, None, "run", 50, 8.0),  # not logged against a program
+        _completed(1, None, "run", 50, 8.0),  # before the program started
+    ])
+
+    by = ("program_id", "week_number", "sport")
+    rows = _rows(compliance(planned, completed, by), by)
+    assert set(rows) == {
+        (1, 1, "run"), (1, 1, "swim"), (1, 2, "bike"), (1, 2, "run"), (2, 1, "bike")
+    }
+    assert rows[(1, 1, "swim")] == (1, 1, 60.0, 45.0, 0.75)
+    assert rows[(1, 1, "run")] == (1, 2, 30.0, 50.0, 50.0 / 30.0)
+    assert rows[(1, 2, "run")] == (1, 0, 40.0, 0.0, 0.0)
+    assert rows[(2, 1, "bike")] == (1, 0, 90.0, 0.0, 0.0)
+    assert rows[(1, 2, "bike")][:4] == (0, 1, 0.0, 60.0)
+    assert math.isnan(rows[(1, 2, "bike")][4])
+    print("✅ One planned row per workout; unplanned groups have a NaN ratio")
+    print("✅ Completed workouts outside any program week are ignored")
+
+    result = compliance(planned, completed, ("sport",))
+    rows = _rows(result, ("sport",))
+    assert rows[("run",)][:4] == (2, 2, 70.0, 50.0)
+    assert rows[("bike",)][:4] == (1, 1, 90.0, 60.0)
+    assert list(result["sport"]) == sorted(result["sport"])
+    km = dict(zip(result["sport"], result["completed_km"]))
+    assert km["run"] == 5.0  # a missing distance counts as 0
+    print("✅ Coarser groups add up; missing distances count as 0")
+
+    rows = _rows(compliance(planned, completed, ("month",)), ("month",))
+    assert rows[("2026-02",)][:2] == (1, 0)
+    print("✅ Grouping by month")
+
+    empty = compliance(_table(PLANNED_COLUMNS, []), _table(COMPLETED_COLUMNS, []), by)
+    assert all(len(empty[name]) == 0 for name in empty)
+    print("✅ Empty tables give empty columns")
+
+    for bad in ((), ("goal",)):
+        try:
+            compliance(planned, completed, bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"by={bad} should be rejected")
+    print("✅ Unknown or empty group columns are rejected")
+
+
+if __name__ == "__main__":
+    test_compliance()
@@ -0,0 +1,62 @@
+"""
+Import-time budget for app.main (cold start on App Service).
+
+Profiles `python -X importtime -c "import app.main"` in a fresh interpreter and
+checks that:
+- the whole import stays under IMPORT_BUDGET_MS (default 2500 ms),
+- no provider SDK (anthropic, openai, azure.identity) is imported,
+- importing does not touch the database (init_db is deferred to warm-up).
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "2500"))
+DEFERRED_MODULES = ("anthropic", "openai", "azure.identity")
+
+
+def profile_import(module: str = "app.main"):
+    """Return ({module: cumulative_us}, database_path) for a fresh import."""
+    db_path = Path(tempfile.mkdtemp()) / "import-check.db"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if cum.isdigit():
+            cumulative[name] = int(cum)
+    return cumulative, db_path
+
+
+def test_import_time():
+    print("Checking app.main import-time budget")
+    print("=" * 50)
+
+    cumulative, db_path = profile_import()
+    total_ms = cumulative["app.main"] / 1000
+    print(f"app.main import: {total_ms:.0f} ms (budget {BUDGET_MS:.0f} ms)")
+    for name, us in sorted(cumulative.items(), key=lambda kv: -kv[1])[1:6]:
+        print(f"  {name:<40}{us / 1000:>8.0f} ms")
+
+    eager = [name for name in DEFERRED_MODULES if name in cumulative]
+    assert not eager, f"Provider SDKs imported eagerly: {eager}"
+    print("✅ Provider SDKs are imported lazily")
+
+    assert not db_path.exists(), "Importing app.main created/opened the database"
+    print("✅ Database initialization is deferred")
+
+    assert total_ms <= BUDGET_MS, f"app.main import took {total_ms:.0f} ms > {BUDGET_MS:.0f} ms"
+    print("✅ Import time within budget")
+
+
+if __name__ == "__main__":
+    test_import_time()
@@ -0,0 +1,44 @@
+"""
+Checks for validate_program and repair_program of app/plan_validation.py on
+a synthetic program (no database or provider needed):
+    python test_plan_validation.py
+"""
+
+from app.config import settings
+from app.models import TrainingProgram
+from app.plan_validation import repair_program, validate_program
+from app.synthetic import synthetic_program_data
+
+
+def test_repair_program():
+    print("Checking repair_program")
+    print("=" * 50)
+
+    program = TrainingProgram.model_validate(synthetic_program_data(8))
+    assert validate_program(program) == [], "synthetic program should pass the rules"
+
+    broken = program.model_copy(deep=True)
+    extra = broken.weeks[1].workouts[0].model_copy(deep=True)
+    broken.weeks[1].workouts.append(extra)  # 7 workouts: no rest day
+    for workout in broken.weeks[3].workouts:  # +100% volume
+        workout.total_duration_minutes *= 2
+    broken.weeks[5].workouts[0].main_set[0].duration_minutes = 500  # intervals > workout
+    broken.weeks[6].weekly_volume_hours = 20.0  # stated hours disagree
+
+    rules = {violation.rule for violation in validate_program(broken)}
+    assert rules == {
+        "missing_rest_day", "volume_jump", "interval_overflow", "weekly_volume_mismatch"
+    }, rules
+    print(f"✅ Broken program violates {sorted(rules)}")
+
+    repaired = repair_program(broken)
+    assert validate_program(repaired) == [], validate_program(repaired)
+    assert len(repaired.weeks[1].workouts) == settings.plan_max_workouts_per_week
+    print("✅ Repaired program passes every rule")
+
+    assert len(broken.weeks[1].workouts) == 7 and broken.weeks[6].weekly_volume_hours == 20.0
+    print("✅ The input program is left unchanged")
+
+
+if __name__ == "__main__":
+    test_repair_program()
@@ -0,0 +1,36 @@
+"""
+Checks for plan_chunks of app/progressive.py, which splits a program into
+the chunks generated per call (no database or provider needed):
+    python test_progressive.py
+"""
+
+from app.periodization import phase_for_week
+from app.progressive import plan_chunks
+
+
+def test_plan_chunks():
+    print("Checking plan_chunks")
+    print("=" * 50)
+
+    for total_weeks in (4, 5, 12, 24, 52):
+        for chunk_weeks in (1, 3, 4, 6):
+            phases = plan_chunks(total_weeks, chunk_weeks)
+            chunks = [chunk for phase in phases for chunk in phase]
+            weeks = [w for chunk in chunks for w in range(chunk.first_week, chunk.last_week + 1)]
+            assert weeks == list(range(1, total_weeks + 1)), (total_weeks, chunk_weeks, weeks)
+            for phase in phases:
+                sizes = [chunk.weeks for chunk in phase]
+                assert max(sizes) <= chunk_weeks and max(sizes) - min(sizes) <= 1, sizes
+                assert sum(sizes) == phase[0].phase_weeks
+                for chunk in phase:
+                    assert chunk.phase == phase[0].phase
+                    assert phase_for_week(chunk.first_week, total_weeks) == chunk.phase
+                    assert phase_for_week(chunk.last_week, total_weeks) == chunk.phase
+    print("✅ Chunks cover every week once, stay within a phase and split it evenly")
+
+    assert all(len(phase) == 1 for phase in plan_chunks(52, 52))
+    print("✅ A phase no longer than chunk_weeks is one chunk")
+
+
+if __name__ == "__main__":
+    test_plan_chunks()
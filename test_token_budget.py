@@ -0,0 +1,50 @@
+"""
+Checks for the TokenModel of app/token_budget.py, which predicts the output
+tokens of a generation (no database or provider needed):
+    python test_token_budget.py
+"""
+
+from app.token_budget import MIN_OUTPUT_TOKENS, PRIOR, ROUND_TO, TokenModel
+
+
+def test_token_model():
+    print("Checking TokenModel")
+    print("=" * 50)
+
+    model = TokenModel(decay=1.0)
+    assert abs(model.predict(1, 4, 24) - (PRIOR[0] + 4 * PRIOR[1] + 24 * PRIOR[2])) < 1e-6
+    print("✅ Predictions start from the prior")
+
+    budget = model.budget(1, 4, 24)
+    assert budget % ROUND_TO == 0 and budget >= model.predict(1, 4, 24) * (1 + model.margin)
+    assert model.budget(0, 0, 1) == MIN_OUTPUT_TOKENS
+    print(f"✅ Budgets are rounded up to {ROUND_TO} with margin {model.margin:.2f}, "
+          f"at least {MIN_OUTPUT_TOKENS}")
+
+    true = (300.0, 40.0, 110.0)
+    sizes = [(programs, weeks, weeks * per_week)
+             for programs in (0, 1) for weeks in (1, 2, 4, 8, 12) for per_week in (5, 6)]
+    for _ in range(20):
+        for programs, weeks, workouts in sizes:
+            model.observe(programs, weeks, workouts, round(
+                true[0] * programs + true[1] * weeks + true[2] * workouts
+            ))
+    for programs, weeks, workouts in sizes:
+        expected = true[0] * programs + true[1] * weeks + true[2] * workouts
+        assert abs(model.predict(programs, weeks, workouts) / expected - 1) < 0.05
+    assert model.observations == 20 * len(sizes)
+    print(f"✅ Fitted to observed usage: {model.state()}")
+
+    margin = model.margin
+    model.observe(1, 12, 72, 8192, truncated=True)
+    assert model.truncations == 1 and model.margin == margin
+    print("✅ Truncated responses are fitted but do not widen the margin")
+
+    model.observe(0, 0, 0, 500)
+    model.observe(1, 4, 24, 0)
+    assert model.observations == 20 * len(sizes) + 1
+    print("✅ Empty responses are ignored")
+
+
+if __name__ == "__main__":
+    test_token_model()